@@ -0,0 +1,93 @@
+"""Асинхронные обёртки горячих эндпоинтов чтения для ASGI.
+
+В Django 3.2 нет асинхронного ORM, а DRF не умеет async-представления,
+поэтому обёртка выполняет тот же синхронный view целиком —
+аутентификацию, права, фильтры, кеш ответа и рендеринг — в пуле из
+ASYNC_VIEW_THREADS потоков. Пока поток ждёт базу, цикл событий ASGI
+воркера принимает следующие запросы. Под WSGI обёртки не используются:
+там async-view стоил бы лишнего цикла событий на каждый запрос.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+from django.utils.decorators import sync_and_async_middleware
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(settings.ASYNC_VIEW_THREADS,
+                              thread_name_prefix='async-view')
+
+
+def render_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if callable(getattr(response, 'render', None)):
+        response.render()
+    return response
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет view и рендерит ответ в потоке пула.
+
+    Соединение с базой у каждого потока своё, поэтому оно открывается
+    и закрывается здесь, как request_started и request_finished делают
+    это для потока запроса.
+    """
+    close_old_connections()
+    try:
+        return render_view(view, request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Async-обёртка view.
+
+    При ASYNC_VIEW_THREADS = 0 view выполняется в общем синхронном потоке
+    Django, как обычный синхронный view под ASGI.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not settings.ASYNC_VIEW_THREADS:
+            return await sync_to_async(render_view, thread_sensitive=True)(
+                view, request, *args, **kwargs)
+        return await sync_to_async(
+            run_view, thread_sensitive=False, executor=get_executor()
+        )(view, request, *args, **kwargs)
+    return wrapper
+
+
+def async_patterns(patterns, names):
+    """Копия маршрутов, где view с именами из names асинхронные."""
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern,
+                async_patterns(pattern.url_patterns, names),
+                pattern.default_kwargs, pattern.app_name, pattern.namespace)
+        elif pattern.name in names:
+            pattern = URLPattern(pattern.pattern, async_view(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        result.append(pattern)
+    return result
+
+
+@sync_and_async_middleware
+def asgi_urlconf_middleware(get_response):
+    """Направляет запросы через ASGI в маршруты ASGI_URLCONF.
+
+    В синхронной цепочке (WSGI) ничего не добавляет.
+    """
+    if not asyncio.iscoroutinefunction(get_response):
+        return get_response
+
+    async def middleware(request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await get_response(request)
+    return middleware
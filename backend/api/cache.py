@@ -0,0 +1,124 @@
+"""Кеш ответов списка и карточки рецепта.
+
+Два уровня: LRU в памяти процесса и общий кеш Django. Запись хранит
+данные ответа, ETag, Last-Modified и версии (recipes.versions), от
+которых ответ зависит. При чтении версии сверяются одним get_many к
+общему кешу, поэтому изменение рецепта, его автора или тега сразу
+делает устаревшими ровно те записи, где они есть. Версии страницы
+читаются до её сборки, версии рецептов и авторов — после, так что
+окно гонки ограничено RESPONSE_CACHE_TIMEOUT. На кеше одного процесса
+(locmem) версии не доходят до других воркеров, поэтому там кеш ответов
+включается только явно настройкой RESPONSE_CACHE_LOCAL.
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import RESPONSE_CACHE_LRU_SIZE, RESPONSE_CACHE_TIMEOUT
+from recipes.shortlinks import LRUCache
+from recipes.versions import current, shared_cache
+
+CACHE_PREFIX = 'recipe-response:'
+STATS_PREFIX = 'recipe-response-stats:'
+# Параметры, от которых зависит ответ; с любыми другими кеш не используется.
+CACHED_PARAMS = ('author', 'cursor', 'limit', 'page', 'search', 'tags')
+# Фильтры, которые для анонимного пользователя ничего не меняют.
+IGNORED_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+TIERS = ('local', 'shared', 'miss')
+
+
+def cache_key(request, *parts):
+    """Ключ по хосту, частям пути и нормализованной строке запроса."""
+    params = request.query_params
+    if set(params) - set(CACHED_PARAMS) - set(IGNORED_PARAMS):
+        return None
+    query = urlencode([(name, value) for name in CACHED_PARAMS
+                       for value in sorted(set(params.getlist(name)))])
+    digest = hashlib.blake2b('\n'.join(
+        (request.scheme, request.get_host(), *map(str, parts), query)
+    ).encode(), digest_size=16).hexdigest()
+    return CACHE_PREFIX + digest
+
+
+class ResponseStats:
+    """Счётчики попаданий процесса и общие счётчики в кеше Django."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(TIERS, 0)
+
+    def record(self, tier):
+        with self.lock:
+            self.counts[tier] += 1
+        try:
+            cache.incr(STATS_PREFIX + tier)
+        except ValueError:
+            cache.add(STATS_PREFIX + tier, 0, None)
+            cache.incr(STATS_PREFIX + tier)
+
+    @staticmethod
+    def ratios(counts):
+        total = sum(counts.values())
+        return {tier: counts[tier] / total if total else 0.0
+                for tier in TIERS}
+
+    def shared(self):
+        found = cache.get_many([STATS_PREFIX + tier for tier in TIERS])
+        return {tier: found.get(STATS_PREFIX + tier, 0) for tier in TIERS}
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(TIERS, 0)
+        cache.delete_many([STATS_PREFIX + tier for tier in TIERS])
+
+
+class ResponseCache:
+
+    def __init__(self, size):
+        self.local = LRUCache(size)
+        self.stats = ResponseStats()
+
+    @staticmethod
+    def enabled():
+        return settings.RESPONSE_CACHE_LOCAL or shared_cache()
+
+    def get(self, key):
+        """Возвращает (запись или None, уровень попадания)."""
+        tier, entry = 'local', self.local.get(key)
+        if entry is None:
+            tier, entry = 'shared', cache.get(key)
+        if self.fresh(entry):
+            if tier == 'shared':
+                self.local.set(key, entry)
+        else:
+            if entry is not None:
+                self.local.discard(key)
+            tier, entry = 'miss', None
+        self.stats.record(tier)
+        return entry, tier
+
+    @staticmethod
+    def fresh(entry):
+        return (entry is not None and entry['expires'] > time.time()
+                and current(entry['versions']) == entry['versions'])
+
+    def set(self, key, entry):
+        """Сохраняет после коммита: откат не должен попасть в кеш.
+
+        В LRU запись попадает при первом чтении из общего кеша уже
+        без ссылок на сериализатор и объекты модели.
+        """
+        entry['expires'] = time.time() + RESPONSE_CACHE_TIMEOUT
+        transaction.on_commit(
+            lambda: cache.set(key, entry, RESPONSE_CACHE_TIMEOUT))
+
+    def clear(self):
+        self.local.clear()
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_LRU_SIZE)
@@ -2,3 +2,15 @@ PAGE_SIZE = 6
 INGREDIENT_QUANITY = 0
 COOKING_QUANITY = 0
 COOK_TIME = 1
+PDF_LEFT_MARGIN = 100
+PDF_TOP_MARGIN = 42
+PDF_BOTTOM_MARGIN = 50
+PDF_LINE_HEIGHT = 20
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+RECIPES_LIMIT_MAX = 100
+BULK_RECIPES_MAX = 100
+PANTRY_INGREDIENTS_MAX = 100
+SIMILAR_RECIPES_LIMIT = 10
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+RESPONSE_CACHE_LRU_SIZE = 1024
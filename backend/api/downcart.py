@@ -1,33 +1,91 @@
+import csv
 from io import BytesIO
 
-from django.http import FileResponse
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 
-from recipes.models import RecipeIngredient
+from .constants import (PDF_BOTTOM_MARGIN, PDF_LINE_HEIGHT, PDF_LEFT_MARGIN,
+                        PDF_TOP_MARGIN)
+from recipes.models import ShoppingListItem
 
+EXPORT_FORMATS = ('pdf', 'txt', 'csv')
+FILENAME = 'shopping_cart'
 
-def create_pdf(user):
-    data_list = RecipeIngredient.objects.filter(recipe__author=user).values(
-        'ingredient__name', 'ingredient__measurement_unit', 'amount'
-    )
 
+def get_shopping_list(user):
+    """Читает готовый список покупок пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'total_amount',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).order_by('name', 'measurement_unit')
+
+
+def create_pdf(ingredients):
     buffer = BytesIO()
     p = canvas.Canvas(buffer, pagesize=letter)
-    p.drawString(100, 750, "Shopping Cart Ingredients:")
-
-    y = 730
-    for recipe_ingredient in data_list:
-        ingredient_name = recipe_ingredient['ingredient__name']
-        measurement_unit = recipe_ingredient['ingredient__measurement_unit']
-        amount = str(recipe_ingredient['amount'])
-        p.drawString(100, y, f"{ingredient_name}: {amount} {measurement_unit}")
-        y -= 20
+    _, height = letter
+    y = height - PDF_TOP_MARGIN
+    p.drawString(PDF_LEFT_MARGIN, y, 'Shopping Cart Ingredients:')
+    y -= PDF_LINE_HEIGHT
+    for ingredient in ingredients:
+        if y < PDF_BOTTOM_MARGIN:
+            p.showPage()
+            y = height - PDF_TOP_MARGIN
+        p.drawString(
+            PDF_LEFT_MARGIN, y,
+            f'{ingredient["name"]}: {ingredient["total_amount"]} '
+            f'{ingredient["measurement_unit"]}'
+        )
+        y -= PDF_LINE_HEIGHT
 
     p.save()
     buffer.seek(0)
     return FileResponse(
         buffer,
         as_attachment=True,
-        filename='shopping_cart.pdf'
+        filename=f'{FILENAME}.pdf'
     )
+
+
+def iter_txt(ingredients):
+    for ingredient in ingredients:
+        yield (f'{ingredient["name"]} ({ingredient["measurement_unit"]}) '
+               f'— {ingredient["total_amount"]}\n')
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((ingredient['name'],
+                               ingredient['measurement_unit'],
+                               ingredient['total_amount']))
+
+
+def streaming_response(rows, file_format, content_type):
+    response = StreamingHttpResponse(
+        rows, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{FILENAME}.{file_format}"')
+    return response
+
+
+def create_shopping_list(user, file_format='pdf'):
+    ingredients = get_shopping_list(user)
+    if file_format == 'txt':
+        return streaming_response(
+            iter_txt(ingredients.iterator()), file_format, 'text/plain')
+    if file_format == 'csv':
+        return streaming_response(
+            iter_csv(ingredients.iterator()), file_format, 'text/csv')
+    return create_pdf(ingredients.iterator())
@@ -1,22 +1,31 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search
+from recipes.trending import TRENDING_ORDERING
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
     )
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('trending', 'В тренде'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_favorited',
-                  'is_in_shopping_cart',)
+                  'is_in_shopping_cart', 'search', 'ordering',)
 
     def filter_is_favorited(self, queryset, name, value):
         return queryset.filter(
@@ -28,6 +37,12 @@ class RecipeFilter(FilterSet):
             shopping_carts__user=self.request.user
         ) if value and self.request.user.is_authenticated else queryset
 
+    def filter_search(self, queryset, name, value):
+        return search(queryset, value) if value.strip() else queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*TRENDING_ORDERING)
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='startswith')
@@ -1,7 +1,165 @@
+import hashlib
+
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework import mixins, viewsets
+from rest_framework.response import Response
+
+from .cache import cache_key, response_cache
+from .pagination import KeysetPagination, select_paginator
+from recipes.autocomplete import ingredient_index
+from recipes.models import Tag
+from recipes.versions import current
 
 
 class ListRetrieveModelMixin(viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.RetrieveModelMixin):
     pass
+
+
+class KeysetOptInMixin:
+    """По параметру cursor заменяет pagination_class на курсорный."""
+
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = select_paginator(
+                self.request, self.pagination_class,
+                self.keyset_pagination_class)
+        return self._paginator
+
+
+def make_etag(parts):
+    return quote_etag(hashlib.blake2b(
+        repr(parts).encode(), digest_size=16).hexdigest())
+
+
+def tags_version():
+    return tuple(Tag.objects.order_by('id').values_list('id', 'name', 'slug'))
+
+
+def ingredients_version():
+    return ingredient_index.get().digest
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 по ETag и Last-Modified, не сериализуя данные.
+
+    Наследник описывает версию данных в get_validators: значения,
+    из которых строится ETag, и время последнего изменения. ETag тех же
+    данных для разных пользователей различает personal_etag.
+    """
+
+    vary_headers = ()
+    data_etag = None
+
+    def get_validators(self):
+        """Возвращает (части ETag или None, datetime или None)."""
+        raise NotImplementedError
+
+    def personal_etag(self, etag):
+        """ETag ответа текущему пользователю по ETag данных."""
+        return etag
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        parts, last_modified = self.get_validators()
+        if parts is None:
+            return handler(request, *args, **kwargs)
+        self.data_etag = make_etag(parts)
+        etag = self.personal_etag(self.data_etag)
+        timestamp = (int(last_modified.timestamp())
+                     if last_modified else None)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, self.vary_headers)
+        return response
+
+
+class ResponseCacheMixin:
+    """Отдаёт list и retrieve из response_cache.
+
+    Наследник решает, какие запросы кешировать (response_cache_key),
+    и описывает версии: известные до сборки ответа (response_versions)
+    и версии данных, попавших в ответ (response_dependencies). В кеш
+    попадает ответ без данных пользователя (shared_payload), их
+    подставляет в копию overlay. Ставится перед ConditionalGetMixin,
+    чтобы попадание отвечало 304 без запросов к базе.
+    """
+
+    vary_headers = ()
+    shared_payload = False
+    data_etag = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def response_cache_key(self, request):
+        return cache_key(request, self.action)
+
+    def response_versions(self):
+        return []
+
+    def response_dependencies(self, data):
+        return []
+
+    def overlay(self, data):
+        """Данные ответа для текущего пользователя, не меняя data."""
+        return data
+
+    def cached(self, handler, request, *args, **kwargs):
+        key = (self.response_cache_key(request) if response_cache.enabled()
+               else None)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        entry, tier = response_cache.get(key)
+        if entry is None:
+            versions = current(self.response_versions())
+            self.shared_payload = True
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                versions.update(current(
+                    self.response_dependencies(response.data)))
+                response_cache.set(key, {
+                    'data': response.data,
+                    'etag': self.data_etag,
+                    'last_modified': response.get('Last-Modified'),
+                    'versions': versions,
+                })
+                response.data = self.overlay(response.data)
+        else:
+            response = self.cached_response(request, entry)
+        response['X-Cache'] = tier
+        return response
+
+    def cached_response(self, request, entry):
+        etag = entry['etag'] and self.personal_etag(entry['etag'])
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=parse_http_date_safe(entry['last_modified']))
+        if response is None:
+            response = Response(self.overlay(entry['data']))
+        if etag:
+            response['ETag'] = etag
+        if entry['last_modified']:
+            response['Last-Modified'] = entry['last_modified']
+        patch_vary_headers(response, self.vary_headers)
+        return response
@@ -1,8 +1,181 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from .constants import PAGE_SIZE
+from recipes.models import TimelineEntry
+from recipes.trending import TRENDING_ORDERING
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору без COUNT и OFFSET.
+
+    Курсор кодирует значения полей ordering у крайнего объекта страницы,
+    следующая страница выбирается условием по составному ключу, поэтому
+    время ответа не зависит от глубины. Последнее поле ordering должно
+    быть уникальным.
+    """
+
+    ordering = ('-pub_date', 'id')
+    cursor_query_param = 'cursor'
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return size if size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return False, None
+        try:
+            reverse, values = json.loads(
+                base64.urlsafe_b64decode(token.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return bool(reverse), [
+                self.field(name).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        token = base64.urlsafe_b64encode(json.dumps(
+            [int(reverse), position], default=str).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, token)
+
+    def position_of(self, instance):
+        return [getattr(instance, self.field(name).attname)
+                for name in self.ordering]
+
+    def field(self, name):
+        return self.model._meta.get_field(name.lstrip('-'))
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(name[1:] if name.startswith('-') else f'-{name}'
+                     for name in self.ordering)
+
+    def after(self, ordering, position):
+        """Условие «строго после position» для составного ключа.
+
+        Нестрогая граница по первому полю даёт базе начать просмотр
+        индекса с нужного места, а не с начала.
+        """
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return condition & Q(**{f'{first.lstrip("-")}__{bound}': position[0]})
+
+    def window(self, queryset, request):
+        """Запрос строк страницы и одной лишней для признака продолжения."""
+        self.model = queryset.model
+        self.reverse, self.position = self.decode_cursor(request)
+        ordering = self.get_ordering(self.reverse)
+        if self.position is not None:
+            queryset = queryset.filter(self.after(ordering, self.position))
+        return queryset.order_by(*ordering)[:self.get_page_size(request) + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        return self.cut(list(self.window(queryset, request)),
+                        self.get_page_size(request), self.position_of)
+
+    def cut(self, rows, size, position_of):
+        """Обрезает выборку до страницы и строит ссылки next/previous."""
+        reverse, position = self.reverse, self.position
+        has_more = len(rows) > size
+        page = rows[:size]
+        if reverse:
+            page.reverse()
+        self.next = self.previous = None
+        if page and (has_more if not reverse else position is not None):
+            self.next = self.encode_cursor(position_of(page[-1]), False)
+        if page and (has_more if reverse else position is not None):
+            self.previous = self.encode_cursor(position_of(page[0]), True)
+        if not page and position is not None:
+            self.previous = remove_query_param(
+                self.base_url, self.cursor_query_param)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('next', self.next),
+            ('previous', self.previous),
+            ('results', data),
+        )))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('following_id', 'id')
+
+
+class TrendingKeysetPagination(KeysetPagination):
+    ordering = TRENDING_ORDERING
+
+
+class FeedPagination(KeysetPagination):
+    """Курсор по нескольким выборкам с полями pub_date и recipe_id.
+
+    Из каждой выборки берётся страница после курсора, результаты
+    сливаются в общий порядок. Возвращает пары (pub_date, recipe_id).
+    """
+
+    ordering = ('-pub_date', 'recipe_id')
+
+    def field(self, name):
+        return TimelineEntry._meta.get_field(name.lstrip('-'))
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        rows = set()
+        for queryset in sources:
+            rows.update(self.window(queryset, request).values_list(
+                'pub_date', 'recipe_id'))
+        rows = sorted(rows, key=lambda row: (row[0], -row[1]),
+                      reverse=not self.reverse)
+        return self.cut(rows, size, list)
+
+
+def select_paginator(request, default_class, keyset_class):
+    """Курсорный режим включается параметром cursor, даже пустым."""
+    if keyset_class.cursor_query_param in request.query_params:
+        return keyset_class()
+    return default_class()
@@ -5,24 +5,103 @@ from djoser.serializers import UserSerializer
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework import serializers
 
-from .constants import COOK_TIME, COOKING_QUANITY, INGREDIENT_QUANITY
+from .constants import (BULK_RECIPES_MAX, COOK_TIME, COOKING_QUANITY,
+                        INGREDIENT_QUANITY, PANTRY_INGREDIENTS_MAX,
+                        RECIPES_LIMIT_MAX)
 from recipes.models import (
     Favorite,
     Ingredient,
+    PantryChange,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
+    TimelineEntry,
 )
+from recipes.images import variant_urls
 from users.models import Subscribe
 
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    """Проверяет recipes_limit и ограничивает его RECIPES_LIMIT_MAX."""
+    value = request.query_params.get('recipes_limit')
+    if value is None:
+        return RECIPES_LIMIT_MAX
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Укажите целое неотрицательное число'})
+    return min(limit, RECIPES_LIMIT_MAX)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URL уменьшенных копий из поля *_variants модели."""
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
+def file_url(file, request):
+    """То же, что FileField.to_representation с use_url."""
+    if not file:
+        return None
+    url = file.url
+    return request.build_absolute_uri(url) if request else url
+
+
+def user_representation(user, request, is_subscribed):
+    """Поля ProfileUserSerializer без обхода полей DRF."""
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': is_subscribed,
+        'avatar': file_url(user.avatar, request),
+        'avatar_variants': variant_urls(user.avatar_variants, request),
+        'recipes_count': user.recipes_count,
+        'followers_count': user.followers_count,
+        'following_count': user.following_count,
+    }
+
+
+class BulkPrimaryKeyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, проверяемый одним запросом id__in."""
+
+    def __init__(self, queryset, **kwargs):
+        super().__init__(
+            child_relation=PrimaryKeyRelatedField(queryset=queryset),
+            **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        try:
+            ids = [int(pk) for pk in data]
+        except (TypeError, ValueError):
+            child.fail('incorrect_type', data_type=type(data).__name__)
+        objects = child.get_queryset().in_bulk(ids)
+        for pk in ids:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in ids]
+
+
 class ProfileUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField()
+    avatar_variants = ImageVariantsField()
 
     class Meta:
         model = User
@@ -34,6 +113,15 @@ class ProfileUserSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
+            'recipes_count',
+            'followers_count',
+            'following_count',
+        )
+        read_only_fields = (
+            'recipes_count',
+            'followers_count',
+            'following_count',
         )
         extra_kwargs = {
             'first_name': {'required': True},
@@ -43,6 +131,8 @@ class ProfileUserSerializer(UserSerializer):
         }
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return user.is_authenticated and obj.following.filter(
             follower=user).exists()
@@ -59,7 +149,7 @@ class ProfileUserSerializer(UserSerializer):
 class AvatarSerializer(ProfileUserSerializer):
     class Meta:
         model = User
-        fields = ('avatar',)
+        fields = ('avatar', 'avatar_variants')
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -67,6 +157,13 @@ class SubscribeSerializer(serializers.ModelSerializer):
         model = Subscribe
         fields = ('follower', 'following')
 
+    @transaction.atomic
+    def create(self, validated_data):
+        subscription = super().create(validated_data)
+        TimelineEntry.objects.backfill(subscription.follower_id,
+                                       subscription.following)
+        return subscription
+
     def validate(self, data):
         follower = data['follower']
         following = data['following']
@@ -81,33 +178,36 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
+        instance.following.is_subscribed = True
         return SubscriberSerializer(
             instance.following, context=self.context
         ).data
 
 
 class SubscriberSerializer(ProfileUserSerializer):
-    recipes_count = serializers.SerializerMethodField('get_recipes_count')
     recipes = serializers.SerializerMethodField('get_recipes')
 
     class Meta(ProfileUserSerializer.Meta):
         fields = ProfileUserSerializer.Meta.fields + (
             'recipes',
-            'recipes_count'
         )
 
+    def to_representation(self, instance):
+        data = user_representation(instance, self.context.get('request'),
+                                   self.get_is_subscribed(instance))
+        data['recipes'] = self.get_recipes(instance)
+        return data
+
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-        return RecipeDetailSerializer(recipes,
+        # Для списка подписок рецепты всех авторов страницы загружает
+        # представление одним запросом и передаёт в context['recipes'].
+        recipes = self.context.get('recipes')
+        if recipes is None:
+            recipes = Recipe.objects.top_by_author(
+                [obj.id], get_recipes_limit(self.context['request']))
+        return RecipeDetailSerializer(recipes.get(obj.id, []),
                                       context=self.context, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_avatar(self, obj):
         if obj.following.avatar:
             return obj.following.avatar.url
@@ -133,6 +233,16 @@ class IngredientSerializer(serializers.ModelSerializer):
             'measurement_unit'
         )
 
+    def to_representation(self, instance):
+        # Список ингредиентов читается через .values(Meta.fields).
+        if isinstance(instance, dict):
+            return instance
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'measurement_unit': instance.measurement_unit,
+        }
+
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = PrimaryKeyRelatedField(
@@ -167,6 +277,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True
     )
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     ingredients = RecipeIngredientSerializer(
         source='recipe_ingredients',
         many=True
@@ -179,15 +290,56 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time', 'favorites_count', 'in_carts_count'
         )
+        read_only_fields = ('favorites_count', 'in_carts_count')
+
+    def to_representation(self, instance):
+        """Собирает словарь из загруженных заранее связей.
+
+        Результат совпадает с обходом объявленных полей DRF, но не
+        вызывает поле и вложенный сериализатор на каждое значение.
+        """
+        request = self.context.get('request')
+        author = instance.author
+        data = {
+            'id': instance.id,
+            'tags': [{'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+                     for tag in instance.tags.all()],
+            'author': author and user_representation(
+                author, request, self.fields['author'].get_is_subscribed(
+                    author)),
+            'ingredients': [{
+                'id': item.ingredient_id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            } for item in instance.recipe_ingredients.all()],
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'name': instance.name,
+            'image': file_url(instance.image, request),
+            'image_variants': variant_urls(instance.image_variants, request),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+            'favorites_count': instance.favorites_count,
+            'in_carts_count': instance.in_carts_count,
+        }
+        if hasattr(instance, 'search_highlight'):
+            data['highlight'] = instance.search_highlight
+        return data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return request.user.is_authenticated and obj.favorites.filter(
             user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and obj.shopping_carts.filter(user=request.user).exists())
@@ -195,10 +347,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     author = ProfileUserSerializer(required=False, read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all())
     image = Base64ImageField()
     ingredients = serializers.ListField(
         child=serializers.DictField(),
@@ -220,18 +369,40 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
-    @transaction.atomic
-    def create_bulk_ing_tag(self, recipe, ingredients):
+    @staticmethod
+    def create_ingredients(recipe, amounts):
         RecipeIngredient.objects.bulk_create(
-            [
-                RecipeIngredient(
-                    recipe=recipe,
-                    amount=ing['amount'],
-                    ingredient=Ingredient.objects.get(id=ing['id']),
-                ) for ing in ingredients
-            ]
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
         )
 
+    @classmethod
+    def update_ingredients(cls, recipe, amounts):
+        """Пишет только разницу и возвращает прежние количества."""
+        current = {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe=recipe).values_list('id', 'ingredient_id', 'amount')
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        RecipeIngredient.objects.bulk_update([
+            RecipeIngredient(pk=current[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount
+        ], ['amount'])
+        cls.create_ingredients(recipe, {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        })
+        return {ingredient_id: amount
+                for ingredient_id, (_, amount) in current.items()}
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         tags = data.get('tags', [])
@@ -246,7 +417,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Теги не должны дублироваться.')
 
         seen_ingredients = set()
-        existing_ids = set(Ingredient.objects.values_list('id', flat=True))
+        existing_ids = set(Ingredient.objects.filter(id__in=[
+            ingredient_data.get('id') for ingredient_data in ingredients
+            if isinstance(ingredient_data.get('id'), int)
+        ]).order_by().values_list('id', flat=True))
+        amounts = {}
 
         for ingredient_data in ingredients:
             ing_id = ingredient_data.get('id')
@@ -273,6 +448,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     'Количество ингредиента должно быть больше'
                     f'{INGREDIENT_QUANITY}.'
                 )
+            amounts[ing_id] = amount
 
         if data.get('cooking_time', COOKING_QUANITY) < COOK_TIME:
             raise serializers.ValidationError(
@@ -280,26 +456,35 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 f'{COOK_TIME}.'
             )
 
+        data['ingredients'] = amounts
         return data
 
     @transaction.atomic
     def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
+        amounts = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_bulk_ing_tag(recipe, ingredients_data)
-        recipe.tags.set(tags_data)
+        self.create_ingredients(recipe, amounts)
+        PantryChange.objects.log(recipe.id)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags)
+        TimelineEntry.objects.fan_out(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-
-        instance.tags.set(tags_data)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_bulk_ing_tag(instance, ingredients_data)
-
+        amounts = validated_data.pop('ingredients')
+        instance.tags.set(validated_data.pop('tags'))
+        old_amounts = self.update_ingredients(instance, amounts)
+        if old_amounts.keys() != amounts.keys():
+            PantryChange.objects.log(instance.id)
+        # Удалённые строки уже вычел из списков покупок сигнал post_delete,
+        # bulk_update и bulk_create сигналов не шлют.
+        kept = {ingredient_id: amount
+                for ingredient_id, amount in old_amounts.items()
+                if ingredient_id in amounts}
+        if kept != amounts:
+            ShoppingListItem.objects.change_recipe(instance.id, kept, amounts)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -308,6 +493,50 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         }).data
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_MAX,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=PANTRY_INGREDIENTS_MAX,
+    )
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    coverage = serializers.SerializerMethodField()
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['coverage'] = self.get_coverage(instance)
+        data['missing_ingredients'] = self.get_missing_ingredients(instance)
+        return data
+
+    def get_coverage(self, obj):
+        return round(obj.matched_count / obj.ingredients_count, 2)
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context['pantry']
+        return RecipeIngredientSerializer([
+            item for item in obj.recipe_ingredients.all()
+            if item.ingredient_id not in pantry
+        ], many=True).data
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -334,6 +563,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
 class RecipeDetailSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -341,5 +571,16 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'image': file_url(instance.image, request),
+            'image_variants': variant_urls(instance.image_variants, request),
+            'cooking_time': instance.cooking_time,
+        }
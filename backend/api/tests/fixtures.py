@@ -0,0 +1,171 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.test.client import AsyncClientHandler
+from PIL import Image
+from rest_framework.test import APIClient, force_authenticate
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscribe
+
+User = get_user_model()
+
+PASSWORD = 'Foodgram-bench-2024'
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT и индекс ингредиентов во временном каталоге класса.
+
+    Загрузки картинок, их варианты и снимок индекса не попадают
+    в backend/media и backend/data и удаляются после тестов класса.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = Path(tempfile.mkdtemp())
+        cls.media_settings = override_settings(
+            MEDIA_ROOT=str(cls.media_root),
+            INGREDIENT_INDEX_PATH=cls.media_root / 'ingredients.idx')
+        cls.media_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.restore_media()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls.restore_media()
+
+    @classmethod
+    def restore_media(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+def environ_scope(environ):
+    """ASGI scope того же запроса, что и WSGI-окружение тест-клиента."""
+    headers = []
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            name = key[5:]
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = key
+        else:
+            continue
+        headers.append((name.replace('_', '-').lower().encode('latin1'),
+                        str(value).encode('latin1')))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': environ['REQUEST_METHOD'],
+        'scheme': environ['wsgi.url_scheme'],
+        'path': environ['PATH_INFO'].encode('iso-8859-1').decode(),
+        'query_string': environ['QUERY_STRING'].encode('iso-8859-1'),
+        'server': (environ['SERVER_NAME'], int(environ['SERVER_PORT'])),
+        'client': (environ['REMOTE_ADDR'], 0),
+        'headers': headers,
+        '_body_file': environ['wsgi.input'],
+    }
+
+
+class ASGIClientHandler(AsyncClientHandler):
+    """Проводит запросы APIClient через асинхронную цепочку Django."""
+
+    def __init__(self, *args, **kwargs):
+        self._force_user = None
+        self._force_token = None
+        super().__init__(*args, **kwargs)
+
+    def __call__(self, environ):
+        response = async_to_sync(super().__call__)(environ_scope(environ))
+        response.wsgi_request = response.asgi_request
+        return response
+
+    async def get_response_async(self, request):
+        force_authenticate(request, self._force_user, self._force_token)
+        return await super().get_response_async(request)
+
+
+class ASGIAPIClient(APIClient):
+    """APIClient, запросы которого обслуживает ASGI, а не WSGI."""
+
+    def __init__(self, enforce_csrf_checks=False, **defaults):
+        super().__init__(enforce_csrf_checks, **defaults)
+        self.handler = ASGIClientHandler(enforce_csrf_checks)
+
+
+def image_base64(color='red', size=(8, 8)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def seed_database(users=20, recipes=60, ingredients=40, tags=3):
+    """Заполняет базу связанными данными для тестов и бенчмарков."""
+    profiles = User.objects.bulk_create(
+        User(email=f'user{i}@foodgram.ru', username=f'user{i}',
+             first_name='Имя', last_name=f'Фамилия {i}')
+        for i in range(users)
+    )
+    profiles = list(User.objects.filter(
+        email__in=[profile.email for profile in profiles]).order_by('id'))
+    tag_objects = Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', slug=f'tag{i}') for i in range(tags)
+    )
+    tag_objects = list(Tag.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(ingredients)
+    )
+    ingredient_ids = list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True))
+
+    for i in range(recipes):
+        recipe = Recipe.objects.create(
+            name=f'Рецепт {i}',
+            text=f'Описание рецепта {i}',
+            cooking_time=i % 90 + 1,
+            author=profiles[i % len(profiles)],
+            image='recipes/image/bench.png'
+        )
+        recipe.tags.set(tag_objects[:i % len(tag_objects) + 1])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_ids[(i + j) % len(ingredient_ids)],
+                amount=j + 1
+            ) for j in range(5)
+        )
+
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    for i, profile in enumerate(profiles):
+        Favorite.objects.bulk_create(
+            Favorite(user=profile, recipe_id=recipe_id)
+            for recipe_id in recipe_ids[i::7]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=profile, recipe_id=recipe_id)
+            for recipe_id in recipe_ids[i::11]
+        )
+        Subscribe.objects.bulk_create(
+            Subscribe(follower=profile, following=author)
+            for author in profiles[i + 1:i + 6]
+        )
+    call_command('rebuild_shopping_lists', verbosity=0)
+    call_command('rebuild_timelines', verbosity=0)
+    call_command('recount_counters', verbosity=0)
+    return profiles
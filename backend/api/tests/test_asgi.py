@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from unittest import mock
+from urllib.parse import quote
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITransactionTestCase
+
+from . import (test_autocomplete, test_conditional, test_pagination,
+               test_queries, test_recipe_write, test_response_cache,
+               test_search, test_short_links)
+from .fixtures import ASGIAPIClient, TempMediaMixin, seed_database
+from api.cache import response_cache
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.shortlinks import local_links, short_code
+
+
+class ASGIServingTest(TempMediaMixin, APITransactionTestCase):
+    """Горячие эндпоинты из пула потоков отвечают так же, как через WSGI.
+
+    В пуле у view свои соединения с базой, поэтому данные должны быть
+    закоммичены: TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        local_links.clear()
+        self.profiles = seed_database(users=4, recipes=8, ingredients=5)
+        self.token = Token.objects.create(user=self.profiles[0]).key
+        self.recipe = Recipe.objects.exclude(
+            author=self.profiles[0]).order_by('id').first()
+
+    def tearDown(self):
+        cache.clear()
+        response_cache.clear()
+        local_links.clear()
+
+    def both(self, method, path, data=None, auth=False):
+        """Ответы WSGI и ASGI клиентов на один и тот же запрос."""
+        headers = {}
+        self.client.credentials()
+        if auth:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            headers['authorization'] = f'Token {self.token}'
+        if data is None:
+            wsgi = getattr(self.client, method)(path)
+            args = (path,)
+        else:
+            wsgi = getattr(self.client, method)(path, data, format='json')
+            args = (path, data)
+            headers['content_type'] = 'application/json'
+
+        async def fetch():
+            return await getattr(self.async_client, method)(*args, **headers)
+        return wsgi, async_to_sync(fetch)()
+
+    def assert_same(self, wsgi, asgi):
+        self.assertEqual(asgi.status_code, wsgi.status_code)
+        self.assertEqual(asgi.content, wsgi.content)
+        for header in ('Content-Type', 'ETag', 'Location'):
+            self.assertEqual(asgi.get(header), wsgi.get(header), header)
+
+    def test_reads_match_wsgi(self):
+        # Строка запроса закодирована, как её шлёт браузер: AsyncClient
+        # Django 3.2 портит в ней символы не из ASCII.
+        ingredients = f'/api/ingredients/?name={quote("ингр")}'
+        urls = (
+            '/api/tags/', f'/api/tags/{Tag.objects.first().id}/',
+            '/api/ingredients/', ingredients,
+            f'/api/ingredients/{Ingredient.objects.first().id}/',
+            '/api/recipes/?limit=3', '/api/recipes/?cursor=&limit=2',
+            f'/api/recipes/?tags=tag0&author={self.recipe.author_id}',
+            '/api/recipes/?is_favorited=1&is_in_shopping_cart=1',
+            f'/api/recipes/?search={quote("Рецепт")}',
+            f'/api/recipes/{self.recipe.id}/',
+            '/api/recipes/0/', '/api/recipes/?limit=abc',
+            f'/s/{short_code(self.recipe)}/', '/s/missing1/',
+        )
+        for auth in (False, True):
+            for url in urls:
+                with self.subTest(url=url, auth=auth):
+                    wsgi, asgi = self.both('get', url, auth=auth)
+                    self.assertIn(wsgi.status_code, (200, 302, 404))
+                    self.assert_same(wsgi, asgi)
+        found = self.both('get', ingredients)[1].json()
+        self.assertEqual(len(found), Ingredient.objects.count())
+
+    def test_client_uses_async_routes(self):
+        response = ASGIAPIClient().get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        urlconf = response.asgi_request.urlconf
+        self.assertEqual(urlconf, settings.ASGI_URLCONF)
+        self.assertTrue(asyncio.iscoroutinefunction(
+            resolve('/api/tags/', urlconf=urlconf).func))
+
+    def test_permissions_match_wsgi(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        for method, path, data, auth, status in (
+            ('post', '/api/recipes/', {}, False, 401),
+            ('post', '/api/recipes/', {}, True, 400),
+            ('patch', detail, {'name': 'Чужой'}, True, 403),
+            ('delete', detail, None, True, 403),
+            ('delete', detail, None, False, 401),
+        ):
+            with self.subTest(method=method, path=path, auth=auth):
+                wsgi, asgi = self.both(method, path, data, auth)
+                self.assertEqual(wsgi.status_code, status)
+                self.assert_same(wsgi, asgi)
+        self.assertEqual(Recipe.objects.get(id=self.recipe.id).name,
+                         self.recipe.name)
+
+    def test_requests_overlap(self):
+        # Каждый запрос ждёт остальные внутри view: без пула потоков
+        # барьер не дождался бы всех и запросы упали бы с ошибкой.
+        requests = 4
+        barrier = threading.Barrier(requests, timeout=10)
+        original = RecipeViewSet.list
+
+        def list_after_barrier(view, request, *args, **kwargs):
+            barrier.wait()
+            return original(view, request, *args, **kwargs)
+
+        async def fetch_all():
+            return await asyncio.gather(*(
+                self.async_client.get(f'/api/recipes/?limit={limit}')
+                for limit in range(1, requests + 1)))
+
+        with mock.patch.object(RecipeViewSet, 'list', list_after_barrier):
+            responses = async_to_sync(fetch_all)()
+        self.assertEqual([len(response.json()['results'])
+                          for response in responses], [1, 2, 3, 4])
+
+
+# Наборы тестов горячих эндпоинтов ещё раз, но через ASGI. View идут
+# в общем синхронном потоке (ASYNC_VIEW_THREADS = 0), где видна
+# транзакция TestCase.
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIIngredientAutocompleteTest(
+        test_autocomplete.IngredientAutocompleteTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIConditionalGetTest(test_conditional.ConditionalGetTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIKeysetPaginationTest(test_pagination.KeysetPaginationTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIRecipeQueryCountTest(test_queries.RecipeQueryCountTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIRecipeWriteTest(test_recipe_write.RecipeWriteTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIResponseCacheTest(test_response_cache.ResponseCacheTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIRecipeSearchTest(test_search.RecipeSearchTest):
+    client_class = ASGIAPIClient
+
+
+@override_settings(ASYNC_VIEW_THREADS=0)
+class ASGIShortLinkTest(test_short_links.ShortLinkTest):
+    client_class = ASGIAPIClient
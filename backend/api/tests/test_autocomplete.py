@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from recipes.autocomplete import ingredient_index
+from recipes.models import Ingredient
+
+INDEX_DIR = tempfile.mkdtemp()
+
+
+@override_settings(INGREDIENT_INDEX_PATH=Path(INDEX_DIR) / 'ingredients.idx')
+class IngredientAutocompleteTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, unit in (('Ёлочные игрушки', 'шт'), ('елей', 'мл'),
+                           ('мёд', 'г'), ('медовик', 'шт'),
+                           ('гречишный мед', 'г'), ('соль', 'г')):
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def search(self, name, **params):
+        response = self.client.get('/api/ingredients/',
+                                   {'name': name, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(self.search('мед'),
+                         ['мёд', 'медовик', 'гречишный мед'])
+
+    def test_case_and_yo_folding(self):
+        self.assertEqual(self.search('ЕЛ'), ['елей', 'Ёлочные игрушки'])
+
+    def test_limit(self):
+        self.assertEqual(self.search('мед', limit=1), ['мёд'])
+
+    def test_payload(self):
+        response = self.client.get('/api/ingredients/', {'name': 'соль'})
+        ingredient = Ingredient.objects.get(name='соль')
+        self.assertEqual(response.data, [{
+            'id': ingredient.id, 'name': 'соль', 'measurement_unit': 'г'}])
+
+    def test_rebuilt_after_invalidate(self):
+        self.assertEqual(self.search('сах'), [])
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        ingredient_index.invalidate()
+        self.assertEqual(self.search('сах'), ['сахар'])
+
+
+class IngredientIndexSignalTest(TestCase):
+
+    @override_settings(INGREDIENT_INDEX_PATH=Path(INDEX_DIR) / 'signal.idx')
+    def test_change_drops_snapshot(self):
+        ingredient_index.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='перец', measurement_unit='г')
+        self.assertFalse((Path(INDEX_DIR) / 'signal.idx').exists())
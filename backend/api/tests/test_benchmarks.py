@@ -0,0 +1,334 @@
+"""Бенчмарк эндпоинтов API с бюджетом запросов к базе.
+
+Для каждого эндпоинта записываются число SQL-запросов, время ответа
+и размер тела. Тест падает, если число запросов превышает бюджет.
+Время зависит от машины, поэтому порог времени и сравнения в
+SerializationBenchmarkTest проверяются только с BENCHMARK_TIMING=true.
+
+Переменные окружения:
+    BENCHMARK_TIMING=true — проверять время ответа и стоимость
+        сериализации;
+    BENCHMARK_SAVE=true — перезаписать файл baseline текущими замерами;
+    BENCHMARK_TOLERANCE — допустимый множитель к времени из baseline (3);
+    BENCHMARK_MIN_MS — время, которое не считается регрессией (50);
+    BENCHMARK_MAX_MS — порог времени без baseline (1000);
+    BENCHMARK_REPEAT — число повторов безопасных запросов (3).
+
+Эндпоинты с asgi=True идут через ASGIAPIClient и асинхронные маршруты
+foodgram.asgi_urls. View при этом работают в общем синхронном потоке
+(ASYNC_VIEW_THREADS = 0): данные теста не закоммичены, и соединения
+пула потоков их бы не увидели.
+
+SerializationBenchmarkTest сравнивает стоимость одного рецепта в
+RecipeSerializer при обходе полей DRF и в быстром to_representation,
+а также JSONRenderer и ORJSONRenderer.
+
+Запуск только бенчмарков со временем:
+BENCHMARK_TIMING=true python manage.py test --tag benchmark
+"""
+import gc
+import json
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .fixtures import (PASSWORD, ASGIAPIClient, TempMediaMixin, image_base64,
+                       seed_database)
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.shortlinks import short_code
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+TIMING = os.getenv('BENCHMARK_TIMING', 'False').lower() != 'false'
+
+Endpoint = namedtuple(
+    'Endpoint',
+    'name method path auth data status budget save_as asgi',
+    defaults=(None, 200, 10, None, False)
+)
+
+ENDPOINTS = (
+    Endpoint('users-list', 'get', '/api/users/', False),
+    Endpoint('users-list-limit', 'get', '/api/users/?limit=50', False),
+    Endpoint('users-detail', 'get', '/api/users/{author}/', False),
+    Endpoint('users-me', 'get', '/api/users/me/', True),
+    Endpoint('users-create', 'post', '/api/users/', False, {
+        'email': 'new@foodgram.ru', 'username': 'newuser',
+        'first_name': 'Новый', 'last_name': 'Пользователь',
+        'password': PASSWORD}, 201),
+    Endpoint('users-subscriptions', 'get',
+             '/api/users/subscriptions/', True, budget=4),
+    Endpoint('users-subscriptions-limit', 'get',
+             '/api/users/subscriptions/?limit=50&recipes_limit=3', True,
+             budget=4),
+    Endpoint('users-subscriptions-cursor', 'get',
+             '/api/users/subscriptions/?cursor=&limit=2', True, budget=4),
+    Endpoint('users-subscribe', 'post',
+             '/api/users/{stranger}/subscribe/', True, status=201, budget=13),
+    Endpoint('users-unsubscribe', 'delete',
+             '/api/users/{stranger}/subscribe/', True, status=204),
+    Endpoint('users-avatar-put', 'put', '/api/users/me/avatar/', True,
+             {'avatar': image_base64()}),
+    Endpoint('users-avatar-delete', 'delete', '/api/users/me/avatar/', True,
+             status=204),
+    Endpoint('users-set-password', 'post', '/api/users/set_password/', True,
+             {'current_password': PASSWORD,
+              'new_password': PASSWORD + '-new'}, 204),
+    Endpoint('auth-token-login', 'post', '/api/auth/token/login/', False,
+             {'email': 'reader@foodgram.ru',
+              'password': PASSWORD + '-new'}),
+    Endpoint('auth-token-logout', 'post', '/api/auth/token/logout/', True,
+             status=204),
+    Endpoint('tags-list', 'get', '/api/tags/', False),
+    Endpoint('tags-detail', 'get', '/api/tags/{tag}/', False),
+    Endpoint('ingredients-list', 'get', '/api/ingredients/', False),
+    Endpoint('ingredients-search', 'get',
+             '/api/ingredients/?name=ингредиент 1', False),
+    Endpoint('ingredients-detail', 'get',
+             '/api/ingredients/{ingredient}/', False),
+    Endpoint('tags-list-asgi', 'get', '/api/tags/', False, asgi=True),
+    Endpoint('ingredients-search-asgi', 'get',
+             '/api/ingredients/?name=ингредиент 1', False, asgi=True),
+    Endpoint('recipes-list', 'get', '/api/recipes/', False),
+    Endpoint('recipes-list-auth', 'get', '/api/recipes/', True),
+    Endpoint('recipes-list-limit', 'get', '/api/recipes/?limit=50', True),
+    Endpoint('recipes-list-page', 'get', '/api/recipes/?page=3', True),
+    Endpoint('recipes-list-cursor', 'get', '/api/recipes/?cursor=', True),
+    Endpoint('recipes-list-asgi', 'get', '/api/recipes/', False, asgi=True),
+    Endpoint('recipes-list-auth-asgi', 'get', '/api/recipes/', True,
+             asgi=True),
+    Endpoint('recipes-search', 'get', '/api/recipes/?search=Рецепт', True),
+    Endpoint('recipes-trending', 'get', '/api/recipes/trending/', True),
+    Endpoint('recipes-trending-cursor', 'get',
+             '/api/recipes/trending/?cursor=', True),
+    Endpoint('recipes-feed', 'get', '/api/recipes/feed/', True),
+    Endpoint('recipes-filter-tags', 'get',
+             '/api/recipes/?tags=tag0&tags=tag1', True),
+    Endpoint('recipes-filter-author', 'get',
+             '/api/recipes/?author={author}', True),
+    Endpoint('recipes-filter-favorited', 'get',
+             '/api/recipes/?is_favorited=1', True),
+    Endpoint('recipes-filter-cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', True),
+    Endpoint('recipes-cookable', 'get',
+             '/api/recipes/cookable/?ingredients={ingredient}', True),
+    Endpoint('recipes-detail', 'get', '/api/recipes/{recipe}/', False),
+    Endpoint('recipes-similar', 'get', '/api/recipes/{recipe}/similar/',
+             False, budget=2),
+    Endpoint('recipes-detail-auth', 'get', '/api/recipes/{recipe}/', True),
+    Endpoint('recipes-detail-asgi', 'get', '/api/recipes/{recipe}/', False,
+             asgi=True),
+    Endpoint('recipes-get-link', 'get',
+             '/api/recipes/{recipe}/get-link/', False),
+    Endpoint('short-link', 'get', '/s/{code}/', False, status=302),
+    Endpoint('short-link-asgi', 'get', '/s/{code}/', False, status=302,
+             asgi=True),
+    Endpoint('recipes-create', 'post', '/api/recipes/', True, {
+        'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 5,
+        'tags': ['{tag}'], 'image': image_base64('green'),
+        'ingredients': [{'id': '{ingredient}', 'amount': 10}]},
+        201, 18, 'new_recipe'),
+    Endpoint('recipes-update', 'patch', '/api/recipes/{new_recipe}/', True, {
+        'name': 'Обновлённый рецепт', 'text': 'Описание', 'cooking_time': 7,
+        'tags': ['{tag}'],
+        'ingredients': [{'id': '{ingredient}', 'amount': 20}]},
+        budget=16),
+    Endpoint('recipes-favorite', 'post',
+             '/api/recipes/{new_recipe}/favorite/', True, status=201),
+    Endpoint('recipes-unfavorite', 'delete',
+             '/api/recipes/{new_recipe}/favorite/', True, status=204),
+    Endpoint('recipes-bulk-favorite', 'post', '/api/recipes/bulk_favorite/',
+             True, {'recipes': ['{recipe}', '{new_recipe}']}),
+    Endpoint('recipes-bulk-unfavorite', 'delete',
+             '/api/recipes/bulk_favorite/', True,
+             {'recipes': ['{recipe}', '{new_recipe}']}),
+    Endpoint('recipes-bulk-cart-add', 'post',
+             '/api/recipes/bulk_shopping_cart/', True,
+             {'recipes': ['{recipe}', '{new_recipe}']}),
+    Endpoint('recipes-bulk-cart-remove', 'delete',
+             '/api/recipes/bulk_shopping_cart/', True,
+             {'recipes': ['{recipe}', '{new_recipe}']}),
+    Endpoint('recipes-cart-add', 'post',
+             '/api/recipes/{new_recipe}/shopping_cart/', True, status=201,
+             budget=12),
+    Endpoint('recipes-download-cart', 'get',
+             '/api/recipes/download_shopping_cart/', True),
+    Endpoint('recipes-download-cart-txt', 'get',
+             '/api/recipes/download_shopping_cart/?format=txt', True),
+    Endpoint('recipes-download-cart-csv', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', True),
+    Endpoint('recipes-cart-remove', 'delete',
+             '/api/recipes/{new_recipe}/shopping_cart/', True, status=204),
+    Endpoint('recipes-delete', 'delete', '/api/recipes/{new_recipe}/', True,
+             status=204, budget=15),
+)
+
+
+def env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+@tag('benchmark')
+@override_settings(ASYNC_VIEW_THREADS=0)
+class EndpointBenchmarkTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        profiles = seed_database()
+        cls.user = profiles[0]
+        cls.user.email = 'reader@foodgram.ru'
+        cls.user.set_password(PASSWORD)
+        cls.user.save()
+        recipe = Recipe.objects.filter(author=profiles[1]).first()
+        cls.context = {
+            'author': profiles[1].id,
+            'stranger': profiles[-1].id,
+            'recipe': recipe.id,
+            'code': short_code(recipe),
+            'tag': Tag.objects.first().id,
+            'ingredient': Ingredient.objects.first().id,
+        }
+
+    def setUp(self):
+        self.asgi_client = ASGIAPIClient()
+        self.baseline_path = BASELINE_DIR / f'{connection.vendor}.json'
+        self.baseline = {}
+        if self.baseline_path.exists():
+            self.baseline = json.loads(self.baseline_path.read_text())
+
+    def render(self, value):
+        if isinstance(value, str):
+            if value.startswith('{') and value.endswith('}'):
+                return self.context[value[1:-1]]
+            return value.format(**self.context)
+        if isinstance(value, dict):
+            return {key: self.render(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.render(item) for item in value]
+        return value
+
+    def request(self, endpoint):
+        client = self.asgi_client if endpoint.asgi else self.client
+        client.force_authenticate(self.user if endpoint.auth else None)
+        method = getattr(client, endpoint.method)
+        path = self.render(endpoint.path)
+        data = self.render(endpoint.data)
+        # Паузы сборщика мусора не должны попадать в замер.
+        gc.disable()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = method(path, data, format='json')
+                body = response.getvalue()
+                elapsed = time.perf_counter() - started
+        finally:
+            gc.enable()
+        return response, len(queries.captured_queries), elapsed, len(body)
+
+    def measure(self, endpoint):
+        response, queries, elapsed, size = self.request(endpoint)
+        if endpoint.method == 'get':
+            for _ in range(int(env_float('BENCHMARK_REPEAT', 3)) - 1):
+                elapsed = min(elapsed, self.request(endpoint)[2])
+        return response, {
+            'queries': queries,
+            'time_ms': round(elapsed * 1000, 2),
+            'size': size,
+        }
+
+    def time_limit(self, name):
+        baseline = self.baseline.get(name)
+        if baseline is None:
+            return env_float('BENCHMARK_MAX_MS', 1000)
+        return max(baseline['time_ms'] * env_float('BENCHMARK_TOLERANCE', 3),
+                   env_float('BENCHMARK_MIN_MS', 50))
+
+    def test_endpoints(self):
+        results = {}
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=endpoint.name):
+                response, result = self.measure(endpoint)
+                results[endpoint.name] = result
+                self.assertEqual(response.status_code, endpoint.status,
+                                 getattr(response, 'data', None))
+                if endpoint.save_as:
+                    self.context[endpoint.save_as] = response.data['id']
+                self.assertLessEqual(
+                    result['queries'], endpoint.budget,
+                    f'{endpoint.name}: превышен бюджет запросов'
+                )
+                if TIMING:
+                    self.assertLessEqual(
+                        result['time_ms'], self.time_limit(endpoint.name),
+                        f'{endpoint.name}: превышен порог времени ответа'
+                    )
+        if os.getenv('BENCHMARK_SAVE', 'False').lower() != 'false':
+            BASELINE_DIR.mkdir(exist_ok=True)
+            self.baseline_path.write_text(
+                json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+        if os.getenv('BENCHMARK_REPORT', 'False').lower() != 'false':
+            for name, result in results.items():
+                print(f'{name:32} {result["queries"]:4} '
+                      f'{result["time_ms"]:9.2f} ms {result["size"]:8} B')
+
+
+def per_item_us(function, items, repeat):
+    """Лучшее из repeat время function(items) на один элемент, мкс."""
+    best = None
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(items)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    return round(best / len(items) * 1e6, 2)
+
+
+@tag('benchmark')
+@skipUnless(TIMING, 'сравнение времени только с BENCHMARK_TIMING=true')
+class SerializationBenchmarkTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database()[0]
+
+    def test_per_item_cost(self):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.user
+        recipes = list(RecipeViewSet(
+            request=request, action='list', kwargs={}, format_kwarg=None
+        ).read_queryset())
+        serializer = RecipeSerializer(context={'request': request})
+        data = [serializer.to_representation(recipe) for recipe in recipes]
+        repeat = max(int(env_float('BENCHMARK_REPEAT', 3)), 5)
+        results = {
+            'fields': per_item_us(lambda items: [
+                serializers.ModelSerializer.to_representation(
+                    serializer, recipe) for recipe in items
+            ], recipes, repeat),
+            'fast': per_item_us(lambda items: [
+                serializer.to_representation(recipe) for recipe in items
+            ], recipes, repeat),
+            'json': per_item_us(JSONRenderer().render, data, repeat),
+            'orjson': per_item_us(ORJSONRenderer().render, data, repeat),
+        }
+        if os.getenv('BENCHMARK_REPORT', 'False').lower() != 'false':
+            for name, cost in results.items():
+                print(f'recipe-serialize-{name:24} {cost:9.2f} us/item')
+        self.assertLess(results['fast'], results['fields'])
+        self.assertLess(results['orjson'], results['json'])
@@ -0,0 +1,100 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import seed_database
+from api.constants import BULK_RECIPES_MAX
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+
+
+class BulkListsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database(users=4, recipes=60)[0]
+        cls.recipe_ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, recipe_ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                url, {'recipes': recipe_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return ({item['id']: item['status']
+                 for item in response.data['results']},
+                len(queries.captured_queries))
+
+    def shopping_list(self):
+        return set(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient_id', 'total_amount'))
+
+    def counters(self, field):
+        return dict(Recipe.objects.values_list('id', field))
+
+    def assert_consistent(self):
+        current = (self.shopping_list(), self.counters('in_carts_count'),
+                   self.counters('favorites_count'))
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(current, (self.shopping_list(),
+                                   self.counters('in_carts_count'),
+                                   self.counters('favorites_count')))
+
+    def test_cart_meal_plan(self):
+        in_cart = set(ShoppingCart.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        plan = self.recipe_ids[:50] + [10 ** 6]
+        statuses, queries = self.send(
+            'post', '/api/recipes/bulk_shopping_cart/', plan)
+        self.assertEqual(statuses, {
+            recipe_id: ('not_found' if recipe_id == 10 ** 6
+                        else 'exists' if recipe_id in in_cart else 'added')
+            for recipe_id in plan
+        })
+        self.assertLessEqual(queries, 8)
+        self.assert_consistent()
+        statuses, _ = self.send(
+            'delete', '/api/recipes/bulk_shopping_cart/', plan)
+        self.assertEqual(set(statuses.values()), {'removed', 'not_found'})
+        self.assertFalse(ShoppingCart.objects.filter(
+            user=self.user, recipe_id__in=plan).exists())
+        self.assert_consistent()
+        statuses, _ = self.send(
+            'delete', '/api/recipes/bulk_shopping_cart/', plan[:2])
+        self.assertEqual(set(statuses.values()), {'absent'})
+
+    def test_favorites(self):
+        recipe_ids = self.recipe_ids[:20]
+        Favorite.objects.filter(user=self.user,
+                                recipe_id__in=recipe_ids).delete()
+        call_command('recount_counters', stdout=StringIO())
+        statuses, _ = self.send(
+            'post', '/api/recipes/bulk_favorite/', recipe_ids * 2)
+        self.assertEqual(list(statuses), recipe_ids)
+        self.assertEqual(set(statuses.values()), {'added'})
+        statuses, _ = self.send(
+            'post', '/api/recipes/bulk_favorite/', recipe_ids)
+        self.assertEqual(set(statuses.values()), {'exists'})
+        self.assert_consistent()
+        statuses, _ = self.send(
+            'delete', '/api/recipes/bulk_favorite/', recipe_ids[:5])
+        self.assertEqual(set(statuses.values()), {'removed'})
+        self.assert_consistent()
+
+    def test_validation(self):
+        for payload in ({}, {'recipes': []}, {'recipes': ['abc']},
+                        {'recipes': list(range(1, BULK_RECIPES_MAX + 2))}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.post(
+                    '/api/recipes/bulk_favorite/', payload,
+                    format='json').status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post(
+            '/api/recipes/bulk_favorite/', {'recipes': [1]},
+            format='json').status_code, 401)
@@ -0,0 +1,121 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from recipes.models import Ingredient, Tag
+
+TEMP_DIR = Path(tempfile.mkdtemp())
+
+
+@override_settings(INGREDIENT_INDEX_PATH=TEMP_DIR / 'ingredients.idx')
+class ImportCatalogTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def write(self, name, text):
+        path = TEMP_DIR / name
+        path.write_text(text, encoding='utf-8')
+        return path
+
+    def load(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_reports_added_skipped_invalid(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write('catalog.csv', (
+            'name,measurement_unit\n'
+            'соль,г\n'
+            'сахар,г\n'
+            'битая строка\n'
+            ' молоко ,мл\n'
+            'сахар,г\n'
+            f'{"х" * 200},г\n'
+            'мука,кг\n'
+        ))
+        out, err = self.load(path)
+        self.assertIn('добавлено 3, пропущено 2, с ошибками 2', out)
+        self.assertIn('Запись 4', err)
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {('соль', 'г'), ('сахар', 'г'), ('молоко', 'мл'), ('мука', 'кг')})
+        out, _ = self.load(path)
+        self.assertIn('добавлено 0, пропущено 5', out)
+
+    def test_json_is_streamed(self):
+        rows = [{'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+                for i in range(50)]
+        rows.insert(10, {'name': 'без единицы'})
+        rows.insert(20, ['не', 'объект'])
+        path = self.write('catalog.json', json.dumps(rows,
+                                                     ensure_ascii=False))
+        with mock.patch(
+            'recipes.management.commands.import_catalog.CHUNK_SIZE', 7
+        ):
+            out, _ = self.load(path, '--batch-size=8')
+        self.assertIn('добавлено 50, пропущено 0, с ошибками 2', out)
+        self.assertEqual(Ingredient.objects.count(), 50)
+
+    def test_json_lines_and_broken_json(self):
+        path = self.write('catalog.jsonl', (
+            '{"name": "соль", "measurement_unit": "г"}\n'
+            '{"name": "мука", "measurement_unit": \n'
+            '\n'
+            '{"name": "перец", "measurement_unit": "г"}\n'))
+        out, err = self.load(path)
+        self.assertIn('добавлено 2, пропущено 0, с ошибками 1', out)
+        self.assertIn('Запись 2', err)
+        path = self.write('broken.json', '[{"name": "соль", ')
+        out, _ = self.load(path)
+        self.assertIn('добавлено 0, пропущено 0, с ошибками 1', out)
+
+    def test_json_skips_broken_records(self):
+        good = ', '.join(
+            json.dumps({'name': f'ингредиент {i}', 'measurement_unit': 'г'},
+                       ensure_ascii=False) for i in range(20))
+        path = self.write('broken.json', (
+            f'[{good}, {{"name": "соль", "measurement_unit": }}, '
+            '{"name": "с , и ]", "oops"}, '
+            f'{{"name": "{"х" * 100}", "measurement_unit": "г"}}, '
+            '{"name": "перец", "measurement_unit": "г"}]'))
+        with mock.patch.multiple(
+            'recipes.management.commands.import_catalog',
+            CHUNK_SIZE=7, MAX_RECORD_SIZE=64
+        ):
+            out, err = self.load(path)
+        self.assertIn('добавлено 21, пропущено 0, с ошибками 3', out)
+        self.assertIn('Запись 21', err)
+        self.assertTrue(Ingredient.objects.filter(name='перец').exists())
+
+    def test_dry_run(self):
+        path = self.write('dry.csv', 'соль,г\nсахар,г\n')
+        out, _ = self.load(path, '--dry-run')
+        self.assertIn('будет добавлено 2', out)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_bundled_catalogs(self):
+        out, _ = self.load(settings.BASE_DIR / 'data' / 'ingredients.json')
+        count = Ingredient.objects.count()
+        self.assertGreater(count, 2000)
+        out, _ = self.load(settings.BASE_DIR / 'data' / 'ingredients.csv')
+        self.assertIn('добавлено 0', out)
+        self.assertEqual(Ingredient.objects.count(), count)
+
+    def test_tags(self):
+        path = self.write('tags.csv', 'Ужин,dinner\nОбед,не слаг\n')
+        out, _ = self.load(path, '--catalog=tags')
+        self.assertIn('добавлено 1, пропущено 0, с ошибками 1', out)
+        call_command('add_tags', stdout=StringIO())
+        call_command('add_tags', stdout=StringIO())
+        self.assertEqual(Tag.objects.count(), 3)
@@ -0,0 +1,130 @@
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, seed_database
+from recipes.autocomplete import ingredient_index
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+
+
+class ConditionalGetTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=5, recipes=10, ingredients=5)
+        cls.user = cls.profiles[0]
+        cls.recipe = Recipe.objects.exclude(
+            favorites__user=cls.user).exclude(author=cls.user).first()
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            repeated = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        return response, repeated, len(queries.captured_queries)
+
+    def assert_not_modified(self, url):
+        response, repeated, _ = self.revalidate(url)
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated['ETag'], response['ETag'])
+        self.assertEqual(repeated.content, b'')
+        return response
+
+    def test_not_modified(self):
+        for url in ('/api/tags/', f'/api/tags/{Tag.objects.first().id}/',
+                    '/api/ingredients/', '/api/ingredients/?name=инг',
+                    '/api/recipes/', '/api/recipes/?tags=tag1',
+                    f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                self.assert_not_modified(url)
+
+    def test_not_modified_skips_serialization(self):
+        self.client.force_authenticate(self.user)
+        _, repeated, queries = self.revalidate('/api/recipes/?limit=6')
+        self.assertEqual(repeated.status_code, 304)
+        self.assertLessEqual(queries, 3)
+
+    def test_if_modified_since(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        repeated = self.client.get(
+            f'/api/recipes/{self.recipe.id}/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_list_delete_changes_validators(self):
+        url = '/api/recipes/?limit=3'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        recipe = Recipe.objects.order_by('pub_date').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+
+    def test_list_validators_skip_count(self):
+        url = '/api/recipes/?page=2&limit=3'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT(' in query['sql'].upper()])
+
+    def test_user_state_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.id}/'
+        etags = {self.client.get(url)['ETag']}
+        for action, field in (('favorite', 'is_favorited'),
+                              ('shopping_cart', 'is_in_shopping_cart')):
+            self.assertEqual(self.client.post(f'{url}{action}/').status_code,
+                             201)
+            response = self.client.get(url)
+            self.assertTrue(response.data[field])
+            etags.add(response['ETag'])
+        self.assertEqual(self.client.delete(
+            f'/api/users/{self.recipe.author_id}/subscribe/').status_code, 204)
+        response = self.client.get(url)
+        self.assertFalse(response.data['author']['is_subscribed'])
+        etags.add(response['ETag'])
+        self.assertEqual(len(etags), 4)
+        self.assertIn('Authorization', self.client.get(url)['Vary'])
+
+    def test_etag_differs_between_users(self):
+        url = '/api/recipes/'
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.profiles[1])
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_invalidate(self):
+        recipe_url = f'/api/recipes/{self.recipe.id}/'
+        changes = (
+            ('/api/recipes/', lambda: Favorite.objects.create(
+                user=self.user, recipe=self.recipe)),
+            ('/api/recipes/', lambda: Recipe.objects.filter(
+                id=self.recipe.id).first().save()),
+            (recipe_url, lambda: Tag.objects.filter(
+                id=self.recipe.tags.first().id).update(name='Новый тег')),
+            ('/api/tags/', lambda: Tag.objects.create(
+                name='Ещё тег', slug='more')),
+            ('/api/ingredients/', lambda: Ingredient.objects.create(
+                name='соль', measurement_unit='г')),
+            ('/api/recipes/', lambda: Recipe.objects.filter(
+                id=self.recipe.id).delete()),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                ingredient_index.checked = 0
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
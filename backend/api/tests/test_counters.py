@@ -0,0 +1,77 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class CountersTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(email='cook@foodgram.ru',
+                                         username='cook')
+        cls.reader = User.objects.create(email='reader@foodgram.ru',
+                                         username='reader')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=5,
+            author=cls.author, image='recipes/image/test.png')
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def refresh(self):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.reader.refresh_from_db()
+
+    def test_counters_follow_actions(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.refresh()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.reader.following_count, 1)
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.data['favorites_count'], 1)
+        self.assertEqual(response.data['author']['recipes_count'], 1)
+
+        self.client.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.delete(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertEqual(self.reader.following_count, 0)
+        out = StringIO()
+        call_command('recount_counters', check=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Счётчики в порядке')
+
+    def test_recount_repairs_drift(self):
+        Recipe.objects.update(favorites_count=10)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'расходятся: 2'):
+            call_command('recount_counters', check=True, stdout=out)
+        self.assertIn('recipe.favorites_count: расхождений 1',
+                      out.getvalue())
+        out = StringIO()
+        call_command('recount_counters', stdout=out)
+        self.assertIn('Исправлено строк: 2', out.getvalue())
+        self.assertNotIn('в порядке', out.getvalue())
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.author.recipes_count, 1)
+        out = StringIO()
+        call_command('recount_counters', check=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Счётчики в порядке')
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, image_base64, seed_database
+from recipes.models import Ingredient, Recipe, Tag, TimelineEntry
+from users.models import Subscribe
+
+
+class FeedTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=8, recipes=40)
+        cls.user = cls.profiles[0]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def expected(self, user):
+        return list(Recipe.objects.filter(
+            author__following__follower=user
+        ).order_by('-pub_date', 'id').values_list('id', flat=True))
+
+    def walk(self, url='/api/recipes/feed/?limit=4'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def publish(self, author):
+        author.refresh_from_db()
+        self.client.force_authenticate(author)
+        response = self.client.post('/api/recipes/', {
+            'name': 'Новинка', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [Tag.objects.first().id], 'image': image_base64(),
+            'ingredients': [{'id': Ingredient.objects.first().id,
+                             'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.user)
+        return response.data['id']
+
+    def test_feed_lists_followed_recipes(self):
+        self.assertEqual(self.walk(), self.expected(self.user))
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(
+            self.client.get('/api/recipes/feed/').status_code, 401)
+
+    def test_publish_fans_out(self):
+        recipe_id = self.publish(self.profiles[1])
+        self.assertEqual(self.walk()[0], recipe_id)
+        self.assertEqual(
+            TimelineEntry.objects.filter(recipe_id=recipe_id).count(),
+            Subscribe.objects.filter(following=self.profiles[1]).count())
+
+    def test_subscribe_backfills_and_unsubscribe_prunes(self):
+        author = self.profiles[-1]
+        Subscribe.objects.filter(follower=self.user,
+                                 following=author).delete()
+        TimelineEntry.objects.prune(self.user.id, author.id)
+        self.assertEqual(self.walk(), self.expected(self.user))
+        self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertTrue(set(author.recipes.values_list('id', flat=True))
+                        <= set(self.walk()))
+        self.assertEqual(self.walk(), self.expected(self.user))
+        self.client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(self.walk(), self.expected(self.user))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user, author=author).exists())
+
+    def test_celebrity_is_merged_on_read(self):
+        celebrity = self.profiles[1]
+        with mock.patch('recipes.models.FEED_FANOUT_LIMIT', 0):
+            recipe_id = self.publish(celebrity)
+            self.assertFalse(TimelineEntry.objects.filter(
+                recipe_id=recipe_id).exists())
+            self.assertEqual(self.walk(), self.expected(self.user))
+            self.assertIn(recipe_id, self.walk())
+
+    def test_previous_and_constant_queries(self):
+        first = self.client.get('/api/recipes/feed/?limit=3')
+        second = self.client.get(first.data['next'])
+        with CaptureQueriesContext(connection) as queries:
+            back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(second.data['next'])
+        self.assertEqual(len(queries.captured_queries),
+                         len(deep.captured_queries))
+
+    def test_rebuild(self):
+        expected = set(TimelineEntry.objects.values_list(
+            'user_id', 'recipe_id', 'author_id', 'pub_date'))
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', verbosity=0)
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'user_id', 'recipe_id', 'author_id', 'pub_date')), expected)
@@ -0,0 +1,120 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, image_base64
+from recipes.images import AVATAR_WIDTHS, RECIPE_IMAGE_WIDTHS
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Profile
+
+
+def create_user(username):
+    return Profile.objects.create(
+        email=f'{username}@foodgram.ru', username=username,
+        first_name='Имя', last_name='Фамилия')
+
+
+class ImageVariantsTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('author')
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def post_recipe(self, color='red'):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.id], 'image': image_base64(color, (900, 600)),
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def create_recipe(self, color='red'):
+        # Копии строятся после коммита, поэтому читаем рецепт заново.
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.post_recipe(color)['id']
+        return self.client.get(f'/api/recipes/{recipe_id}/').data
+
+    def test_recipe_variants(self):
+        data = self.create_recipe()
+        webp = data['image_variants']['webp']
+        self.assertEqual(set(webp), {str(width)
+                                     for width in RECIPE_IMAGE_WIDTHS})
+        recipe = Recipe.objects.get(id=data['id'])
+        for width in RECIPE_IMAGE_WIDTHS:
+            name = recipe.image_variants['webp'][str(width)]
+            self.assertTrue(webp[str(width)].endswith(name))
+            with default_storage.open(name) as file:
+                self.assertEqual(file.read(4), b'RIFF')
+        listed = self.client.get(f'/api/recipes/{data["id"]}/').data
+        self.assertEqual(listed['image_variants'], data['image_variants'])
+
+    def test_same_content_shares_names(self):
+        first = self.create_recipe()['image_variants']
+        second = self.create_recipe()['image_variants']
+        third = self.create_recipe('blue')['image_variants']
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_avatar_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/users/me/avatar/', {
+                'avatar': image_base64('green', (300, 300))}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(self.client.get('/api/users/me/')
+                .data['avatar_variants']['webp']),
+            {str(width) for width in AVATAR_WIDTHS})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/users/me/avatar/')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, {})
+
+    def test_rollback_builds_no_variants(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.assertEqual(self.post_recipe()['image_variants'], {})
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+
+    def test_missing_file_is_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='Без файла', text='Описание', cooking_time=1,
+                author=self.user, image='recipes/image/missing.png')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+
+
+class BuildImageVariantsCommandTest(TempMediaMixin, TransactionTestCase):
+
+    def test_backfill(self):
+        user = create_user('backfill')
+        buffer = BytesIO()
+        Image.new('RGB', (700, 500), 'red').save(buffer, format='PNG')
+        name = default_storage.save('recipes/image/old.png',
+                                    ContentFile(buffer.getvalue()))
+        # bulk_create не вызывает сигналы, как при загрузке старых данных.
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {i}', text='Описание', cooking_time=1,
+                   author=user, image=name)
+            for i in range(3))
+        call_command('build_image_variants', workers=2, verbosity=0)
+        variants = list(
+            Recipe.objects.values_list('image_variants', flat=True))
+        self.assertEqual(variants[0]['source'], name)
+        self.assertTrue(all(item == variants[0] for item in variants))
+        self.assertEqual(set(variants[0]['webp']),
+                         {str(width) for width in RECIPE_IMAGE_WIDTHS})
@@ -0,0 +1,141 @@
+import os
+import re
+from io import StringIO
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, image_base64
+from recipes.models import Ingredient, MediaBlob, Recipe, Tag
+from recipes.storage import content_storage
+from users.models import Profile
+
+DIGEST_NAME = re.compile(r'^recipes/image/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$')
+
+
+def create_user(username):
+    return Profile.objects.create(
+        email=f'{username}@foodgram.ru', username=username,
+        first_name='Имя', last_name='Фамилия')
+
+
+class ContentAddressedMediaTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('author')
+        cls.other = create_user('other')
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, color):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.id], 'image': image_base64(color),
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+        }
+
+    def create_recipe(self, color='red'):
+        response = self.client.post('/api/recipes/', self.recipe_data(color),
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def put_avatar(self, user, color):
+        self.client.force_authenticate(user)
+        response = self.client.put('/api/users/me/avatar/', {
+            'avatar': image_base64(color)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return Profile.objects.get(pk=user.pk)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', '--grace=0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_file(self):
+        first = self.create_recipe()
+        second = self.create_recipe()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, DIGEST_NAME)
+        self.assertEqual(len(os.listdir(
+            Path(first.image.path).parent)), 1)
+        self.assertEqual(self.refcount(first.image.name), 2)
+        self.assertNotEqual(self.create_recipe('blue').image.name,
+                            first.image.name)
+
+    def test_update_and_delete_move_references(self):
+        recipe = self.create_recipe()
+        old = recipe.image.name
+        response = self.client.patch(f'/api/recipes/{recipe.id}/',
+                                     self.recipe_data('blue'), format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(self.refcount(old), 0)
+        self.assertEqual(self.refcount(recipe.image.name), 1)
+        self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(self.refcount(recipe.image.name), 0)
+
+    def test_shared_avatar_survives_removal(self):
+        first = self.put_avatar(self.user, 'green')
+        second = self.put_avatar(self.other, 'green')
+        self.assertEqual(first.avatar.name, second.avatar.name)
+        self.assertEqual(self.refcount(first.avatar.name), 2)
+        self.assertEqual(
+            self.client.delete('/api/users/me/avatar/').status_code, 204)
+        self.assertEqual(self.refcount(first.avatar.name), 1)
+        self.collect()
+        self.assertTrue(content_storage.exists(first.avatar.name))
+
+    def test_collect_removes_unreferenced(self):
+        kept = self.create_recipe().image.name
+        recipe = self.create_recipe('blue')
+        dropped, variants = recipe.image.name, recipe.image_variants
+        recipe.delete()
+        self.assertIn('Будет удалено файлов: 1',
+                      self.collect('--dry-run'))
+        self.assertTrue(content_storage.exists(dropped))
+        self.assertIn('Удалено файлов: 1', self.collect())
+        self.assertFalse(content_storage.exists(dropped))
+        self.assertFalse(MediaBlob.objects.filter(name=dropped).exists())
+        self.assertTrue(content_storage.exists(kept))
+        for width, name in variants.get('webp', {}).items():
+            self.assertTrue(default_storage.exists(name))
+        self.collect('--scan')
+        for width, name in variants.get('webp', {}).items():
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(content_storage.exists(kept))
+
+    def test_scan_removes_untracked_files(self):
+        kept = self.create_recipe().image.name
+        stray = default_storage.save('recipes/image/legacy.png',
+                                     ContentFile(b'legacy'))
+        self.collect()
+        self.assertTrue(default_storage.exists(stray))
+        self.collect('--scan')
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(content_storage.exists(kept))
+
+    def test_grace_period_protects_new_files(self):
+        recipe = self.create_recipe()
+        name = recipe.image.name
+        recipe.delete()
+        call_command('collect_media', '--scan', stdout=StringIO())
+        self.assertTrue(content_storage.exists(name))
+
+    def test_collect_repairs_refcounts(self):
+        recipe = self.create_recipe()
+        MediaBlob.objects.filter(name=recipe.image.name).update(refcount=0)
+        self.collect()
+        self.assertTrue(content_storage.exists(recipe.image.name))
+        self.assertEqual(self.refcount(recipe.image.name), 1)
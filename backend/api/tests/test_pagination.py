@@ -0,0 +1,81 @@
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, seed_database
+from recipes.models import Recipe
+from users.models import Subscribe
+
+
+class KeysetPaginationTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=10, recipes=25)
+        cls.user = cls.profiles[0]
+        # Одинаковые даты проверяют разбор ничьих по id.
+        Recipe.objects.filter(id__in=Recipe.objects.order_by('id').values(
+            'id')[:8]).update(pub_date=Recipe.objects.first().pub_date)
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[direction]
+        return pages, response.data
+
+    def test_walks_all_recipes_in_order(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', 'id').values_list('id', flat=True))
+        pages, last = self.walk('/api/recipes/?cursor=&limit=4')
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages],
+                         [4] * 6 + [1])
+        self.assertNotIn('count', last)
+        back, first = self.walk(
+            self.client.get('/api/recipes/?cursor=&limit=4').data['next'],
+            'previous')
+        self.assertEqual(back, pages[1::-1])
+        self.assertIsNone(first['previous'])
+
+    def test_filters_are_kept(self):
+        expected = list(Recipe.objects.filter(
+            author=self.profiles[1]).order_by('-pub_date', 'id').values_list(
+            'id', flat=True))
+        pages, _ = self.walk(
+            f'/api/recipes/?cursor=&limit=1&author={self.profiles[1].id}')
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_page_number_is_default(self):
+        response = self.client.get('/api/recipes/?limit=4&page=2')
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_invalid_cursor(self):
+        for token in ('broken', 'W10=', 'WzAsIFsieCIsICIxIl1d'):
+            with self.subTest(token=token):
+                response = self.client.get(f'/api/recipes/?cursor={token}')
+                self.assertEqual(response.status_code, 404)
+
+    def test_constant_queries_for_any_depth(self):
+        self.client.force_authenticate(self.user)
+        url = '/api/recipes/?cursor=&limit=3'
+        self.client.get(url)
+        counts = set()
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            counts.add(len(queries.captured_queries))
+            url = response.data['next']
+        self.assertEqual(len(counts), 1)
+
+    def test_subscriptions(self):
+        self.client.force_authenticate(self.user)
+        expected = list(Subscribe.objects.filter(
+            follower=self.user).order_by('following_id').values_list(
+            'following_id', flat=True))
+        pages, _ = self.walk('/api/users/subscriptions/?cursor=&limit=2')
+        self.assertEqual(sum(pages, []), expected)
@@ -0,0 +1,120 @@
+import random
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, image_base64
+from recipes.models import Ingredient, Tag
+from recipes.pantry import PantryIndex, pantry_index
+from users.models import Profile
+
+
+def expected(recipes, pantry):
+    rows = []
+    for recipe_id, ingredients in recipes.items():
+        matched = len(ingredients & pantry)
+        if matched:
+            rows.append((recipe_id, matched, len(ingredients)))
+    return sorted(rows, key=lambda row: (-row[1] / row[2], row[2] - row[1],
+                                         -row[0]))
+
+
+class PantryIndexTest(SimpleTestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+
+        def ingredients(least=1):
+            # Первые 10 ингредиентов частые и хранятся масками.
+            return (set(rng.sample(range(1, 11), rng.randint(least, 4)))
+                    | set(rng.sample(range(11, 200), rng.randint(0, 4))))
+
+        recipes = {recipe_id: ingredients()
+                   for recipe_id in sorted(rng.sample(range(1, 5000), 1500))}
+        index = PantryIndex(
+            (recipe_id, ingredient_id)
+            for recipe_id, ingredients in recipes.items()
+            for ingredient_id in ingredients)
+        self.assertEqual({type(posting).__name__
+                          for posting in index.postings.values()},
+                         {'int', 'array'})
+        for _ in range(20):
+            for recipe_id in rng.sample(sorted(recipes), 10):
+                recipes[recipe_id] = ingredients(least=0)
+                index.update(recipe_id, recipes[recipe_id])
+            pantry = set(rng.sample(range(1, 60), rng.randint(1, 20)))
+            rows = expected(recipes, pantry)
+            match = index.match(pantry)
+            self.assertEqual(len(match), len(rows))
+            self.assertEqual(match[0:len(match)], rows)
+            self.assertEqual(match[7:19], rows[7:19])
+
+    def test_unknown_ingredients(self):
+        index = PantryIndex([(1, 1), (1, 2)])
+        self.assertEqual(len(index.match({3})), 0)
+        self.assertEqual(index.match({2, 3})[0:10], [(1, 1, 2)])
+
+
+@override_settings(PANTRY_INDEX_RELOAD=0)
+class CookableTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Profile.objects.create(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия')
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        pantry_index.reset()
+        self.client.force_authenticate(self.user)
+
+    def create(self, name, indexes):
+        return self.client.post('/api/recipes/', {
+            'name': name, 'text': 'Описание', 'cooking_time': 5,
+            'image': image_base64(), 'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredients[index].id, 'amount': 1}
+                            for index in indexes],
+        }, format='json').data['id']
+
+    def cookable(self, *indexes, **params):
+        response = self.client.get('/api/recipes/cookable/', {
+            'ingredients': [self.ingredients[index].id for index in indexes],
+            **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranking_and_incremental_updates(self):
+        soup = self.create('Суп', [0, 1])
+        salad = self.create('Салат', [0, 2, 3])
+        data = self.cookable(0, 1, 2)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            [(recipe['id'], recipe['coverage']) for recipe in data['results']],
+            [(soup, 1.0), (salad, 0.67)])
+        self.assertEqual(
+            [item['id'] for item in data['results'][1]['missing_ingredients']],
+            [self.ingredients[3].id])
+        self.client.patch(f'/api/recipes/{salad}/', {
+            'name': 'Салат', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredients[index].id, 'amount': 1}
+                            for index in (0, 2)],
+        }, format='json')
+        self.assertEqual([recipe['id'] for recipe in self.cookable(
+            0, 2, limit=1)['results']], [salad])
+        self.client.delete(f'/api/recipes/{soup}/')
+        self.assertEqual([recipe['id'] for recipe in self.cookable(
+            0, 1)['results']], [salad])
+
+    def test_validation(self):
+        for params in ({}, {'ingredients': 'abc'},
+                       {'ingredients': list(range(1, 102))}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(
+                    '/api/recipes/cookable/', params).status_code, 400)
@@ -0,0 +1,97 @@
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscribe
+
+User = get_user_model()
+
+RECIPES_COUNT = 12
+
+
+class RecipeQueryCountTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.ru', username='reader',
+            first_name='Читатель', last_name='Рецептов')
+        authors = [
+            User.objects.create(
+                email=f'author{i}@foodgram.ru', username=f'author{i}',
+                first_name='Автор', last_name=str(i))
+            for i in range(3)
+        ]
+        tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+                for i in range(2)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        for i in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', text='Описание', cooking_time=10,
+                author=authors[i % len(authors)],
+                image='recipes/image/test.png')
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscribe.objects.create(follower=cls.user, following=authors[0])
+        cls.recipe = Recipe.objects.first()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_list_queries(self):
+        self.assertEqual(
+            self.count_queries('/api/recipes/?limit=1'),
+            self.count_queries(f'/api/recipes/?limit={RECIPES_COUNT}')
+        )
+
+    def test_list_queries_anonymous(self):
+        self.assert_constant_list_queries()
+
+    def test_list_queries_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_list_queries()
+
+    def test_detail_queries(self):
+        # Два запроса уходят на ETag: версия рецепта и список тегов,
+        # ещё один — на множества id пользователя: вне транзакции теста
+        # они остались бы в кеше после первого запроса.
+        self.client.force_authenticate(self.user)
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertLessEqual(
+            self.count_queries(f'/api/recipes/{self.recipe.id}/'), 7)
+
+    def test_user_flags(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/recipes/?limit={RECIPES_COUNT}')
+        for item in response.data['results']:
+            recipe = Recipe.objects.get(id=item['id'])
+            self.assertEqual(
+                item['is_favorited'],
+                recipe.favorites.filter(user=self.user).exists())
+            self.assertEqual(
+                item['is_in_shopping_cart'],
+                recipe.shopping_carts.filter(user=self.user).exists())
+            self.assertEqual(
+                item['author']['is_subscribed'],
+                recipe.author.following.filter(follower=self.user).exists())
+            self.assertEqual(len(item['ingredients']), 3)
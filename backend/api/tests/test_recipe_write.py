@@ -0,0 +1,97 @@
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, image_base64
+from recipes.models import (Ingredient, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Profile
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class RecipeWriteTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Profile.objects.create(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия')
+        cls.tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+                    for i in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def payload(self, amounts, tags=(0,)):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'image': image_base64(),
+            'tags': [self.tags[index].id for index in tags],
+            'ingredients': [{'id': self.ingredients[index].id,
+                             'amount': amount}
+                            for index, amount in amounts.items()],
+        }
+
+    def send(self, method, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code,
+                         201 if method == 'post' else 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def create(self, amounts, tags=(0,)):
+        return self.send('post', '/api/recipes/', self.payload(amounts, tags))
+
+    def test_create_is_constant(self):
+        self.create({0: 1})
+        _, few = self.create({0: 1})
+        _, many = self.create({index: 1 for index in range(10)})
+        self.assertEqual(len(few), len(many))
+
+    def test_update_writes_only_diff(self):
+        response, _ = self.create({0: 5, 1: 5, 2: 5}, tags=(0, 1))
+        recipe_id = response.data['id']
+        ShoppingCart.objects.create(user=self.user, recipe_id=recipe_id)
+        url = f'/api/recipes/{recipe_id}/'
+        _, queries = self.send('patch', url,
+                               self.payload({0: 5, 1: 5, 2: 5}, (0, 1)))
+        writes = [sql for sql in queries if sql.startswith(WRITES)
+                  and ('recipeingredient' in sql or 'recipe_tags' in sql
+                       or 'shoppinglistitem' in sql)]
+        self.assertEqual(writes, [])
+        response, queries = self.send(
+            'patch', url, self.payload({0: 5, 1: 8, 3: 2}, (1, 2)))
+        self.assertEqual(
+            len([sql for sql in queries
+                 if sql.startswith('UPDATE') and 'recipeingredient' in sql]),
+            1)
+        self.assertEqual(
+            {item['id']: item['amount']
+             for item in response.data['ingredients']},
+            {self.ingredients[0].id: 5, self.ingredients[1].id: 8,
+             self.ingredients[3].id: 2})
+        self.assertEqual({tag['id'] for tag in response.data['tags']},
+                         {self.tags[1].id, self.tags[2].id})
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient_id', 'total_amount')),
+            dict(RecipeIngredient.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')))
+
+    def test_invalid_ids(self):
+        payload = self.payload({0: 1})
+        for field, value in (('ingredients', [{'id': 10 ** 6, 'amount': 1}]),
+                             ('ingredients', [{'id': '1', 'amount': 1}]),
+                             ('tags', [10 ** 6]), ('tags', ['abc'])):
+            with self.subTest(field=field, value=value):
+                response = self.client.post(
+                    '/api/recipes/', {**payload, field: value},
+                    format='json')
+                self.assertEqual(response.status_code, 400)
@@ -0,0 +1,199 @@
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin, seed_database
+from api.cache import response_cache
+from recipes import user_state
+from recipes.models import Favorite, Recipe, Tag
+
+
+@override_settings(RESPONSE_CACHE_LOCAL=True)
+class ResponseCacheTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=5, recipes=12, ingredients=5)
+        cls.recipe, cls.other = Recipe.objects.exclude(
+            favorites__user=cls.profiles[0]).exclude(
+                author=cls.profiles[0]).order_by('id')[:2]
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        response_cache.stats.reset()
+
+    def tearDown(self):
+        cache.clear()
+        response_cache.clear()
+
+    def get(self, url, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url, **headers)
+
+    def change(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def test_hits_skip_database(self):
+        url = '/api/recipes/?tags=tag1&tags=tag0&limit=3'
+        first = self.get(url)
+        self.assertEqual(first['X-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.get('/api/recipes/?limit=3&tags=tag0&tags=tag1')
+        self.assertEqual(second['X-Cache'], 'shared')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.get(url)['X-Cache'], 'local')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+                304)
+        counts = response_cache.stats.shared()
+        self.assertEqual(counts, {'local': 2, 'shared': 1, 'miss': 1})
+        output = StringIO()
+        call_command('response_cache_stats', stdout=output)
+        self.assertIn('local: 2 (50.0%)', output.getvalue())
+
+    def test_precise_invalidation(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        other = f'/api/recipes/{self.other.id}/'
+        self.get(detail), self.get(other), self.get('/api/recipes/')
+
+        def rename():
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        self.change(rename)
+        response = self.get(detail)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(response.data['name'], 'Новое название')
+        self.assertEqual(self.get(other)['X-Cache'], 'shared')
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'miss')
+
+        self.get(other)
+        author = self.other.author
+        author.first_name = 'Другое имя'
+        self.change(author.save)
+        self.assertEqual(self.get(other).data['author']['first_name'],
+                         'Другое имя')
+
+        self.get(other)
+        self.client.force_authenticate(self.profiles[0])
+        self.change(lambda: self.client.post(
+            f'/api/recipes/{self.other.id}/favorite/'))
+        self.client.force_authenticate(None)
+        response = self.get(other)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(response.data['favorites_count'],
+                         self.other.favorites_count + 1)
+
+        self.get(detail)
+        tag = self.recipe.tags.first()
+        tag.name = 'Переименованный'
+        self.change(tag.save)
+        self.assertEqual(self.get(detail)['X-Cache'], 'miss')
+
+    def test_ingredient_changes_invalidate(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        self.get(detail)
+        self.assertNotEqual(self.get(detail)['X-Cache'], 'miss')
+        item = self.recipe.recipe_ingredients.first()
+        item.amount += 100
+        self.change(item.save)
+        response = self.get(detail)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertIn(item.amount, [ingredient['amount'] for ingredient
+                                    in response.data['ingredients']])
+
+        count = len(response.data['ingredients'])
+        self.get(detail)
+        self.change(item.delete)
+        response = self.get(detail)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(len(response.data['ingredients']), count - 1)
+
+    def test_user_overlay(self):
+        user = self.profiles[0]
+        detail = f'/api/recipes/{self.other.id}/'
+        self.client.force_authenticate(user)
+        self.change(lambda: self.client.post(f'{detail}favorite/'))
+        self.change(lambda: self.client.post(
+            f'/api/users/{self.other.author_id}/subscribe/'))
+        first = self.get(detail)
+        self.assertEqual(first['X-Cache'], 'miss')
+        self.assertTrue(first.data['is_favorited'])
+        self.assertFalse(first.data['is_in_shopping_cart'])
+        self.assertTrue(first.data['author']['is_subscribed'])
+        with self.assertNumQueries(0):
+            second = self.get(detail)
+            self.assertEqual(
+                self.get(detail, HTTP_IF_NONE_MATCH=first['ETag'])
+                .status_code, 304)
+        self.assertEqual(second['X-Cache'], 'shared')
+        self.assertEqual(second.json(), first.json())
+
+        self.client.force_authenticate(None)
+        anonymous = self.get(detail)
+        self.assertEqual(anonymous['X-Cache'], 'local')
+        self.assertFalse(anonymous.data['is_favorited'])
+        self.assertFalse(anonymous.data['author']['is_subscribed'])
+        self.assertNotEqual(anonymous['ETag'], first['ETag'])
+
+        self.client.force_authenticate(user)
+        self.change(lambda: self.client.delete(
+            '/api/recipes/bulk_favorite/', {'recipes': [self.other.id]},
+            format='json'))
+        self.change(lambda: self.client.post(f'{detail}shopping_cart/'))
+        with self.assertNumQueries(1):
+            self.change(lambda: user_state.get(user.id))
+        with self.assertNumQueries(0):
+            state = user_state.get(user.id)
+        self.assertNotIn(self.other.id, state[user_state.FAVORITES])
+        self.assertIn(self.other.id, state[user_state.SHOPPING_CART])
+        response = self.get(detail)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+
+    def test_stale_user_state_not_cached(self):
+        user = self.profiles[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            user_state.get(user.id)
+        self.change(lambda: Favorite.objects.create(user=user,
+                                                    recipe=self.other))
+        # Запрос, прочитавший базу до изменения, кладёт множества в кеш
+        # уже после него.
+        for callback in callbacks:
+            callback()
+        self.assertIn(self.other.id,
+                      user_state.get(user.id)[user_state.FAVORITES])
+
+    def test_bypass(self):
+        self.client.force_authenticate(self.profiles[0])
+        for url in ('/api/recipes/?is_favorited=1',
+                    '/api/recipes/?is_in_shopping_cart=0'):
+            with self.subTest(url=url):
+                self.assertNotIn('X-Cache', self.get(url))
+        self.client.force_authenticate(None)
+        for url in ('/api/recipes/?format=json', '/api/recipes/trending/',
+                    '/api/recipes/?ordering=trending',
+                    f'/api/recipes/0{self.recipe.id}/'):
+            with self.subTest(url=url):
+                self.assertNotIn('X-Cache', self.get(url))
+
+    @override_settings(RESPONSE_CACHE_LOCAL=False)
+    def test_filebased_backend(self):
+        self.assertNotIn('X-Cache', self.get('/api/recipes/'))
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': location,
+            }}):
+                self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'miss')
+                self.assertEqual(self.get('/api/recipes/')['X-Cache'],
+                                 'shared')
+                self.change(lambda: Tag.objects.first().save())
+                self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'miss')
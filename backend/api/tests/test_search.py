@@ -0,0 +1,87 @@
+from io import StringIO
+
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin
+from recipes.models import Favorite, Recipe, Tag
+from users.models import Profile
+
+
+class RecipeSearchTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Profile.objects.create(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия')
+        cls.soup = Tag.objects.create(name='Суп', slug='soup')
+        cls.recipes = {
+            key: Recipe.objects.create(
+                name=name, text=text, cooking_time=10, author=cls.user,
+                image='recipes/image/search.png')
+            for key, name, text in (
+                ('borscht', 'Борщ <красный>', 'Свёкла, капуста и мясо.'),
+                ('salad', 'Салат', 'Остатки борща не нужны, только свёкла.'),
+                ('pie', 'Пирог', 'Яблоки и тесто.'),
+            )
+        }
+        cls.recipes['borscht'].tags.add(cls.soup)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/recipes/',
+                                   {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def names(self, results):
+        return [recipe['name'] for recipe in results]
+
+    def test_rank_and_highlight(self):
+        results = self.search('борщ')
+        self.assertEqual(self.names(results), ['Борщ <красный>', 'Салат'])
+        self.assertEqual(results[0]['highlight']['name'],
+                         '<mark>Борщ</mark> &lt;красный&gt;')
+        self.assertIn('<mark>борща</mark>', results[1]['highlight']['text'])
+        self.assertNotIn('highlight',
+                         self.client.get('/api/recipes/').data['results'][0])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(self.names(self.search('свёкла', tags='soup')),
+                         ['Борщ <красный>'])
+        Favorite.objects.create(user=self.user,
+                                recipe=self.recipes['salad'])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.names(self.search('свёкла', is_favorited=1)),
+                         ['Салат'])
+        stranger = Profile.objects.create(
+            email='stranger@foodgram.ru', username='stranger',
+            first_name='Имя', last_name='Фамилия')
+        self.assertEqual(self.search('свёкла', author=stranger.id), [])
+
+    def test_index_follows_changes(self):
+        pie = self.recipes['pie']
+        pie.text = 'Яблоки, тесто и немного борща.'
+        pie.save()
+        self.assertIn('Пирог', self.names(self.search('борщ')))
+        self.recipes['borscht'].delete()
+        self.assertEqual(set(self.names(self.search('борщ'))),
+                         {'Салат', 'Пирог'})
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(set(self.names(self.search('борщ'))),
+                         {'Салат', 'Пирог'})
+
+    def test_index_skips_unrelated_saves(self):
+        pie = Recipe.objects.get(pk=self.recipes['pie'].pk)
+        pie.cooking_time = 20
+        with self.assertNumQueries(1):
+            pie.save()
+        pie.name = 'Пирог с борщом'
+        pie.save()
+        self.assertIn('Пирог с борщом', self.names(self.search('борщ')))
+
+    def test_empty_and_odd_queries(self):
+        self.assertEqual(len(self.search('   ')), 3)
+        for query in ('"', '*', 'OR', 'не-найдётся'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [])
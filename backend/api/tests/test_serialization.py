@@ -0,0 +1,130 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .fixtures import TempMediaMixin, seed_database
+from api.renderers import ORJSONRenderer
+from api.serializers import (CookableRecipeSerializer, IngredientSerializer,
+                             RecipeDetailSerializer, RecipeSerializer,
+                             SubscriberSerializer)
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe
+
+User = get_user_model()
+
+
+def drf_representation(serializer, instance):
+    """Обход объявленных полей DRF — эталон для быстрого пути."""
+    return serializers.ModelSerializer.to_representation(serializer, instance)
+
+
+class FastSerializationTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=5, recipes=12, ingredients=8)
+        cls.user = cls.profiles[0]
+        User.objects.filter(pk=cls.profiles[1].pk).update(
+            avatar='users/images/avatar.png',
+            avatar_variants={'source': 'users/images/avatar.png',
+                             'webp': {64: 'variants/ab/avatar-64.webp'}})
+        Recipe.objects.filter(author=cls.profiles[1]).update(
+            name='Рецепт с разделителем\u2028строк',
+            image_variants={'source': 'recipes/image/bench.png',
+                            'webp': {320: 'variants/ab/bench-320.webp'}})
+
+    def request(self, user=None):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user or AnonymousUser()
+        return request
+
+    def recipes(self, request):
+        view = RecipeViewSet(request=request, action='list', kwargs={},
+                             format_kwarg=None)
+        return list(view.read_queryset())
+
+    def test_recipe_matches_fields(self):
+        for user in (None, self.user):
+            request = self.request(user)
+            serializer = RecipeSerializer(context={'request': request})
+            for recipe in self.recipes(request):
+                with self.subTest(user=user, recipe=recipe.id):
+                    self.assertEqual(
+                        json.dumps(serializer.to_representation(recipe)),
+                        json.dumps(drf_representation(serializer, recipe)))
+
+    def test_highlight_and_cookable(self):
+        request = self.request(self.user)
+        recipe = self.recipes(request)[0]
+        recipe.search_highlight = '<mark>Рецепт</mark>'
+        data = RecipeSerializer(recipe, context={'request': request}).data
+        self.assertEqual(list(data)[-1], 'highlight')
+        del recipe.search_highlight
+        recipe.matched_count, recipe.ingredients_count = 2, 5
+        serializer = CookableRecipeSerializer(context={
+            'request': request, 'pantry': set()})
+        self.assertEqual(
+            json.dumps(serializer.to_representation(recipe)),
+            json.dumps(drf_representation(serializer, recipe)))
+
+    def test_subscriber_and_detail_match_fields(self):
+        request = self.request(self.user)
+        recipes = Recipe.objects.top_by_author(
+            [profile.id for profile in self.profiles], 3)
+        context = {'request': request, 'recipes': recipes}
+        serializer = SubscriberSerializer(context=context)
+        for author in self.profiles:
+            author.is_subscribed = True
+            self.assertEqual(
+                json.dumps(serializer.to_representation(author)),
+                json.dumps(drf_representation(serializer, author)))
+        detail = RecipeDetailSerializer(context=context)
+        for recipe in recipes[self.profiles[1].id]:
+            self.assertEqual(detail.to_representation(recipe),
+                             drf_representation(detail, recipe))
+
+    def test_ingredient_values_rows(self):
+        serializer = IngredientSerializer()
+        for ingredient in Ingredient.objects.all():
+            self.assertEqual(serializer.to_representation(ingredient),
+                             drf_representation(serializer, ingredient))
+        self.assertEqual(
+            json.dumps(self.client.get('/api/ingredients/').json()),
+            json.dumps([drf_representation(serializer, ingredient)
+                        for ingredient in Ingredient.objects.all()]))
+
+    def test_renderer_bytes(self):
+        data = {
+            'text': 'Щи и борщ "в кавычках" \\ \t\u2028\u2029',
+            'lazy': gettext_lazy('Не найдено.'),
+            'when': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901,
+                                      tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 1, 2),
+            'amount': Decimal('1.5'),
+            'widths': {320: 'a', 640: None},
+            'flags': (True, False, 0.25),
+        }
+        for value in (data, [data], {}, [], None):
+            with self.subTest(value=value):
+                self.assertEqual(ORJSONRenderer().render(value),
+                                 JSONRenderer().render(value))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'))
+
+    def test_api_responses_unchanged(self):
+        self.client.force_authenticate(self.user)
+        for url in ('/api/recipes/?limit=12', '/api/users/subscriptions/',
+                    f'/api/recipes/{self.recipes(self.request())[0].id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.content,
+                                 JSONRenderer().render(response.data))
@@ -0,0 +1,197 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APITestCase
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+
+User = get_user_model()
+
+
+class DownloadShoppingCartTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='buyer@foodgram.ru',
+                                       username='buyer')
+        author = User.objects.create(email='cook@foodgram.ru',
+                                     username='cook')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        for amount in (5, 7):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {amount}', text='Описание', cooking_time=5,
+                author=author, image='recipes/image/test.png')
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=salt,
+                                            amount=amount)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        own_recipe = Recipe.objects.create(
+            name='Не в корзине', text='Описание', cooking_time=5,
+            author=cls.user, image='recipes/image/test.png')
+        RecipeIngredient.objects.create(recipe=own_recipe, ingredient=milk,
+                                        amount=100)
+        call_command('rebuild_shopping_lists', verbosity=0)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/?format={file_format}')
+        self.assertEqual(response.status_code, 200)
+        return response.getvalue().decode()
+
+    def test_txt_sums_cart_ingredients(self):
+        self.assertEqual(self.download('txt'), 'соль (г) — 12\n')
+
+    def test_csv(self):
+        self.assertEqual(self.download('csv').splitlines(),
+                         ['name,measurement_unit,amount', 'соль,г,12'])
+
+    def test_pdf_paginates(self):
+        recipe = self.user.shopping_carts.first().recipe
+        for i in range(100):
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=1,
+                ingredient=Ingredient.objects.create(
+                    name=f'ингредиент {i}', measurement_unit='г'))
+        call_command('rebuild_shopping_lists', verbosity=0)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        pages = re.search(rb'/Count (\d+)', response.getvalue())
+        self.assertGreater(int(pages.group(1)), 1)
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xls')
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingListMaintenanceTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='buyer@foodgram.ru',
+                                       username='buyer')
+        cls.other = User.objects.create(email='other@foodgram.ru',
+                                        username='other')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.salt, cls.milk, cls.egg = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('соль', 'г'), ('молоко', 'мл'),
+                               ('яйцо', 'шт'))
+        )
+        cls.recipes = []
+        for amounts in ({cls.salt: 5, cls.milk: 200}, {cls.salt: 3}):
+            recipe = Recipe.objects.create(
+                name='Рецепт', text='Описание', cooking_time=5,
+                author=cls.user, image='recipes/image/test.png')
+            recipe.tags.set([cls.tag])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=amount)
+                for ingredient, amount in amounts.items()
+            )
+            cls.recipes.append(recipe)
+
+    def shopping_list(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient__name', 'total_amount'))
+
+    def cart(self, user, recipe, method='post'):
+        self.client.force_authenticate(user)
+        response = getattr(self.client, method)(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_add_and_remove(self):
+        first, second = self.recipes
+        self.cart(self.user, first)
+        self.cart(self.user, second)
+        self.cart(self.other, second)
+        self.assertEqual(self.shopping_list(self.user),
+                         {'соль': 8, 'молоко': 200})
+        self.cart(self.user, first, 'delete')
+        self.assertEqual(self.shopping_list(self.user), {'соль': 3})
+        self.assertEqual(self.shopping_list(self.other), {'соль': 3})
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
+
+    def test_recipe_edit_and_delete(self):
+        first, second = self.recipes
+        self.cart(self.user, first)
+        self.cart(self.user, second)
+        self.cart(self.other, first)
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/recipes/{first.id}/', {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.salt.id, 'amount': 1},
+                            {'id': self.egg.id, 'amount': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list(self.user),
+                         {'соль': 4, 'яйцо': 2})
+        self.assertEqual(self.shopping_list(self.other),
+                         {'соль': 1, 'яйцо': 2})
+        self.client.delete(f'/api/recipes/{first.id}/')
+        self.assertEqual(self.shopping_list(self.user), {'соль': 3})
+        self.assertEqual(self.shopping_list(self.other), {})
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
+
+    def test_delete_outside_api(self):
+        author = User.objects.create(email='author@foodgram.ru',
+                                     username='author')
+        first, second = self.recipes
+        Recipe.objects.filter(id=second.id).update(author=author)
+        self.cart(self.user, first)
+        self.cart(self.user, second)
+        self.cart(self.other, second)
+        first.delete()
+        self.assertEqual(self.shopping_list(self.user), {'соль': 3})
+        author.delete()
+        self.assertEqual(self.shopping_list(self.user), {})
+        self.assertEqual(self.shopping_list(self.other), {})
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
+
+    def test_changes_outside_api(self):
+        first, second = self.recipes
+        self.cart(self.user, first)
+        ShoppingCart.objects.create(user=self.user, recipe=second)
+        self.assertEqual(self.shopping_list(self.user),
+                         {'соль': 8, 'молоко': 200})
+        self.cart(self.user, second, 'delete')
+        self.assertEqual(self.shopping_list(self.user),
+                         {'соль': 5, 'молоко': 200})
+        milk = RecipeIngredient.objects.get(recipe=first,
+                                            ingredient=self.milk)
+        milk.amount = 50
+        milk.save()
+        RecipeIngredient.objects.create(recipe=first, ingredient=self.egg,
+                                        amount=2)
+        RecipeIngredient.objects.get(recipe=first,
+                                     ingredient=self.salt).delete()
+        self.assertEqual(self.shopping_list(self.user),
+                         {'молоко': 50, 'яйцо': 2})
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
+        ShoppingCart.objects.get(user=self.user, recipe=first).delete()
+        self.assertEqual(self.shopping_list(self.user), {})
+
+    def test_drift_does_not_break_removal(self):
+        second = self.recipes[1]
+        self.cart(self.user, second)
+        ShoppingListItem.objects.filter(user=self.user).update(
+            total_amount=1)
+        self.cart(self.user, second, 'delete')
+        self.assertEqual(self.shopping_list(self.user), {})
+
+    def test_check_detects_drift(self):
+        self.cart(self.user, self.recipes[0])
+        ShoppingListItem.objects.filter(user=self.user).update(
+            total_amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', check=True, verbosity=0)
+        call_command('rebuild_shopping_lists', verbosity=0)
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
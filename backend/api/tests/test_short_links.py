@@ -0,0 +1,102 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from shortener.models import Url
+
+from recipes.models import Recipe
+from recipes.shortlinks import local_links
+from users.models import Profile
+
+
+class ShortLinkTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Profile.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='Описание', cooking_time=1,
+                author=author, image='recipes/image/test.png')
+            for i in range(2)
+        ]
+        cls.recipe = cls.recipes[0]
+
+    def setUp(self):
+        cache.clear()
+        local_links.clear()
+
+    def get_link(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/get-link/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['short-link']
+
+    def test_link_is_stable(self):
+        link = self.get_link(self.recipe)
+        self.assertEqual(self.get_link(self.recipe), link)
+        self.assertNotEqual(self.get_link(self.recipes[1]), link)
+        self.assertFalse(Url.objects.exists())
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'],
+                         f'/recipes/{self.recipe.id}/')
+
+    def test_redirect_is_cached(self):
+        link = self.get_link(self.recipe)
+        self.client.get(link)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(link).status_code, 302)
+        self.assertEqual(len(queries.captured_queries), 0)
+        local_links.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(link).status_code, 302)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_unknown_code(self):
+        self.assertEqual(self.client.get('/s/missing/').status_code, 404)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/s/missing/').status_code, 404)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_new_code_replaces_cached_miss(self):
+        self.assertEqual(self.client.get('/s/fresh001/').status_code, 404)
+        with mock.patch('shortuuid.uuid', return_value='fresh001'):
+            link = self.get_link(self.recipe)
+        self.assertEqual(self.client.get(link).status_code, 302)
+
+    def test_collision_is_retried(self):
+        Url.objects.create(long_url='http://testserver/recipes/1/',
+                           short_id='legacy01')
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(
+            short_code='taken001')
+        with mock.patch('shortuuid.uuid',
+                        side_effect=['legacy01', 'taken001', 'fresh001']):
+            link = self.get_link(self.recipe)
+        self.assertTrue(link.endswith('/s/fresh001/'))
+
+    def test_dedupe_existing_rows(self):
+        for code in ('first1', 'second', 'third1'):
+            Url.objects.create(
+                long_url=f'http://testserver/recipes/{self.recipe.id}/',
+                short_id=code)
+        for code in ('other1', 'other2'):
+            Url.objects.create(long_url='http://example.com/page/',
+                               short_id=code)
+        call_command('dedupe_short_links', '--dry-run', stdout=StringIO())
+        self.assertEqual(Url.objects.count(), 5)
+        call_command('dedupe_short_links', stdout=StringIO())
+        codes = Url.objects.order_by('id').values_list('short_id', flat=True)
+        self.assertEqual(list(codes), ['second', 'third1', 'other1', 'other2'])
+        self.assertTrue(self.get_link(self.recipe).endswith('/s/first1/'))
+        for code in ('first1', 'second', 'third1'):
+            self.assertEqual(self.client.get(f'/s/{code}/')['Location'],
+                             f'/recipes/{self.recipe.id}/')
+        for code in ('other1', 'other2'):
+            self.assertEqual(self.client.get(f'/s/{code}/')['Location'],
+                             'http://example.com/page/')
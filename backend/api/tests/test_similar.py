@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, SimilarRecipe, Tag)
+from users.models import Profile
+
+
+class SimilarRecipesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            Profile.objects.create(
+                email=f'user{i}@foodgram.ru', username=f'user{i}',
+                first_name='Имя', last_name='Фамилия')
+            for i in range(3)
+        ]
+        cls.tag = Tag.objects.create(name='Суп', slug='soup')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.recipes = {}
+        for key, indexes in (('borscht', (0, 1)), ('shchi', (0, 1)),
+                             ('salad', (2,)), ('pie', (3,))):
+            recipe = Recipe.objects.create(
+                name=key, text='Описание', cooking_time=10,
+                author=cls.users[0], image='recipes/image/similar.png')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=cls.ingredients[i],
+                                 amount=1)
+                for i in indexes)
+            cls.recipes[key] = recipe
+        cls.recipes['borscht'].tags.add(cls.tag)
+        cls.recipes['shchi'].tags.add(cls.tag)
+        for user in cls.users[:2]:
+            Favorite.objects.create(user=user, recipe=cls.recipes['borscht'])
+            ShoppingCart.objects.create(user=user,
+                                        recipe=cls.recipes['salad'])
+        Favorite.objects.create(user=cls.users[2],
+                                recipe=cls.recipes['salad'])
+
+    def build(self, **options):
+        call_command('build_similar_recipes', chunk_size=2,
+                     stdout=StringIO(), **options)
+
+    def similar(self, key, **params):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[key].id}/similar/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data]
+
+    def test_blends_co_interactions_and_composition(self):
+        self.build()
+        # borscht и salad отмечены одними пользователями, а shchi
+        # совпадает по составу и тегу.
+        self.assertEqual(self.similar('borscht'), ['salad', 'shchi'])
+        self.assertEqual(self.similar('borscht', limit=1), ['salad'])
+        self.assertEqual(self.similar('shchi'), ['borscht'])
+        self.assertEqual(self.similar('pie'), [])
+        scores = SimilarRecipe.objects.filter(
+            recipe=self.recipes['borscht']).values_list('score', flat=True)
+        self.assertEqual(list(scores), sorted(scores, reverse=True))
+
+    def test_rebuild_replaces_neighbours(self):
+        self.build()
+        RecipeIngredient.objects.filter(
+            recipe=self.recipes['shchi']).delete()
+        self.recipes['shchi'].tags.clear()
+        self.recipes['shchi'].save()
+        self.build(changed=True)
+        self.assertEqual(self.similar('shchi'), [])
+        self.assertEqual(self.similar('borscht'), ['salad', 'shchi'])
+        self.build()
+        self.assertEqual(self.similar('borscht'), ['salad'])
+
+    def test_unknown_recipe(self):
+        self.assertEqual(
+            self.client.get('/api/recipes/999999/similar/').status_code, 404)
+        self.assertEqual(
+            self.client.get('/api/recipes/abc/similar/').status_code, 404)
@@ -0,0 +1,94 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .fixtures import seed_database
+from api.constants import RECIPES_LIMIT_MAX
+from recipes.models import Recipe
+from users.models import Subscribe
+
+
+class SubscriptionRecipesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = seed_database(users=12, recipes=60)
+        cls.user = cls.profiles[0]
+        Subscribe.objects.bulk_create(
+            Subscribe(follower=cls.user, following=author)
+            for author in cls.profiles[6:]
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries), response
+
+    def test_recipes_match_author_order(self):
+        _, response = self.count_queries(
+            '/api/users/subscriptions/?limit=20&recipes_limit=2')
+        self.assertEqual(len(response.data['results']),
+                         self.user.follower.count())
+        for author in response.data['results']:
+            expected = list(Recipe.objects.filter(
+                author_id=author['id']).order_by(
+                '-pub_date', 'id').values_list('id', flat=True)[:2])
+            self.assertEqual([recipe['id'] for recipe in author['recipes']],
+                             expected)
+            self.assertEqual(author['recipes_count'],
+                             Recipe.objects.filter(
+                                 author_id=author['id']).count())
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(set(author['recipes'][0]),
+                             {'id', 'name', 'image', 'image_variants',
+                              'cooking_time'})
+
+    def test_constant_queries(self):
+        counts = {
+            self.count_queries(
+                f'/api/users/subscriptions/?limit={limit}'
+                f'&recipes_limit={recipes_limit}')[0]
+            for limit in (1, 11) for recipes_limit in (1, 5)
+        }
+        self.assertEqual(len(counts), 1)
+
+    def test_recipes_limit_is_capped(self):
+        _, response = self.count_queries(
+            f'/api/users/subscriptions/?recipes_limit={RECIPES_LIMIT_MAX * 2}')
+        self.assertEqual(response.status_code, 200)
+        _, response = self.count_queries(
+            '/api/users/subscriptions/?recipes_limit=0')
+        self.assertEqual(response.data['results'][0]['recipes'], [])
+
+    def test_invalid_recipes_limit(self):
+        stranger = self.profiles[-1]
+        Subscribe.objects.filter(follower=self.user,
+                                 following=stranger).delete()
+        for value in ('abc', '-1', '1.5'):
+            with self.subTest(value=value):
+                self.assertEqual(self.client.get(
+                    f'/api/users/subscriptions/?recipes_limit={value}'
+                ).status_code, 400)
+                self.assertEqual(self.client.post(
+                    f'/api/users/{stranger.id}/subscribe/'
+                    f'?recipes_limit={value}'
+                ).status_code, 400)
+        self.assertFalse(Subscribe.objects.filter(
+            follower=self.user, following=stranger).exists())
+
+    def test_subscribe_response(self):
+        stranger = self.profiles[-1]
+        Subscribe.objects.filter(follower=self.user,
+                                 following=stranger).delete()
+        response = self.client.post(
+            f'/api/users/{stranger.id}/subscribe/?recipes_limit=1')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['recipes']],
+            list(Recipe.objects.filter(author=stranger).order_by(
+                '-pub_date', 'id').values_list('id', flat=True)[:1]))
@@ -0,0 +1,126 @@
+import math
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .fixtures import TempMediaMixin
+from recipes.constants import TRENDING_HALF_LIFE
+from recipes.models import AuthorTrendEvent, Favorite, Recipe, ShoppingCart
+from recipes.trending import change, clock
+from users.models import Profile
+
+
+class TrendingTest(TempMediaMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.other = (
+            Profile.objects.create(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name='Имя', last_name='Фамилия')
+            for name in ('author', 'reader', 'other'))
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='Описание', cooking_time=10,
+                author=cls.author if i < 3 else cls.other,
+                image='recipes/image/trending.png')
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def names(self, path='/api/recipes/trending/', **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def score(self, recipe):
+        recipe.refresh_from_db()
+        return math.exp(recipe.trending_score - clock())
+
+    def test_events_rank_recipes(self):
+        first, second, third, fourth = self.recipes
+        self.client.post(f'/api/recipes/{second.id}/favorite/')
+        self.client.post(f'/api/recipes/{third.id}/shopping_cart/')
+        self.client.post('/api/recipes/bulk_favorite/',
+                         {'recipes': [third.id]}, format='json')
+        self.client.post(f'/api/users/{self.other.id}/subscribe/')
+        fourth.refresh_from_db()
+        self.assertEqual(fourth.trending_score, 0)
+        call_command('decay_trending', stdout=StringIO())
+        self.assertFalse(AuthorTrendEvent.objects.exists())
+        self.assertAlmostEqual(self.score(third), 2.5, places=3)
+        self.assertAlmostEqual(self.score(fourth), 0.5, places=3)
+        expected = ['Рецепт 2', 'Рецепт 1', 'Рецепт 3', 'Рецепт 0']
+        self.assertEqual(self.names(), expected)
+        self.assertEqual(self.names('/api/recipes/', ordering='trending'),
+                         expected)
+        cursor = self.client.get('/api/recipes/trending/',
+                                 {'cursor': '', 'limit': 2}).data
+        self.assertEqual(
+            [recipe['name'] for recipe in cursor['results']], expected[:2])
+        self.assertEqual(
+            [recipe['name'] for recipe in self.client.get(
+                cursor['next']).data['results']], expected[2:])
+        self.client.delete(f'/api/recipes/{third.id}/shopping_cart/')
+        self.client.delete('/api/recipes/bulk_favorite/',
+                           {'recipes': [third.id]}, format='json')
+        third.refresh_from_db()
+        self.assertEqual(third.trending_score, 0)
+        self.assertEqual(self.names()[:1], ['Рецепт 1'])
+
+    def test_subscriptions_batched_per_author(self):
+        fourth = self.recipes[3]
+        self.client.post(f'/api/users/{self.other.id}/subscribe/')
+        self.client.delete(f'/api/users/{self.other.id}/subscribe/')
+        self.client.post(f'/api/users/{self.other.id}/subscribe/')
+        self.assertEqual(AuthorTrendEvent.objects.count(), 3)
+        out = StringIO()
+        with self.assertNumQueries(5):
+            call_command('decay_trending', stdout=out)
+        self.assertIn('авторов: 1', out.getvalue())
+        self.assertAlmostEqual(self.score(fourth), 0.5, places=3)
+
+    def test_removal_withdraws_decayed_contribution(self):
+        day = TRENDING_HALF_LIFE
+        second, third = self.recipes[1:3]
+        added = timezone.now() - timedelta(seconds=3 * day)
+        for model, recipe, weight in ((Favorite, second, 1.0),
+                                      (ShoppingCart, third, 1.5)):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                trending_score=change(weight, added.timestamp()))
+            model.objects.bulk_create([model(
+                user=self.reader, recipe=recipe, created_at=added)])
+        self.client.force_authenticate(self.other)
+        self.client.post(f'/api/recipes/{second.id}/favorite/')
+        self.client.post(f'/api/recipes/{third.id}/shopping_cart/')
+        self.client.force_authenticate(self.reader)
+        self.client.delete(f'/api/recipes/{second.id}/favorite/')
+        self.client.delete('/api/recipes/bulk_shopping_cart/',
+                           {'recipes': [third.id]}, format='json')
+        self.assertAlmostEqual(self.score(second), 1.0, places=3)
+        self.assertAlmostEqual(self.score(third), 1.5, places=3)
+
+    def test_scores_decay_and_reset(self):
+        day = TRENDING_HALF_LIFE
+        old, new = self.recipes[:2]
+        now = 1_800_000_000
+        Recipe.objects.filter(pk=old.pk).update(
+            trending_score=change(4.0, now - 2 * day))
+        Recipe.objects.filter(pk=new.pk).update(
+            trending_score=change(1.5, now))
+        old.refresh_from_db()
+        new.refresh_from_db()
+        # Через два периода полураспада 4 превращается в 1 < 1,5.
+        self.assertAlmostEqual(
+            math.exp(old.trending_score - clock(now)), 1.0)
+        self.assertLess(old.trending_score, new.trending_score)
+        with mock.patch('time.time', return_value=now + 30 * day):
+            call_command('decay_trending', stdout=StringIO())
+        self.assertEqual(
+            Recipe.objects.filter(trending_score__gt=0).count(), 0)
@@ -1,10 +1,12 @@
 import base64
-import os
-import shortuuid
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Value)
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -13,18 +15,36 @@ from rest_framework.decorators import action
 from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
-from shortener.models import Url
 
-from .downcart import create_pdf
+from .cache import IGNORED_PARAMS, cache_key
+from .constants import (INGREDIENT_SEARCH_LIMIT, INGREDIENT_SEARCH_MAX_LIMIT,
+                        SIMILAR_RECIPES_LIMIT)
+from .downcart import EXPORT_FORMATS, create_shopping_list
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import ListRetrieveModelMixin
-from .pagination import PageLimitPagination
+from .mixins import (ConditionalGetMixin, KeysetOptInMixin,
+                     ListRetrieveModelMixin, ResponseCacheMixin,
+                     ingredients_version, make_etag, tags_version)
+from .pagination import (FeedPagination, KeysetPagination,
+                         PageLimitPagination, SubscriptionKeysetPagination,
+                         TrendingKeysetPagination, select_paginator)
 from .permissions import IsAuthorOrReadOnlyPermission
-from .serializers import (AvatarSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
+from .serializers import (AvatarSerializer, CookableRecipeSerializer,
+                          FavoriteSerializer, IngredientSerializer,
+                          PantrySerializer, RecipeCreateSerializer,
+                          RecipeDetailSerializer, RecipeIdsSerializer,
                           ShoppingCartSerializer, SubscribeSerializer,
-                          RecipeSerializer, TagSerializer)
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+                          SubscriberSerializer, RecipeSerializer,
+                          TagSerializer, get_recipes_limit)
+from recipes.autocomplete import ingredient_index
+from recipes.constants import SIMILAR_TOP_K
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, TimelineEntry)
+from recipes.pantry import pantry_index
+from recipes.search import highlights
+from recipes.shortlinks import resolve, short_code
+from recipes import user_state
+from recipes.trending import TRENDING_ORDERING
+from recipes.versions import GLOBAL, LIST, author_key, current, recipe_key
 from users.models import Subscribe
 
 User = get_user_model()
@@ -51,14 +71,9 @@ class ProfileUserViewSet(UserViewSet):
             if avatar_base64:
                 avatar_base64 = avatar_base64.split(',')[1]
                 avatar_data = base64.b64decode(avatar_base64)
-                avatar_file = ContentFile(
-                    avatar_data,
-                    name=f'avatar{user.id}.png'
-                )
-                if user.avatar:
-                    os.remove(user.avatar.path)
-                user.avatar.save(f'avatar{user.id}.png', avatar_file)
-                user.save()
+                # Имя файла задаёт хранилище по содержимому, старый файл
+                # удалит collect_media, когда на него не останется ссылок.
+                user.avatar.save('avatar.png', ContentFile(avatar_data))
                 return Response(
                     AvatarSerializer(user, context={'request': request}).data
                 )
@@ -67,7 +82,6 @@ class ProfileUserViewSet(UserViewSet):
                 status=HTTPStatus.BAD_REQUEST
             )
         if user.avatar:
-            os.remove(user.avatar.path)
             user.avatar = None
             user.save()
             return Response(status=HTTPStatus.NO_CONTENT)
@@ -76,6 +90,7 @@ class ProfileUserViewSet(UserViewSet):
 
     @action(['POST'], detail=True, serializer_class=SubscribeSerializer)
     def subscribe(self, request, id=None):
+        get_recipes_limit(request)
         user = self.get_object()
         serializer = self.get_serializer(data={
             'follower': request.user.id,
@@ -86,6 +101,7 @@ class ProfileUserViewSet(UserViewSet):
         return Response(serializer.data, status=HTTPStatus.CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def del_subscribe(self, request, id=None):
         follower = request.user
         following = get_object_or_404(User, id=id)
@@ -94,6 +110,7 @@ class ProfileUserViewSet(UserViewSet):
         ).first()
         if subscription:
             subscription.delete()
+            TimelineEntry.objects.prune(follower.id, following.id)
             return Response(status=HTTPStatus.NO_CONTENT)
         return Response(
             data={'errors': 'Вы еще не подписаны на этого пользователя'},
@@ -104,24 +121,34 @@ class ProfileUserViewSet(UserViewSet):
             detail=False,
             permission_classes=(IsAuthenticatedOrReadOnly,))
     def subscriptions(self, request, *args, **kwargs):
-        user = request.user
-        subscriptions = Subscribe.objects.filter(follower=user)
-        paginator = PageLimitPagination()
+        recipes_limit = get_recipes_limit(request)
+        subscriptions = Subscribe.objects.filter(
+            follower=request.user).select_related('following')
+        paginator = select_paginator(request, PageLimitPagination,
+                                     SubscriptionKeysetPagination)
         page = paginator.paginate_queryset(subscriptions, request)
-        serializer = SubscribeSerializer(
-            page, many=True, context={'request': request}
-        )
+        authors = [subscription.following for subscription in page]
+        for author in authors:
+            author.is_subscribed = True
+        serializer = SubscriberSerializer(authors, many=True, context={
+            'request': request,
+            'recipes': Recipe.objects.top_by_author(
+                [author.id for author in authors], recipes_limit),
+        })
         return paginator.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ListRetrieveModelMixin):
+class TagViewSet(ConditionalGetMixin, ListRetrieveModelMixin):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
+    def get_validators(self):
+        return tags_version(), None
+
 
-class IngredientViewSet(ListRetrieveModelMixin):
+class IngredientViewSet(ConditionalGetMixin, ListRetrieveModelMixin):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -129,8 +156,32 @@ class IngredientViewSet(ListRetrieveModelMixin):
     pagination_class = None
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
+    def get_validators(self):
+        return ingredients_version(), None
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.queryset.values(*IngredientSerializer.Meta.fields)
+        return super().get_queryset()
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.conditional(self.search, request)
+
+    def search(self, request):
+        try:
+            limit = int(request.query_params.get(
+                'limit', INGREDIENT_SEARCH_LIMIT))
+        except ValueError:
+            limit = INGREDIENT_SEARCH_LIMIT
+        return Response(ingredient_index.get().search(
+            request.query_params['name'],
+            min(limit, INGREDIENT_SEARCH_MAX_LIMIT)))
+
+
+class RecipeViewSet(ResponseCacheMixin, ConditionalGetMixin,
+                    KeysetOptInMixin, viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
@@ -141,6 +192,169 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    vary_headers = ('Authorization', 'Cookie')
+
+    def get_validators(self):
+        # Счётчики избранного, корзин и подписчиков обновляют updated_at,
+        # поэтому is_favorited и is_subscribed тоже меняют версию.
+        if self.action == 'retrieve':
+            try:
+                state = Recipe.objects.filter(
+                    pk=self.kwargs['pk']
+                ).values_list('updated_at', 'author__updated_at').first()
+            except (TypeError, ValueError):
+                state = None
+            if state is None:
+                return None, None
+            last_modified = max(state)
+        else:
+            # Удаление не оставляет строки с новым updated_at, поэтому
+            # у списков нет Last-Modified, а состав списка описывает
+            # версия LIST из recipes.versions.
+            rows = self.page_rows()
+            if rows is None:
+                return None, None
+            state = (sorted(current([GLOBAL, LIST]).items()), rows)
+            last_modified = None
+        return (state, tags_version(), ingredients_version()), last_modified
+
+    def page_rows(self):
+        """id и время изменения рецептов и авторов текущей страницы."""
+        queryset = self.filter_queryset(Recipe.objects.all())
+        paginator = self.paginator
+        if isinstance(paginator, KeysetPagination):
+            window = paginator.window(queryset, self.request)
+        else:
+            page = self.request.query_params.get(
+                paginator.page_query_param, '1')
+            if not page.isdigit() or int(page) < 1:
+                return None
+            size = paginator.get_page_size(self.request)
+            window = queryset[(int(page) - 1) * size:int(page) * size]
+        return tuple(window.values_list(
+            'id', 'updated_at', 'author__updated_at'))
+
+    def personal_etag(self, etag):
+        user = self.request.user
+        return make_etag((etag, user.pk)) if user.is_authenticated else etag
+
+    def response_cache_key(self, request):
+        # Рейтинг в тренде меняется с каждым добавлением в избранное,
+        # такие списки не кешируются. Фильтры по избранному и корзине
+        # меняют состав страницы для каждого пользователя.
+        if self.is_trending or (request.user.is_authenticated and set(
+                request.query_params) & set(IGNORED_PARAMS)):
+            return None
+        pk = self.kwargs.get('pk', '')
+        if pk and not (pk.isdigit() and str(int(pk)) == pk):
+            return None
+        return cache_key(request, self.action, pk)
+
+    def response_versions(self):
+        if self.action == 'retrieve':
+            return [GLOBAL, recipe_key(self.kwargs['pk'])]
+        return [GLOBAL, LIST]
+
+    def response_dependencies(self, data):
+        keys = []
+        for recipe in [data] if self.action == 'retrieve' else data['results']:
+            keys.append(recipe_key(recipe['id']))
+            if recipe['author']:
+                keys.append(author_key(recipe['author']['id']))
+        return keys
+
+    def overlay(self, data):
+        """Флаги пользователя по множествам id из recipes.user_state."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return data
+        state = user_state.get(user.pk)
+        favorites = state[user_state.FAVORITES]
+        shopping_cart = state[user_state.SHOPPING_CART]
+        following = state[user_state.FOLLOWING]
+        recipes = [{
+            **recipe,
+            'is_favorited': recipe['id'] in favorites,
+            'is_in_shopping_cart': recipe['id'] in shopping_cart,
+            'author': recipe['author'] and {
+                **recipe['author'],
+                'is_subscribed': recipe['author']['id'] in following,
+            },
+        } for recipe in ([data] if self.action == 'retrieve'
+                         else data['results'])]
+        if self.action == 'retrieve':
+            return recipes[0]
+        return {**data, 'results': recipes}
+
+    @property
+    def is_trending(self):
+        return (self.action == 'trending'
+                or self.request.query_params.get('ordering') == 'trending')
+
+    @property
+    def keyset_pagination_class(self):
+        if self.is_trending:
+            return TrendingKeysetPagination
+        return KeysetPagination
+
+    def get_queryset(self):
+        if self.request.method not in SAFE_METHODS:
+            return Recipe.objects.all()
+        return self.read_queryset()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'trending':
+            return queryset.order_by(*TRENDING_ORDERING)
+        return queryset
+
+    def read_queryset(self):
+        """Рецепты со всем, что нужно RecipeSerializer, за 4 запроса.
+
+        Для кеша флаги пользователя не считаются: их подставляет overlay.
+        """
+        user = self.request.user
+        authors = User.objects.all()
+        if user.is_authenticated and not self.shared_payload:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            authors = authors.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(
+                    follower=user, following=OuterRef('pk'))))
+        else:
+            is_favorited = is_in_shopping_cart = Value(
+                False, output_field=BooleanField())
+            authors = authors.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return Recipe.objects.annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        ).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        query = self.request.query_params.get('search', '').strip()
+        if (page is not None and query
+                and self.action in ('list', 'trending')):
+            found = highlights([recipe.id for recipe in page], query)
+            for recipe in page:
+                recipe.search_highlight = found.get(recipe.id)
+        return page
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= у download_shopping_cart выбирает формат файла,
+        # а не рендерер DRF.
+        return super().perform_content_negotiation(
+            request, force=force or self.action == 'download_shopping_cart')
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -149,6 +363,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        serializer.instance = self.read_queryset().get(
+            pk=serializer.instance.pk)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        serializer.instance = self.read_queryset().get(
+            pk=serializer.instance.pk)
 
     def _delete_item(self, model_class, user, recipe, error_message):
         deleted_count, _ = model_class.objects.filter(
@@ -162,6 +383,86 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(status=HTTPStatus.NO_CONTENT)
 
+    @transaction.atomic
+    def _bulk_change(self, request, model_class):
+        """Добавляет или удаляет список рецептов, статус по каждому id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            done = model_class.objects.add_many(request.user.id, recipe_ids)
+            done_status, other_status = 'added', 'exists'
+        else:
+            done = model_class.objects.remove_many(request.user.id,
+                                                   recipe_ids)
+            done_status, other_status = 'removed', 'absent'
+        done = set(done)
+        rest = [recipe_id for recipe_id in recipe_ids if recipe_id not in done]
+        existing = set(Recipe.objects.filter(id__in=rest).values_list(
+            'id', flat=True)) if rest else set()
+        return Response({'results': [
+            {'id': recipe_id,
+             'status': (done_status if recipe_id in done
+                        else other_status if recipe_id in existing
+                        else 'not_found')}
+            for recipe_id in recipe_ids
+        ]})
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,))
+    def bulk_shopping_cart(self, request):
+        return self._bulk_change(request, ShoppingCart)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,))
+    def bulk_favorite(self, request):
+        return self._bulk_change(request, Favorite)
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """Список рецептов по рейтингу «в тренде»."""
+        return self.list(request)
+
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """Рецепты по доле ингредиентов, которые есть у пользователя."""
+        serializer = PantrySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients')})
+        serializer.is_valid(raise_exception=True)
+        pantry = set(serializer.validated_data['ingredients'])
+        paginator = PageLimitPagination()
+        rows = paginator.paginate_queryset(pantry_index.match(pantry),
+                                           request)
+        recipes = self.read_queryset().in_bulk(
+            [recipe_id for recipe_id, *_ in rows])
+        page = []
+        for recipe_id, matched, size in rows:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_count, recipe.ingredients_count = matched, size
+                page.append(recipe)
+        return paginator.get_paginated_response(CookableRecipeSerializer(
+            page, many=True, context={'request': request, 'pantry': pantry}
+        ).data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Соседи из таблицы SimilarRecipe одним запросом по индексу."""
+        if not pk.isdigit():
+            raise Http404
+        try:
+            limit = int(request.query_params.get(
+                'limit', SIMILAR_RECIPES_LIMIT))
+        except ValueError:
+            limit = SIMILAR_RECIPES_LIMIT
+        recipes = list(Recipe.objects.filter(
+            similar_to__recipe_id=pk
+        ).order_by('similar_to__rank')[:max(0, min(limit, SIMILAR_TOP_K))])
+        if not recipes:
+            get_object_or_404(Recipe, id=pk)
+        return Response(RecipeDetailSerializer(
+            recipes, many=True, context={'request': request}).data)
+
     @action(
         detail=True,
         methods=['post'],
@@ -187,8 +488,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(permissions.IsAuthenticated,),
             detail=False)
     def download_shopping_cart(self, request, *args, **kwargs):
-        file = create_pdf(request.user)
-        return file
+        file_format = request.query_params.get('format', 'pdf')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: ' + ', '.join(EXPORT_FORMATS)},
+                status=HTTPStatus.BAD_REQUEST
+            )
+        return create_shopping_list(request.user, file_format)
 
     @action(
         detail=True,
@@ -211,11 +517,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self._delete_item(Favorite, request.user, recipe,
                                  'Рецепт не найден в вашем избранном')
 
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = FeedPagination()
+        rows = paginator.paginate_queryset(
+            TimelineEntry.objects.feed_sources(request.user), request)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in rows])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in rows
+             if recipe_id in recipes],
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         recipe = self.get_object()
-        long_url = request.build_absolute_uri(f'/recipes/{recipe.pk}/')
-        short_id = shortuuid.uuid()[:6]
-        short_url = Url.objects.create(long_url=long_url, short_id=short_id)
-        short_link = request.build_absolute_uri(f'/s/{short_url.short_id}/')
+        short_link = request.build_absolute_uri(
+            f'/s/{short_code(recipe)}/')
         return Response({'short-link': short_link}, status=HTTPStatus.OK)
+
+
+def short_link_redirect(request, code):
+    path = resolve(code)
+    if path is None:
+        raise Http404('Ссылка не найдена')
+    return HttpResponseRedirect(path)
@@ -0,0 +1,16 @@
+"""Маршруты для ASGI: горячие эндпоинты чтения асинхронные.
+
+Пути и имена те же, что в foodgram.urls; их выбирает
+api.async_views.ASGIURLConfMiddleware для запросов через ASGI.
+"""
+from api.async_views import async_patterns
+from foodgram.urls import urlpatterns as sync_urlpatterns
+
+ASYNC_ROUTES = (
+    'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail',
+    'recipes-list', 'recipes-detail',
+    'short-link',
+)
+
+urlpatterns = async_patterns(sync_urlpatterns, ASYNC_ROUTES)
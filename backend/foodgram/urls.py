@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from api.views import short_link_redirect
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
-    path('s/', include('shortener.urls', namespace='shortener')),
+    path('s/<slug:code>/', short_link_redirect, name='short-link'),
 ]
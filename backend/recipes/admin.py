@@ -1,8 +1,8 @@
 from django.contrib import admin
 
 from .models import (
-    Favorite, Ingredient, Recipe,
-    RecipeIngredient, ShoppingCart, Tag)
+    Favorite, Ingredient, MediaBlob, Recipe,
+    RecipeIngredient, ShoppingCart, ShoppingListItem, Tag)
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -13,14 +13,14 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'favorite_count')
+    list_display = ('id', 'name', 'author', 'favorites_count',
+                    'in_carts_count')
     list_filter = ('author', 'tags', )
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     inlines = [RecipeIngredientInline]
 
-    def favorite_count(self, obj):
-        return obj.favorites.count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -47,3 +47,15 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount',)
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'refcount', 'updated_at',)
+    search_fields = ('name',)
+    readonly_fields = ('name', 'refcount', 'updated_at',)
@@ -0,0 +1,163 @@
+"""Индекс автодополнения ингредиентов.
+
+Снимок справочника хранится в файле и отображается в память через mmap,
+поэтому воркеры gunicorn делят одну копию страниц. Формат снимка:
+
+    заголовок  MAGIC, количество записей N, хеш блока записей
+    N + 1 смещений ключей (uint32) в блоке ключей
+    N + 1 смещений записей (uint32) в блоке записей
+    блок ключей: свёрнутые названия по возрастанию, каждое с b'\\n'
+    блок записей: 'id\\tname\\tmeasurement_unit' в том же порядке
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from django.conf import settings
+
+MAGIC = b'FGI2'
+HEADER = struct.Struct('<4sI16s')
+SEPARATOR = b'\n'
+
+
+def fold(text):
+    return text.casefold().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    """Поиск по префиксу и подстроке в снимке без обращения к базе."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        magic, self.count, digest = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError('Неизвестный формат снимка ингредиентов')
+        self.digest = digest.hex()
+        view = memoryview(buffer)
+        offsets_size = array('I').itemsize * (self.count + 1)
+        start = HEADER.size
+        self.key_offsets = view[start:start + offsets_size].cast('I')
+        start += offsets_size
+        self.row_offsets = view[start:start + offsets_size].cast('I')
+        self.keys_start = start + offsets_size
+        self.keys_end = self.keys_start + self.key_offsets[self.count]
+        self.rows_start = self.keys_end
+
+    def key(self, index):
+        return self.buffer[self.keys_start + self.key_offsets[index]:
+                           self.keys_start + self.key_offsets[index + 1] - 1]
+
+    def row(self, index):
+        pk, name, unit = self.buffer[
+            self.rows_start + self.row_offsets[index]:
+            self.rows_start + self.row_offsets[index + 1]
+        ].decode().split('\t')
+        return {'id': int(pk), 'name': name, 'measurement_unit': unit}
+
+    def lower_bound(self, query):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < query:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, text, limit):
+        """Сначала совпадения по префиксу, затем по подстроке."""
+        query = fold(text).encode()
+        if not query or limit <= 0:
+            return []
+        found = []
+        index = self.lower_bound(query)
+        while (index < self.count and len(found) < limit
+               and self.key(index).startswith(query)):
+            found.append(index)
+            index += 1
+        position = self.buffer.find(query, self.keys_start, self.keys_end)
+        while position != -1 and len(found) < limit:
+            offset = position - self.keys_start
+            index = bisect_right(self.key_offsets, offset) - 1
+            if offset != self.key_offsets[index]:
+                found.append(index)
+            position = self.buffer.find(
+                query, self.keys_start + self.key_offsets[index + 1],
+                self.keys_end)
+        return [self.row(index) for index in found]
+
+
+def build_snapshot(path):
+    from .models import Ingredient
+
+    rows = sorted(
+        (fold(name).encode(), pk, name, unit)
+        for pk, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit')
+    )
+    key_offsets, row_offsets = array('I', [0]), array('I', [0])
+    keys, data = bytearray(), bytearray()
+    for key, pk, name, unit in rows:
+        keys += key + SEPARATOR
+        data += f'{pk}\t{name}\t{unit}'.encode()
+        key_offsets.append(len(keys))
+        row_offsets.append(len(data))
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        file.write(HEADER.pack(MAGIC, len(rows), digest))
+        file.write(key_offsets.tobytes())
+        file.write(row_offsets.tobytes())
+        file.write(keys)
+        file.write(data)
+    os.replace(file.name, path)
+
+
+class SharedIngredientIndex:
+    """Держит mmap снимка и перечитывает его, когда файл заменён."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.source = None
+        self.checked = 0
+
+    def get(self):
+        path = str(settings.INGREDIENT_INDEX_PATH)
+        now = time.monotonic()
+        if (self.index is not None and self.source[0] == path
+                and now - self.checked < settings.INGREDIENT_INDEX_RELOAD):
+            return self.index
+        with self.lock:
+            self.checked = now
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                build_snapshot(path)
+                stat = os.stat(path)
+            source = (path, stat.st_ino, stat.st_mtime_ns)
+            if self.index is None or source != self.source:
+                with open(path, 'rb') as file:
+                    buffer = mmap.mmap(file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                self.index = IngredientIndex(buffer)
+                self.source = source
+        return self.index
+
+    def invalidate(self):
+        """Удаляет снимок: его пересоберёт первый следующий поиск."""
+        try:
+            os.remove(settings.INGREDIENT_INDEX_PATH)
+        except FileNotFoundError:
+            pass
+        self.checked = 0
+
+
+ingredient_index = SharedIngredientIndex()
@@ -0,0 +1,18 @@
+from django.core.checks import Tags, Warning, register
+
+from .versions import shared_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кеша ответов и множества пользователей — в общем кеше."""
+    if shared_cache():
+        return []
+    return [Warning(
+        'Кеш по умолчанию не общий для процессов.',
+        hint=('При нескольких воркерах задайте CACHE_BACKEND и '
+              'CACHE_LOCATION общего кеша (memcached, база данных), иначе '
+              'процессы отдают устаревшие ответы и флаги is_favorited, '
+              'is_in_shopping_cart и is_subscribed.'),
+        id='recipes.W001',
+    )]
@@ -5,3 +5,28 @@ INGRS_NAME_LENGTH = 128
 MEASUREMENTS = 64
 COOKING_TIME = 1
 INGREDIENT_AMOUNT = 1
+FEED_FANOUT_LIMIT = 10000
+SHORT_CODE_LENGTH = 8
+SHORT_CODE_ATTEMPTS = 5
+SHORT_LINK_LRU_SIZE = 4096
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_MISS_TIMEOUT = 60
+SEARCH_CONFIG = 'russian'
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_TEXT_WEIGHT = 1.0
+SEARCH_SNIPPET_WORDS = 30
+PANTRY_DENSE_MIN = 64
+PANTRY_LOG_OVERLAP = 60
+PANTRY_LOG_KEEP = 60 * 60 * 24
+SIMILAR_TOP_K = 20
+SIMILAR_USER_MAX = 500
+SIMILAR_CO_WEIGHT = 0.6
+SIMILAR_INGREDIENT_WEIGHT = 0.3
+SIMILAR_TAG_WEIGHT = 0.1
+TRENDING_ORIGIN = 1704067200
+TRENDING_HALF_LIFE = 60 * 60 * 24
+TRENDING_MIN_SCORE = 0.01
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 1.5
+TRENDING_SUBSCRIBE_WEIGHT = 0.5
+USER_STATE_TIMEOUT = 60 * 60
@@ -0,0 +1,77 @@
+"""Уменьшенные копии картинок рецептов и аватаров.
+
+Копии лежат в VARIANTS_DIR под именем из SHA-256 исходного файла и
+ширины, поэтому их можно кешировать навсегда, а одинаковые исходники
+дают одни и те же файлы. В поле *_variants модели хранится
+{'source': имя исходника, формат: {ширина: имя копии}}.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import touch
+
+VARIANTS_DIR = 'variants'
+VARIANT_FORMATS = ('webp', 'avif')
+VARIANT_QUALITY = 80
+RECIPE_IMAGE_WIDTHS = (320, 640)
+AVATAR_WIDTHS = (64, 128)
+
+
+def available_formats():
+    """Форматы, для которых в сборке Pillow есть кодировщик."""
+    Image.init()
+    return [fmt for fmt in VARIANT_FORMATS if fmt.upper() in Image.SAVE]
+
+
+def variant_name(digest, width, fmt):
+    return f'{VARIANTS_DIR}/{digest[:2]}/{digest}-{width}.{fmt}'
+
+
+def build_variants(name, widths, storage=default_storage):
+    """Создаёт недостающие копии файла name и возвращает их имена.
+
+    Для отсутствующего или повреждённого файла возвращает None.
+    """
+    try:
+        with storage.open(name, 'rb') as file:
+            data = file.read()
+        image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+        image.load()
+    except (OSError, UnidentifiedImageError):
+        return None
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    digest = hashlib.sha256(data).hexdigest()
+    variants = {'source': name}
+    for fmt in available_formats():
+        for width in widths:
+            target = variant_name(digest, width, fmt)
+            if storage.exists(target):
+                touch(storage, target)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, width), Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, format=fmt.upper(),
+                             quality=VARIANT_QUALITY)
+                target = storage.save(target, ContentFile(buffer.getvalue()))
+            variants.setdefault(fmt, {})[str(width)] = target
+    return variants
+
+
+def variant_urls(variants, request=None, storage=default_storage):
+    """URL копий для сериализатора: {формат: {ширина: url}}."""
+    urls = {}
+    for fmt, names in variants.items():
+        if fmt == 'source':
+            continue
+        urls[fmt] = {}
+        for width, name in names.items():
+            url = storage.url(name)
+            urls[fmt][width] = (request.build_absolute_uri(url)
+                                if request else url)
+    return urls
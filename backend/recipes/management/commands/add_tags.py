@@ -11,5 +11,8 @@ class Command(BaseCommand):
             {'name': 'Обед', 'slug': 'lunch'},
             {'name': 'Завтрак', 'slug': 'breakfast'}
         ]
-        Tag.objects.bulk_create(Tag(**tag) for tag in data)
-        self.stdout.write(self.style.SUCCESS('Все тэги загружены!'))
+        before = Tag.objects.count()
+        Tag.objects.bulk_create((Tag(**tag) for tag in data),
+                                ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Все тэги загружены, новых: {Tag.objects.count() - before}'))
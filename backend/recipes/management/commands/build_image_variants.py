@@ -0,0 +1,63 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from recipes.images import build_variants
+from recipes.signals import IMAGE_FIELDS
+from recipes.versions import GLOBAL, bump
+
+
+def render(task):
+    name, widths = task
+    return name, build_variants(name, widths)
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий картинок рецептов и аватаров '
+            'для уже загруженных файлов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов, по умолчанию по ядрам')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии для всех файлов')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        for model, field, widths in IMAGE_FIELDS:
+            pending = defaultdict(list)
+            for pk, name, variants in model.objects.exclude(
+                **{field: ''}
+            ).exclude(**{f'{field}__isnull': True}).values_list(
+                'pk', field, f'{field}_variants'
+            ).iterator():
+                if options['force'] or variants.get('source') != name:
+                    pending[name].append(pk)
+            missing = 0
+            # Воркеры работают только с файлами, соединения с базой
+            # закрываются до запуска, чтобы не делить их между процессами.
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers']) as pool:
+                for name, variants in pool.map(
+                    render, ((name, widths) for name in pending),
+                    chunksize=16
+                ):
+                    if variants is None:
+                        missing += 1
+                        continue
+                    model.objects.filter(pk__in=pending[name]).update(**{
+                        f'{field}_variants': variants,
+                        'updated_at': timezone.now(),
+                    })
+            if options['verbosity']:
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'файлов {len(pending)}, не прочитано {missing}')
+        bump(GLOBAL)
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Готово за {time.monotonic() - started:.1f} с'))
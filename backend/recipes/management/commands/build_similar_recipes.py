@@ -0,0 +1,206 @@
+"""Расчёт похожих рецептов.
+
+Сходство пары (a, b):
+
+    SIMILAR_CO_WEIGHT · co(a, b) / √(n(a) · n(b))
+    + SIMILAR_INGREDIENT_WEIGHT · Жаккар ингредиентов
+    + SIMILAR_TAG_WEIGHT · Жаккар тегов
+
+n — число пользователей, у которых рецепт в избранном или корзине,
+co — число общих таких пользователей, то есть косинус столбцов
+разреженной матрицы пользователь × рецепт. Произведение XᵀX для пачки
+рецептов считает база самосоединением по user_id, поэтому память
+ограничена размером пачки. Пользователи, отметившие больше
+SIMILAR_USER_MAX рецептов, не учитываются: они дают квадратичное число
+пар и почти не несут сигнала. Кандидаты по составу берутся из
+списков редких ингредиентов PantryIndex, поэтому рецепты без отметок
+тоже получают соседей.
+"""
+import heapq
+import json
+import math
+import time
+from array import array
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.constants import (SIMILAR_CO_WEIGHT, SIMILAR_INGREDIENT_WEIGHT,
+                               SIMILAR_TAG_WEIGHT, SIMILAR_TOP_K,
+                               SIMILAR_USER_MAX)
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            SimilarRecipe)
+from recipes.pantry import PantryIndex
+
+INTERACTIONS = ('(SELECT user_id, recipe_id FROM {favorite} '
+                'UNION SELECT user_id, recipe_id FROM {cart})')
+
+
+def jaccard(first, second):
+    """Мера Жаккара; first — множество, second — любая коллекция."""
+    if not first or not second:
+        return 0.0
+    common = len(first.intersection(second))
+    return common / (len(first) + len(second) - common)
+
+
+def not_in(column, values):
+    """Условие column NOT IN values с одним параметром на любой базе."""
+    if connection.vendor == 'postgresql':
+        return f'NOT ({column} = ANY(%s))', [list(values)]
+    return (f'{column} NOT IN (SELECT value FROM json_each(%s))',
+            [json.dumps(list(values))])
+
+
+def in_list(column, values):
+    if connection.vendor == 'postgresql':
+        return f'{column} = ANY(%s)', [list(values)]
+    return (f'{column} IN (SELECT value FROM json_each(%s))',
+            [json.dumps(list(values))])
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт похожих рецептов по избранному, корзинам и составу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=SIMILAR_TOP_K,
+                            help='Сколько соседей хранить для рецепта')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--changed', action='store_true',
+                            help='Только рецепты, изменённые после '
+                                 'прошлого расчёта')
+
+    def handle(self, *args, **options):
+        started, clock = timezone.now(), time.monotonic()
+        self.top = options['top']
+        self.favorite = connection.ops.quote_name(Favorite._meta.db_table)
+        self.cart = connection.ops.quote_name(ShoppingCart._meta.db_table)
+        self.interactions = INTERACTIONS.format(favorite=self.favorite,
+                                                cart=self.cart)
+        self.heavy = self.heavy_users()
+        self.counts = self.interaction_counts()
+        self.ingredients = PantryIndex(
+            RecipeIngredient.objects.order_by('recipe_id').values_list(
+                'recipe_id', 'ingredient_id').iterator(chunk_size=10000))
+        self.tags = PantryIndex(
+            Recipe.tags.through.objects.order_by('recipe_id').values_list(
+                'recipe_id', 'tag_id').iterator(chunk_size=10000))
+        recipes = Recipe.objects.order_by('id')
+        if options['changed']:
+            since = SimilarRecipe.objects.aggregate(
+                since=Max('computed_at'))['since']
+            if since is not None:
+                recipes = recipes.filter(updated_at__gte=since)
+        total = stored = last_id = 0
+        while True:
+            chunk = list(recipes.filter(id__gt=last_id).values_list(
+                'id', flat=True)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            rows = [
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              rank=rank, score=score, computed_at=started)
+                for recipe_id, neighbours in self.neighbours(chunk).items()
+                for rank, (score, similar_id) in enumerate(neighbours, 1)
+            ]
+            with transaction.atomic():
+                SimilarRecipe.objects.filter(recipe_id__in=chunk).delete()
+                SimilarRecipe.objects.bulk_create(rows, batch_size=5000)
+            total += len(chunk)
+            stored += len(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты: {total} рецептов, {stored} связей '
+            f'за {time.monotonic() - clock:.1f} с'))
+
+    def heavy_users(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT user_id FROM {self.interactions} interactions '
+                'GROUP BY user_id HAVING COUNT(*) > %s', [SIMILAR_USER_MAX])
+            return [user_id for user_id, in cursor.fetchall()]
+
+    def interaction_counts(self):
+        """n(рецепт) в массиве по id рецепта."""
+        condition, params = not_in('user_id', self.heavy)
+        counts = array('I')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT recipe_id, COUNT(*) FROM {self.interactions} '
+                f'interactions WHERE {condition} GROUP BY recipe_id', params)
+            for recipe_id, count in cursor.fetchall():
+                if recipe_id >= len(counts):
+                    counts.extend(bytes(4 * (recipe_id + 1 - len(counts))))
+                counts[recipe_id] = count
+        return counts
+
+    def co_counts(self, chunk):
+        """{a: {b: число общих пользователей}} для рецептов пачки."""
+        chunk_condition, chunk_params = in_list('recipe_id', chunk)
+        heavy_condition, heavy_params = not_in('user_id', self.heavy)
+        found = {recipe_id: {} for recipe_id in chunk}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH a AS (SELECT user_id, recipe_id FROM {self.favorite} '
+                f'WHERE {chunk_condition} AND {heavy_condition} '
+                f'UNION SELECT user_id, recipe_id FROM {self.cart} '
+                f'WHERE {chunk_condition} AND {heavy_condition}), '
+                f'b AS (SELECT user_id, recipe_id FROM {self.favorite} '
+                'WHERE user_id IN (SELECT user_id FROM a) '
+                f'UNION SELECT user_id, recipe_id FROM {self.cart} '
+                'WHERE user_id IN (SELECT user_id FROM a)) '
+                'SELECT a.recipe_id, b.recipe_id, COUNT(*) FROM a JOIN b '
+                'ON b.user_id = a.user_id AND b.recipe_id <> a.recipe_id '
+                'GROUP BY a.recipe_id, b.recipe_id',
+                (chunk_params + heavy_params) * 2)
+            for recipe_id, other_id, count in cursor.fetchall():
+                found[recipe_id][other_id] = count
+        return found
+
+    def content_candidates(self, ingredients):
+        """Рецепты с самыми редкими ингредиентами из состава.
+
+        Частые ингредиенты (маски в PantryIndex) почти не говорят о
+        сходстве и дали бы тысячи кандидатов, поэтому берутся только
+        списки id, начиная с самых коротких.
+        """
+        postings = sorted(
+            (posting for posting in map(self.ingredients.postings.get,
+                                        ingredients)
+             if posting is not None and not isinstance(posting, int)),
+            key=len)
+        found = set()
+        for posting in postings:
+            found.update(posting[-self.top:])
+            if len(found) >= self.top * 2:
+                break
+        return found
+
+    def count(self, recipe_id):
+        return self.counts[recipe_id] if recipe_id < len(self.counts) else 0
+
+    def neighbours(self, chunk):
+        """{рецепт: [(сходство, id соседа)]} лучшие по убыванию."""
+        result = {}
+        for recipe_id, co in self.co_counts(chunk).items():
+            ingredients = set(self.ingredients.ingredients(recipe_id))
+            tags = set(self.tags.ingredients(recipe_id))
+            candidates = set(co) | self.content_candidates(ingredients)
+            candidates.discard(recipe_id)
+            count = self.count(recipe_id)
+            scored = []
+            for other_id in candidates:
+                score = (
+                    SIMILAR_CO_WEIGHT * co.get(other_id, 0)
+                    / math.sqrt(count * self.count(other_id) or 1)
+                    + SIMILAR_INGREDIENT_WEIGHT * jaccard(
+                        ingredients, self.ingredients.ingredients(other_id))
+                    + SIMILAR_TAG_WEIGHT * jaccard(
+                        tags, self.tags.ingredients(other_id))
+                )
+                if score > 0:
+                    scored.append((round(score, 6), other_id))
+            result[recipe_id] = heapq.nlargest(self.top, scored)
+        return result
@@ -0,0 +1,117 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIR
+from recipes.models import MediaBlob
+from recipes.signals import IMAGE_FIELDS
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def variant_names(variants):
+    for fmt, names in variants.items():
+        if fmt != 'source':
+            yield from names.values()
+
+
+class Command(BaseCommand):
+    help = ('Удаление файлов картинок и их копий, на которые не ссылается '
+            'ни один рецепт или аватар')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=24,
+                            help='Не трогать файлы моложе стольких часов')
+        parser.add_argument('--scan', action='store_true',
+                            help='Обойти каталоги целиком, включая файлы '
+                                 'без учёта ссылок и копии')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+
+    def references(self):
+        images, variants = Counter(), set()
+        for model, field, _ in IMAGE_FIELDS:
+            for name, stored in model.objects.values_list(
+                field, f'{field}_variants'
+            ).iterator():
+                if name:
+                    images[name] += 1
+                variants.update(variant_names(stored))
+        return images, variants
+
+    def sync_refcounts(self, images):
+        """Выравнивает счётчики по таблицам, которым верит сборщик."""
+        blobs = list(MediaBlob.objects.all())
+        for blob in blobs:
+            blob.refcount = images.get(blob.name, 0)
+        MediaBlob.objects.bulk_update(blobs, ['refcount'], batch_size=1000)
+        known = {blob.name for blob in blobs}
+        MediaBlob.objects.bulk_create(
+            (MediaBlob(name=name, refcount=count)
+             for name, count in images.items() if name not in known),
+            batch_size=1000, ignore_conflicts=True)
+
+    def is_referenced(self, name):
+        """Повторная проверка прямо перед удалением."""
+        if any(model.objects.filter(**{field: name}).exists()
+               for model, field, _ in IMAGE_FIELDS):
+            return True
+        return MediaBlob.objects.filter(name=name, refcount__gt=0).exists()
+
+    def remove(self, storage, name, cutoff, dry_run):
+        try:
+            if storage.get_modified_time(name) >= cutoff:
+                return False
+        except FileNotFoundError:
+            pass
+        else:
+            if self.is_referenced(name):
+                return False
+            if not dry_run:
+                storage.delete(name)
+        if not dry_run:
+            MediaBlob.objects.filter(name=name, refcount=0).delete()
+        self.stdout.write(name, style_func=self.style.NOTICE)
+        return True
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace'])
+        dry_run = options['dry_run']
+        images, variants = self.references()
+        if not dry_run:
+            self.sync_refcounts(images)
+        candidates = []
+        for model, field, _ in IMAGE_FIELDS:
+            model_field = model._meta.get_field(field)
+            storage = model_field.storage
+            directory = model_field.upload_to.rstrip('/')
+            candidates += [
+                (storage, name) for name in MediaBlob.objects.filter(
+                    name__startswith=f'{directory}/', refcount=0,
+                    updated_at__lt=cutoff
+                ).values_list('name', flat=True)
+            ]
+            if options['scan']:
+                candidates += [(storage, name)
+                               for name in walk(storage, directory)
+                               if name not in images]
+        if options['scan']:
+            candidates += [(default_storage, name)
+                           for name in walk(default_storage, VARIANTS_DIR)
+                           if name not in variants]
+        removed = sum(self.remove(storage, name, cutoff, dry_run)
+                      for storage, name in dict.fromkeys(candidates))
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if dry_run else "Удалено"} файлов: {removed}'))
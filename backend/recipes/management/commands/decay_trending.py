@@ -0,0 +1,53 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.constants import TRENDING_MIN_SCORE
+from recipes.models import AuthorTrendEvent, Recipe
+from recipes.trending import change, contribution, faded
+from recipes.utils import returned_datetime
+
+
+class Command(BaseCommand):
+    help = ('Переносит подписки в рейтинг «в тренде» рецептов их авторов '
+            'и обнуляет рейтинг у рецептов, чьи события давно затухли')
+
+    def handle(self, *args, **options):
+        authors = self.apply_author_events()
+        reset = Recipe.objects.filter(
+            trending_score__gt=0, trending_score__lte=faded()
+        ).update(trending_score=0, updated_at=timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписки перенесены в рейтинг авторов: {authors}, '
+            f'рейтинг в тренде обнулён у рецептов: {reset}'))
+
+    def apply_author_events(self):
+        """Складывает события журнала, приведённые к текущему моменту.
+
+        На автора приходится один UPDATE его рецептов за запуск, сколько
+        бы подписок и отписок ни накопилось. События забираются
+        DELETE ... RETURNING в той же транзакции, что и UPDATE, поэтому
+        параллельный запуск не применит их второй раз.
+        """
+        quote = connection.ops.quote_name
+        opts = AuthorTrendEvent._meta
+        now = time.time()
+        weights = defaultdict(float)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {quote(opts.db_table)} RETURNING '
+                    + ', '.join(quote(opts.get_field(name).column) for name
+                                in ('author_id', 'weight', 'created_at')))
+                for author_id, weight, created_at in cursor.fetchall():
+                    weights[author_id] += contribution(
+                        weight, returned_datetime(created_at), now)
+            for author_id, weight in weights.items():
+                if abs(weight) >= TRENDING_MIN_SCORE:
+                    Recipe.objects.filter(author_id=author_id).update(
+                        trending_score=change(weight, now),
+                        updated_at=timezone.now())
+        return len(weights)
@@ -0,0 +1,69 @@
+import re
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shortener.models import Url
+
+from recipes.constants import SHORT_CODE_LENGTH
+from recipes.models import Recipe
+from recipes.shortlinks import forget, recipe_path
+
+RECIPE_URL = re.compile(r'/recipes/(\d+)/?$')
+
+
+class Command(BaseCommand):
+    help = ('Перенос первого кода рецепта из shortener.Url в рецепт; '
+            'остальные выданные коды ведут на адрес рецепта')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать строки')
+
+    def handle(self, *args, **options):
+        groups = defaultdict(list)
+        for pk, long_url, code in Url.objects.order_by('id').values_list(
+            'id', 'long_url', 'short_id'
+        ).iterator():
+            match = RECIPE_URL.search(long_url)
+            groups[int(match[1]) if match else long_url].append((pk, code))
+        recipes = Recipe.objects.in_bulk(
+            [key for key in groups if isinstance(key, int)])
+        taken = set(Recipe.objects.exclude(
+            short_code=None).values_list('short_code', flat=True))
+        removed, adopted, redirected = [], [], []
+        for key, rows in groups.items():
+            recipe = recipes.get(key)
+            if recipe is None:
+                continue
+            # Первый выданный код становится кодом рецепта, и его строка
+            # в shortener.Url больше не нужна. Остальные коды уже разошлись
+            # по ссылкам пользователей, поэтому их строки остаются и ведут
+            # на адрес рецепта.
+            if (not recipe.short_code
+                    and len(rows[0][1]) <= SHORT_CODE_LENGTH
+                    and rows[0][1] not in taken):
+                taken.add(rows[0][1])
+                recipe.short_code = rows[0][1]
+                adopted.append(recipe)
+                removed.append(rows.pop(0))
+            redirected += [
+                Url(pk=pk, short_id=code, long_url=recipe_path(recipe.pk))
+                for pk, code in rows
+            ]
+        if not options['dry_run']:
+            with transaction.atomic():
+                Recipe.objects.bulk_update(adopted, ['short_code'],
+                                           batch_size=1000)
+                Url.objects.bulk_update(redirected, ['long_url'],
+                                        batch_size=1000)
+                for start in range(0, len(removed), 1000):
+                    Url.objects.filter(pk__in=[
+                        pk for pk, _ in removed[start:start + 1000]
+                    ]).delete()
+            for code in [code for _, code in removed] + [
+                    url.short_id for url in redirected]:
+                forget(code)
+        self.stdout.write(self.style.SUCCESS(
+            f'Кодов перенесено в рецепты: {len(adopted)}, '
+            f'старых кодов ведут на рецепт: {len(redirected)}'))
@@ -0,0 +1,268 @@
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.utils import batched
+from users.models import Subscribe
+
+User = get_user_model()
+
+IMAGE = 'recipes/image/generated.png'
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+COPY_NULL = '\\N'
+
+
+@contextmanager
+def keep_auto_now_add(model):
+    """Не даёт auto_now_add перезаписать сгенерированные даты."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических данных: пользователи, рецепты, '
+            'избранное, корзины и подписки со скошенным распределением '
+            'популярности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=float, default=10,
+                            help='Среднее число избранных рецептов')
+        parser.add_argument('--carts-per-user', type=float, default=3,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--follows-per-user', type=float, default=5,
+                            help='Среднее число подписок')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней публикуются рецепты')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--password', default=None,
+                            help='Пароль всех пользователей, по умолчанию '
+                                 'вход запрещён')
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс username и email')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql'
+        started = time.monotonic()
+
+        ingredient_ids = self.ingredient_ids()
+        tag_ids = self.tag_ids()
+        user_ids = self.create_users(options)
+        if not user_ids:
+            raise CommandError('Нужен хотя бы один пользователь')
+        author_weights = self.zipf_weights(len(user_ids), options['skew'])
+        recipe_ids = self.create_recipes(user_ids, author_weights, options)
+        self.create_recipe_relations(recipe_ids, ingredient_ids, tag_ids,
+                                     options['ingredients_per_recipe'])
+
+        self.rng.shuffle(recipe_ids)
+        recipe_weights = self.zipf_weights(len(recipe_ids), options['skew'])
+        self.insert(Favorite, (
+            {'user_id': user_id, 'recipe_id': recipe_id}
+            for user_id in user_ids
+            for recipe_id in self.sample(
+                recipe_ids, recipe_weights, options['favorites_per_user'])
+        ))
+        self.insert(ShoppingCart, (
+            {'user_id': user_id, 'recipe_id': recipe_id}
+            for user_id in user_ids
+            for recipe_id in self.sample(
+                recipe_ids, recipe_weights, options['carts_per_user'])
+        ))
+        followees = user_ids[:]
+        self.rng.shuffle(followees)
+        follow_weights = self.zipf_weights(len(followees), options['skew'])
+        self.insert(Subscribe, (
+            {'follower_id': user_id, 'following_id': following_id}
+            for user_id in user_ids
+            for following_id in self.sample(
+                followees, follow_weights, options['follows_per_user'],
+                exclude=user_id)
+        ))
+        call_command('rebuild_shopping_lists')
+        call_command('rebuild_timelines')
+        call_command('rebuild_search_index')
+        call_command('rebuild_pantry_index')
+        call_command('build_similar_recipes')
+        call_command('recount_counters')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    @staticmethod
+    def zipf_weights(size, skew):
+        return list(accumulate(
+            1 / rank ** skew for rank in range(1, size + 1)))
+
+    def sample(self, population, cum_weights, mean, exclude=None):
+        """Выборка без повторов с весами, размер — экспоненциальный."""
+        size = min(int(self.rng.expovariate(1 / mean)) if mean else 0,
+                   len(population) - 1)
+        chosen = set()
+        for _ in range(3):
+            chosen.update(self.rng.choices(
+                population, cum_weights=cum_weights, k=size - len(chosen)))
+            chosen.discard(exclude)
+            if len(chosen) >= size:
+                break
+        return sorted(chosen)
+
+    def ingredient_ids(self):
+        ids = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+        if not ids:
+            raise CommandError(
+                'Справочник ингредиентов пуст, выполните add_ingrs')
+        return ids
+
+    def tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS)
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    def create_users(self, options):
+        first_id = self.next_id(User)
+        ids = list(range(first_id, first_id + options['users']))
+        password = make_password(options['password'])
+        prefix = options['prefix']
+        joined = timezone.now()
+        self.insert(User, (
+            {
+                'id': user_id,
+                'username': f'{prefix}{user_id}',
+                'email': f'{prefix}{user_id}@example.com',
+                'first_name': f'Имя{user_id % 997}',
+                'last_name': f'Фамилия{user_id % 991}',
+                'password': password,
+                'date_joined': joined,
+                'avatar': '',
+            } for user_id in ids
+        ))
+        return ids
+
+    def create_recipes(self, user_ids, author_weights, options):
+        first_id = self.next_id(Recipe)
+        count = options['recipes']
+        ids = list(range(first_id, first_id + count))
+        end = timezone.now().replace(hour=0, minute=0, second=0,
+                                     microsecond=0)
+        span = timedelta(days=options['days'])
+        authors = self.rng.choices(user_ids, cum_weights=author_weights,
+                                   k=count)
+        with keep_auto_now_add(Recipe):
+            self.insert(Recipe, (
+                {
+                    'id': recipe_id,
+                    'name': f'Рецепт {recipe_id}',
+                    'text': f'Описание рецепта {recipe_id}',
+                    'author_id': author_id,
+                    'image': IMAGE,
+                    'cooking_time': self.rng.randint(1, 240),
+                    'pub_date': end - span + span * index / count,
+                } for index, (recipe_id, author_id) in enumerate(
+                    zip(ids, authors))
+            ))
+        return ids
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids,
+                                per_recipe):
+        per_recipe = min(per_recipe, len(ingredient_ids))
+        self.insert(RecipeIngredient, (
+            {'recipe_id': recipe_id, 'ingredient_id': ingredient_id,
+             'amount': self.rng.randint(1, 1000)}
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rng.sample(
+                ingredient_ids, self.rng.randint(1, per_recipe))
+        ))
+        RecipeTag = Recipe.tags.through
+        self.insert(RecipeTag, (
+            {'recipe_id': recipe_id, 'tag_id': tag_id}
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, len(tag_ids)))
+        ))
+
+    def insert(self, model, rows):
+        """Вставляет словари значений полей пачками по batch_size."""
+        started = time.monotonic()
+        total = 0
+        with transaction.atomic():
+            for batch in batched(rows, self.batch_size):
+                if self.use_copy:
+                    self.copy(model, batch)
+                else:
+                    model.objects.bulk_create(model(**row) for row in batch)
+                total += len(batch)
+            if self.use_copy:
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), [model]):
+                        cursor.execute(sql)
+        self.stdout.write(
+            f'{model._meta.db_table}: {total} строк '
+            f'за {time.monotonic() - started:.1f} с')
+
+    def copy(self, model, rows):
+        fields = [field for field in model._meta.concrete_fields
+                  if field.attname in rows[0] or not field.primary_key]
+        now = timezone.now()
+        defaults = {
+            field.attname: field.get_db_prep_save(
+                now if getattr(field, 'auto_now', False)
+                else field.get_default(), connection)
+            for field in fields if field.attname not in rows[0]
+        }
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                COPY_NULL if value is None else value
+                for value in (row.get(field.attname, defaults.get(
+                    field.attname)) for field in fields)
+            ])
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column)
+                            for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+                f'({columns}) FROM STDIN '
+                f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer
+            )
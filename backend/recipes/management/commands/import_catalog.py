@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.autocomplete import ingredient_index
+from recipes.models import Ingredient, Tag
+from recipes.utils import batched
+
+# имя справочника: (модель, поля в порядке колонок CSV)
+CATALOGS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+    'tags': (Tag, ('name', 'slug')),
+}
+CHUNK_SIZE = 1 << 16
+JSON_SEPARATORS = '], \t\r\n'
+MAX_RECORD_SIZE = 1 << 20
+SHOWN_ERRORS = 10
+SHOWN_RECORD_SIZE = 80
+
+# Запись, которую не удалось прочитать, и причина.
+Invalid = namedtuple('Invalid', 'raw message')
+
+
+def read_csv(file, fields):
+    for line, row in enumerate(csv.reader(file), 1):
+        if line == 1 and tuple(row) == fields:
+            continue
+        yield line, (dict(zip(fields, row)) if len(row) == len(fields)
+                     else Invalid(row, 'неверное число полей'))
+
+
+def json_record(item):
+    return item if isinstance(item, dict) else Invalid(
+        item, 'запись должна быть объектом')
+
+
+def read_json_lines(file, fields):
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json_record(json.loads(text))
+        except ValueError:
+            yield line, Invalid(text.strip(), 'повреждённый JSON')
+
+
+def skip_record(text, position, state):
+    """Ищет конец испорченной записи: запятую или ] на нулевой глубине.
+
+    Возвращает индекс конца или None и состояние разбора, с которым
+    поиск продолжается в следующем куске файла.
+    """
+    depth, in_string, escaped = state
+    for index in range(position, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]' and depth:
+            depth -= 1
+        elif char in ',]' and not depth:
+            return index, None
+    return None, (depth, in_string, escaped)
+
+
+def read_json(file, fields):
+    """Читает массив объектов, не загружая файл целиком.
+
+    Запись, которая не разбирается или длиннее MAX_RECORD_SIZE,
+    считается ошибочной, и чтение продолжается со следующей.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    position = 1 if buffer.startswith('[') else 0
+    number = 0
+    skipping = None
+    finished = False
+    while True:
+        while True:
+            if skipping:
+                end, skipping = skip_record(buffer, position, skipping)
+                position = len(buffer) if end is None else end
+            while (position < len(buffer)
+                   and buffer[position] in JSON_SEPARATORS):
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not finished and (len(buffer) - position
+                                     < MAX_RECORD_SIZE):
+                    break
+                number += 1
+                yield number, Invalid(
+                    buffer[position:position + SHOWN_RECORD_SIZE],
+                    'повреждённый JSON')
+                skipping = (0, False, False)
+                continue
+            number += 1
+            yield number, json_record(item)
+        if finished:
+            return
+        chunk = file.read(CHUNK_SIZE)
+        finished = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+READERS = {'.csv': read_csv, '.json': read_json,
+           '.jsonl': read_json_lines}
+
+
+class Command(BaseCommand):
+    help = ('Потоковая загрузка справочника ингредиентов или тегов из CSV '
+            'или JSON пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path)
+        parser.add_argument('--catalog', choices=CATALOGS,
+                            default='ingredients')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Загрузить в транзакции и откатить её')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        model, fields = CATALOGS[options['catalog']]
+        reader = READERS.get(options['path'].suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются файлы .csv, .json и .jsonl')
+        self.model, self.fields = model, fields
+        self.model_fields = [model._meta.get_field(name) for name in fields]
+        self.invalid = self.duplicates = 0
+        self.verbosity = options['verbosity']
+        try:
+            file = open(options['path'], encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with file, transaction.atomic():
+            valid = self.valid_rows(reader(file, fields))
+            if connection.vendor == 'postgresql':
+                added, valid_count = self.copy_upsert(
+                    valid, options['batch_size'])
+            else:
+                added, valid_count = self.bulk_insert(
+                    valid, options['batch_size'])
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            elif added and model is Ingredient:
+                transaction.on_commit(ingredient_index.invalidate)
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: '
+            f'{"будет добавлено" if options["dry_run"] else "добавлено"} '
+            f'{added}, пропущено {valid_count - added}, '
+            f'с ошибками {self.invalid} '
+            f'за {time.monotonic() - started:.1f} с'))
+
+    def valid_rows(self, items):
+        """Чистит строки полями модели и пропускает повторы внутри файла."""
+        seen = set()
+        for line, item in items:
+            if isinstance(item, Invalid):
+                self.report(line, item.raw, ValidationError(item.message))
+                continue
+            try:
+                row = tuple(
+                    field.clean(str(item.get(field.name) or '').strip(),
+                                None)
+                    for field in self.model_fields
+                )
+            except ValidationError as error:
+                self.report(line, item, error)
+                continue
+            if row not in seen:
+                seen.add(row)
+                yield row
+            else:
+                self.duplicates += 1
+
+    def report(self, line, item, error):
+        self.invalid += 1
+        if self.invalid <= SHOWN_ERRORS or self.verbosity > 1:
+            self.stderr.write(f'Запись {line}: {item!r}: '
+                              f'{"; ".join(error.messages)}')
+
+    def bulk_insert(self, rows, batch_size):
+        before = self.model.objects.count()
+        total = 0
+        for batch in batched(rows, batch_size):
+            self.model.objects.bulk_create(
+                (self.model(**dict(zip(self.fields, row))) for row in batch),
+                ignore_conflicts=True)
+            total += len(batch)
+        return (self.model.objects.count() - before,
+                total + self.duplicates)
+
+    def copy_upsert(self, rows, batch_size):
+        """COPY во временную таблицу и вставка без конфликтов оттуда."""
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = ', '.join(quote(field.column)
+                            for field in self.model_fields)
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE catalog_staging ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA')
+            for batch in batched(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY catalog_staging ({columns}) FROM STDIN '
+                    f'WITH (FORMAT csv)', buffer)
+                total += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM catalog_staging '
+                f'ON CONFLICT DO NOTHING')
+            added = cursor.rowcount
+            cursor.execute('DROP TABLE catalog_staging')
+        return added, total + self.duplicates
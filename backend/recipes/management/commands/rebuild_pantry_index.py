@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.constants import PANTRY_LOG_KEEP
+from recipes.models import PantryChange
+
+
+class Command(BaseCommand):
+    help = ('Просит процессы пересобрать индекс подбора рецептов '
+            'и чистит старый журнал изменений')
+
+    def handle(self, *args, **options):
+        deleted, _ = PantryChange.objects.filter(
+            changed_at__lt=timezone.now() - timedelta(seconds=PANTRY_LOG_KEEP)
+        ).delete()
+        PantryChange.objects.log_rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс будет пересобран, удалено записей журнала: {deleted}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import update_index
+
+
+class Command(BaseCommand):
+    help = 'Пересборка полнотекстового индекса рецептов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = update_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран: {count} рецептов'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Проверка и пересборка списков покупок по корзинам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сравнить с корзинами')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = list(self.drift())
+            users = {user_id for user_id, _ in drift}
+            if drift:
+                raise CommandError(
+                    f'Расхождений: {len(drift)} у {len(users)} пользователей')
+            if options['verbosity']:
+                self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            count = ShoppingListItem.objects.insert_from(
+                ShoppingListItem.objects.source())
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересобраны: {count} строк'))
+
+    def drift(self):
+        """Сливает отсортированные выборки и отдаёт несовпавшие ключи."""
+        source = ShoppingListItem.objects.source().iterator()
+        stored = ShoppingListItem.objects.order_by(
+            'user_id', 'ingredient_id'
+        ).values_list('user_id', 'ingredient_id', 'total_amount').iterator()
+        expected, actual = next(source, None), next(stored, None)
+        while expected or actual:
+            if actual is None or (expected
+                                  and expected[:2] < actual[:2]):
+                yield expected[:2]
+                expected = next(source, None)
+            elif expected is None or actual[:2] < expected[:2]:
+                yield actual[:2]
+                actual = next(stored, None)
+            else:
+                if expected[2] != actual[2]:
+                    yield expected[:2]
+                expected, actual = next(source, None), next(stored, None)
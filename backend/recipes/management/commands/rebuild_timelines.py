@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок по подпискам и рецептам'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            count = TimelineEntry.objects.insert_from(
+                TimelineEntry.objects.source())
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Ленты пересобраны: {count} строк'))
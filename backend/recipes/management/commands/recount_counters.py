@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from recipes.signals import COUNTERS
+from recipes.versions import GLOBAL, bump
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, корзин, рецептов и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только найти расхождения')
+
+    def report(self, message):
+        if self.verbosity:
+            self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        found = fixed = 0
+        for source, relation, target, field in COUNTERS:
+            actual = Coalesce(Subquery(
+                source.objects.filter(
+                    **{relation: OuterRef('pk')}
+                ).order_by().values(relation).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ), 0)
+            drifting = target.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')})
+            count = drifting.count()
+            if not count:
+                continue
+            found += count
+            self.report(
+                f'{target._meta.model_name}.{field}: расхождений {count}')
+            if not options['check']:
+                fixed += target.objects.filter(
+                    pk__in=drifting.values('pk')
+                ).update(**{field: actual, 'updated_at': timezone.now()})
+        if found and options['check']:
+            raise CommandError(f'Счётчики расходятся: {found}')
+        if fixed:
+            bump(GLOBAL)
+            self.report(self.style.SUCCESS(f'Исправлено строк: {fixed}'))
+        else:
+            self.report(self.style.SUCCESS('Счётчики в порядке'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import TIERS, response_cache
+
+
+class Command(BaseCommand):
+    help = 'Доля попаданий кеша ответов рецептов по всем процессам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = response_cache.stats
+        counts = stats.shared()
+        ratios = stats.ratios(counts)
+        for tier in TIERS:
+            self.stdout.write(f'{tier}: {counts[tier]} ({ratios[tier]:.1%})')
+        if options['reset']:
+            stats.reset()
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_code',
+            field=models.SlugField(blank=True, editable=False, max_length=8, null=True, unique=True, verbose_name='Короткий код ссылки'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorTrendEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author_id', models.PositiveIntegerField(verbose_name='Автор')),
+                ('weight', models.FloatField(verbose_name='Вес')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата события')),
+            ],
+            options={
+                'verbose_name': 'Событие рейтинга автора',
+                'verbose_name_plural': 'События рейтинга авторов',
+                'ordering': ('id',),
+            },
+        ),
+    ]
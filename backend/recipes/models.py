@@ -1,11 +1,25 @@
+import time
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, Value, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
 from .constants import (
-    COOKING_TIME, INGREDIENT_AMOUNT,
+    COOKING_TIME, FEED_FANOUT_LIMIT, INGREDIENT_AMOUNT,
     INGRS_NAME_LENGTH, MEASUREMENTS,
-    RECIPE_NAME_LENGTH, TAG_NAME_LENGTH, TAG_SLUG)
+    RECIPE_NAME_LENGTH, SHORT_CODE_LENGTH, TAG_NAME_LENGTH, TAG_SLUG,
+    TRENDING_CART_WEIGHT, TRENDING_FAVORITE_WEIGHT)
+from .storage import content_storage
+from .trending import change as trending_change, contribution, withdraw
+from .user_state import invalidate as invalidate_user_state
+from .utils import returned_datetime
+from .versions import bump, recipe_key
+
+from users.models import Subscribe
 
 User = get_user_model()
 
@@ -50,6 +64,32 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def top_by_author(self, author_ids, limit):
+        """Первые limit рецептов каждого автора одним запросом.
+
+        Возвращает словарь {author_id: [рецепты]} в порядке Meta.ordering.
+        """
+        ranked = self.filter(author_id__in=author_ids).order_by().annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').asc()],
+            )
+        ).values('id', 'name', 'image', 'image_variants', 'cooking_time',
+                 'author_id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        recipes = {author_id: [] for author_id in author_ids}
+        for recipe in self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            'ORDER BY author_id, recipe_rank',
+            (*params, limit)
+        ):
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=RECIPE_NAME_LENGTH,
@@ -76,8 +116,23 @@ class Recipe(models.Model):
         verbose_name='Теги')
     image = models.ImageField(
         upload_to='recipes/image',
+        storage=content_storage,
         verbose_name='Картинка'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
+    short_code = models.SlugField(
+        max_length=SHORT_CODE_LENGTH,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Короткий код ссылки'
+    )
     cooking_time = models.PositiveSmallIntegerField(
         validators=[validators.MinValueValidator(
             COOKING_TIME,
@@ -89,11 +144,43 @@ class Recipe(models.Model):
         auto_now_add=True,
         null=True
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В корзинах'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг в тренде'
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', 'id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', 'id'],
+                         name='recipe_author_pub_date_id_idx'),
+            models.Index(fields=['-trending_score', '-pub_date', 'id'],
+                         name='recipe_trending_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
@@ -132,6 +219,125 @@ class RecipeIngredient(models.Model):
         return f'{self.recipe} {self.ingredient}'
 
 
+class InsertFromManager(models.Manager):
+
+    def insert_from(self, source, returning=None):
+        """INSERT ... SELECT без дублей из values() с полями записи.
+
+        Возвращает число вставленных строк или, если задана колонка
+        returning, её значения во вставленных строках.
+        """
+        query = source.query
+        sql, params = query.sql_with_params()
+        # Порядок колонок в SQL: поля values(), затем аннотации.
+        columns = ', '.join(
+            connection.ops.quote_name(column)
+            for column in (*query.values_select, *query.annotation_select)
+        )
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        suffix = connection.ops.ignore_conflicts_suffix_sql(True)
+        if returning:
+            suffix += f' RETURNING {connection.ops.quote_name(returning)}'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+                f'{table} ({columns}) {sql} {suffix}',
+                params
+            )
+            if returning:
+                return [row[0] for row in cursor.fetchall()]
+            return cursor.rowcount
+
+
+class UserRecipeManager(InsertFromManager):
+    """Пакетное добавление и удаление рецептов пользователя.
+
+    Сигналы при этом не срабатывают, поэтому счётчик и рейтинг рецепта
+    обновляются здесь же одним запросом, а множества id пользователя
+    в кеше (recipes.user_state) сбрасываются после коммита.
+    """
+
+    counter = None
+    trending_weight = None
+
+    def change_counter(self, recipe_ids, delta, trending_score):
+        queryset = Recipe.objects.filter(id__in=recipe_ids)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{self.counter}__gte': -delta})
+        queryset.update(**{
+            self.counter: F(self.counter) + delta,
+            'trending_score': trending_score,
+            'updated_at': timezone.now()})
+        bump(*map(recipe_key, recipe_ids))
+
+    def add_many(self, user_id, recipe_ids):
+        """Добавляет существующие рецепты и возвращает id новых записей."""
+        added = self.insert_from(
+            Recipe.objects.filter(id__in=recipe_ids).order_by().values(
+                recipe_id=F('id'), user_id=Value(user_id),
+                created_at=Value(timezone.now(),
+                                 output_field=models.DateTimeField())),
+            returning='recipe_id')
+        if added:
+            self.change_counter(added, 1,
+                                trending_change(self.trending_weight))
+            invalidate_user_state(user_id)
+        return added
+
+    def remove_many(self, user_id, recipe_ids):
+        """Удаляет записи одним DELETE и возвращает id удалённых.
+
+        Вклад в рейтинг снимается с учётом того, когда рецепт добавлен.
+        """
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return []
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(opts.db_table)} '
+                f'WHERE {quote(opts.get_field("user").column)} = %s '
+                f'AND {quote(opts.get_field("recipe").column)} IN '
+                f'({", ".join(["%s"] * len(recipe_ids))}) '
+                f'RETURNING {quote(opts.get_field("recipe").column)}, '
+                f'{quote(opts.get_field("created_at").column)}',
+                [user_id, *recipe_ids]
+            )
+            removed = {recipe_id: returned_datetime(created_at)
+                       for recipe_id, created_at in cursor.fetchall()}
+        if removed:
+            now = time.time()
+            self.change_counter(removed, -1, withdraw({
+                recipe_id: contribution(self.trending_weight, created_at, now)
+                for recipe_id, created_at in removed.items()
+            }, now))
+            invalidate_user_state(user_id)
+        return list(removed)
+
+
+class FavoriteManager(UserRecipeManager):
+    counter = 'favorites_count'
+    trending_weight = TRENDING_FAVORITE_WEIGHT
+
+
+class ShoppingCartManager(UserRecipeManager):
+    """Вместе с корзиной меняет и готовый список покупок."""
+
+    counter = 'in_carts_count'
+    trending_weight = TRENDING_CART_WEIGHT
+
+    def add_many(self, user_id, recipe_ids):
+        added = super().add_many(user_id, recipe_ids)
+        ShoppingListItem.objects.change_recipes(user_id, added, 1)
+        return added
+
+    def remove_many(self, user_id, recipe_ids):
+        removed = super().remove_many(user_id, recipe_ids)
+        ShoppingListItem.objects.change_recipes(user_id, removed, -1)
+        return removed
+
+
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
@@ -146,6 +352,12 @@ class ShoppingCart(models.Model):
         related_name='shopping_carts',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now
+    )
+
+    objects = ShoppingCartManager()
 
     class Meta:
         verbose_name = 'Корзина',
@@ -174,6 +386,12 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Избранный рецепт'
     )
+    created_at = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now
+    )
+
+    objects = FavoriteManager()
 
     class Meta:
         ordering = ('user',)
@@ -186,3 +404,358 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Избранное'
+
+
+class ShoppingListManager(InsertFromManager):
+    """Инкрементальное обновление сумм ингредиентов в списках покупок."""
+
+    def apply(self, user_ids, deltas):
+        deltas = {ingredient_id: delta
+                  for ingredient_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        self.bulk_create(
+            (self.model(user_id=user_id, ingredient_id=ingredient_id)
+             for user_id in user_ids
+             for ingredient_id, delta in deltas.items() if delta > 0),
+            ignore_conflicts=True
+        )
+        items = self.filter(user_id__in=user_ids,
+                            ingredient_id__in=deltas.keys())
+        # Вычитание не уходит ниже нуля, даже если список уже разошёлся
+        # с корзинами.
+        items.update(total_amount=Greatest(
+            models.F('total_amount') + models.Case(
+                *(models.When(ingredient_id=ingredient_id, then=delta)
+                  for ingredient_id, delta in deltas.items()),
+                default=0),
+            0))
+        if min(deltas.values()) < 0:
+            items.filter(total_amount__lte=0).delete()
+
+    def change_recipes(self, user_id, recipe_ids, sign):
+        """Добавляет (sign=1) или вычитает (-1) рецепты из списка."""
+        if not recipe_ids:
+            return
+        self.apply([user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values('ingredient_id').annotate(
+                total=models.Sum('amount')
+            ).values_list('ingredient_id', 'total')
+        })
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Переносит правку ингредиентов рецепта в списки его корзин."""
+        deltas = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        self.apply(ShoppingCart.objects.filter(
+            recipe_id=recipe_id).order_by().values_list('user_id', flat=True),
+            deltas)
+
+    def source(self):
+        """Суммы из исходных таблиц, по которым строится список."""
+        return RecipeIngredient.objects.filter(
+            recipe__shopping_carts__user__isnull=False
+        ).values(
+            'ingredient_id',
+            user_id=models.F('recipe__shopping_carts__user'),
+        ).annotate(
+            total_amount=models.Sum('amount')
+        ).values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        ).order_by('user_id', 'ingredient_id')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        ordering = ('user',)
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'ingredient'),
+                                    name='user_ingredient_shopping_list'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.total_amount}'
+
+
+class TimelineManager(InsertFromManager):
+    """Лента подписок: рецепты раскладываются подписчикам при публикации.
+
+    Рецепты авторов, у которых больше FEED_FANOUT_LIMIT подписчиков,
+    в ленты не пишутся и подмешиваются при чтении.
+    """
+
+    @staticmethod
+    def is_celebrity(author):
+        return author.followers_count > FEED_FANOUT_LIMIT
+
+    def fan_out(self, recipe):
+        if self.is_celebrity(recipe.author):
+            return 0
+        return self.insert_from(Subscribe.objects.filter(
+            following_id=recipe.author_id
+        ).order_by().values(
+            user_id=F('follower_id'),
+            recipe_id=Value(recipe.id),
+            author_id=Value(recipe.author_id),
+            pub_date=Value(recipe.pub_date,
+                           output_field=models.DateTimeField()),
+        ))
+
+    def backfill(self, user_id, author):
+        if self.is_celebrity(author):
+            return 0
+        return self.insert_from(Recipe.objects.filter(
+            author=author
+        ).order_by().values(
+            'author_id', 'pub_date',
+            recipe_id=F('id'),
+            user_id=Value(user_id),
+        ))
+
+    def prune(self, user_id, author_id):
+        return self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def source(self):
+        """Все записи лент, которые должны быть по текущим подпискам."""
+        return Subscribe.objects.filter(
+            following__followers_count__lte=FEED_FANOUT_LIMIT,
+            following__recipes__isnull=False,
+        ).order_by().values(
+            user_id=F('follower_id'),
+            recipe_id=F('following__recipes__id'),
+            author_id=F('following_id'),
+            pub_date=F('following__recipes__pub_date'),
+        )
+
+    def feed_sources(self, user):
+        """Записи ленты и рецепты знаменитостей, на которых подписан user.
+
+        Обе выборки отдают pub_date и recipe_id для слияния.
+        """
+        return (
+            self.filter(user=user),
+            Recipe.objects.filter(author_id__in=Subscribe.objects.filter(
+                follower=user,
+                following__followers_count__gt=FEED_FANOUT_LIMIT,
+            ).values('following_id')).annotate(recipe_id=F('id')),
+        )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = TimelineManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('user', '-pub_date', 'recipe')
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='user_recipe_timeline'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', 'recipe'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class MediaBlobManager(models.Manager):
+    """Счётчики ссылок на файлы картинок из рецептов и аватаров."""
+
+    def change(self, name, delta):
+        if not name or not delta:
+            return
+        queryset = self.filter(name=name)
+        if delta < 0:
+            queryset.filter(refcount__gte=-delta).update(
+                refcount=F('refcount') + delta, updated_at=timezone.now())
+            return
+        if not queryset.update(refcount=F('refcount') + delta,
+                               updated_at=timezone.now()):
+            self.bulk_create([self.model(name=name)], ignore_conflicts=True)
+            queryset.update(refcount=F('refcount') + delta,
+                            updated_at=timezone.now())
+
+
+class MediaBlob(models.Model):
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок'
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        verbose_name = 'Файл медиа'
+        verbose_name_plural = 'Файлы медиа'
+        ordering = ('name',)
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'],
+                         name='mediablob_refcount_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+
+class PantryChangeManager(models.Manager):
+    """Журнал изменений состава рецептов для индексов в памяти."""
+
+    def log(self, *recipe_ids):
+        self.bulk_create(self.model(recipe_id=recipe_id)
+                         for recipe_id in recipe_ids)
+
+    def log_rebuild(self):
+        """Просит все процессы пересобрать индекс целиком."""
+        self.log(None)
+
+
+class PantryChange(models.Model):
+    recipe_id = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Рецепт'
+    )
+    changed_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = PantryChangeManager()
+
+    class Meta:
+        verbose_name = 'Изменение состава рецепта'
+        verbose_name_plural = 'Изменения состава рецептов'
+        ordering = ('changed_at',)
+
+    def __str__(self):
+        return f'{self.recipe_id or "все рецепты"}, {self.changed_at}'
+
+
+class AuthorTrendEvent(models.Model):
+    """Подписка или отписка, ещё не перенесённая в рейтинг рецептов.
+
+    Переносит команда decay_trending одним UPDATE на автора.
+    """
+
+    author_id = models.PositiveIntegerField(
+        verbose_name='Автор'
+    )
+    weight = models.FloatField(
+        verbose_name='Вес'
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата события'
+    )
+
+    class Meta:
+        verbose_name = 'Событие рейтинга автора'
+        verbose_name_plural = 'События рейтинга авторов'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.author_id}: {self.weight:+}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        db_index=False,
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name='Место'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+    computed_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата расчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', 'rank')
+        constraints = [
+            models.UniqueConstraint(fields=('recipe', 'rank'),
+                                    name='unique_similar_recipe_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} → {self.similar_id} ({self.score:.3f})'
@@ -0,0 +1,278 @@
+"""Подбор рецептов по ингредиентам, которые есть у пользователя.
+
+Обратный индекс в памяти процесса: ингредиент → рецепты с ним. Частые
+ингредиенты хранятся битовыми масками (целое Python, бит N — рецепт
+с id N), редкие — отсортированными массивами id. Совпадения по набору
+ингредиентов считаются поразрядным сложением масок: плоскость i хранит
+i-й бит числа совпадений каждого рецепта. Все операции идут над целыми
+масками, поэтому запрос стоит O(k · N / 64) машинных слов на k
+ингредиентов и не перебирает строки recipe_ingredients.
+
+Изменения состава рецептов пишутся в PantryChange. Каждый процесс раз
+в PANTRY_INDEX_RELOAD секунд дочитывает журнал с запасом
+PANTRY_LOG_OVERLAP секунд на долгие транзакции и обновляет только
+изменённые рецепты.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .constants import PANTRY_DENSE_MIN, PANTRY_LOG_KEEP, PANTRY_LOG_OVERLAP
+from .models import PantryChange, RecipeIngredient
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def to_bits(recipe_ids):
+    if not recipe_ids:
+        return 0
+    buffer = bytearray((max(recipe_ids) >> 3) + 1)
+    for recipe_id in recipe_ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def equal(planes, value, universe):
+    """Рецепты из universe, у которых счётчик в planes равен value."""
+    if value >> len(planes):
+        return 0
+    for level, plane in enumerate(planes):
+        universe &= plane if value >> level & 1 else ~plane
+        if not universe:
+            break
+    return universe
+
+
+def take(mask, skip, limit):
+    """Id из маски от больших к меньшим: пропускает skip, берёт limit."""
+    found = []
+    while mask and len(found) < limit:
+        top = mask.bit_length() - 1
+        mask ^= 1 << top
+        if skip:
+            skip -= 1
+        else:
+            found.append(top)
+    return found
+
+
+class Match:
+    """Подобранные рецепты как последовательность (id, совпало, всего).
+
+    Сначала рецепты с большей долей имеющихся ингредиентов, при равной
+    доле — с меньшим числом недостающих, затем новые. Поддерживает len()
+    и срезы, поэтому страницы режет обычный Paginator.
+    """
+
+    def __init__(self, planes, size_masks):
+        self.planes = planes
+        found = 0
+        for plane in planes:
+            found |= plane
+        self.size_masks = {size: mask & found
+                           for size, mask in size_masks.items()
+                           if mask & found}
+        groups = {}
+        for size in self.size_masks:
+            for matched in range(1, size + 1):
+                groups.setdefault(
+                    (-matched / size, size - matched), []).append(
+                        (matched, size))
+        self.groups = [(key[1], groups[key]) for key in sorted(groups)]
+        self.count = popcount(found)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.count)
+        skip, limit = start, stop - start
+        rows = []
+        for missing, group in self.groups:
+            if limit <= 0:
+                break
+            masks = {size: equal(self.planes, matched, self.size_masks[size])
+                     for matched, size in group}
+            mask = 0
+            for part in masks.values():
+                mask |= part
+            count = popcount(mask)
+            if skip >= count:
+                skip -= count
+                continue
+            recipe_ids = take(mask, skip, limit)
+            skip, limit = 0, limit - len(recipe_ids)
+            for recipe_id in recipe_ids:
+                size = next(size for size, part in masks.items()
+                            if part >> recipe_id & 1)
+                rows.append((recipe_id, size - missing, size))
+        return rows
+
+
+class PantryIndex:
+    """Обратный индекс ингредиентов и состав каждого рецепта."""
+
+    def __init__(self, rows):
+        """rows — пары (recipe_id, ingredient_id) по возрастанию recipe_id."""
+        self.recipe_ids = array('I')
+        self.starts = array('I', [0])
+        self.flat = array('I')
+        self.changed = {}
+        postings, sizes = {}, {}
+        for recipe_id, group in groupby(rows, itemgetter(0)):
+            ingredients = sorted({ingredient_id for _, ingredient_id in group})
+            self.recipe_ids.append(recipe_id)
+            self.flat.extend(ingredients)
+            self.starts.append(len(self.flat))
+            sizes.setdefault(len(ingredients), array('I')).append(recipe_id)
+            for ingredient_id in ingredients:
+                postings.setdefault(ingredient_id, array('I')).append(
+                    recipe_id)
+        self.dense_from = max(
+            PANTRY_DENSE_MIN,
+            (self.recipe_ids[-1] if self.recipe_ids else 0) // 32)
+        self.postings = {
+            ingredient_id: (to_bits(posting)
+                            if len(posting) >= self.dense_from else posting)
+            for ingredient_id, posting in postings.items()
+        }
+        self.size_masks = {size: to_bits(recipe_ids)
+                           for size, recipe_ids in sizes.items()}
+
+    def ingredients(self, recipe_id):
+        if recipe_id in self.changed:
+            return self.changed[recipe_id]
+        index = bisect_left(self.recipe_ids, recipe_id)
+        if (index < len(self.recipe_ids)
+                and self.recipe_ids[index] == recipe_id):
+            return self.flat[self.starts[index]:self.starts[index + 1]]
+        return ()
+
+    def add(self, ingredient_id, recipe_id):
+        posting = self.postings.get(ingredient_id)
+        if posting is None:
+            self.postings[ingredient_id] = array('I', [recipe_id])
+        elif isinstance(posting, int):
+            self.postings[ingredient_id] = posting | 1 << recipe_id
+        else:
+            index = bisect_left(posting, recipe_id)
+            if index == len(posting) or posting[index] != recipe_id:
+                posting.insert(index, recipe_id)
+            if len(posting) >= self.dense_from:
+                self.postings[ingredient_id] = to_bits(posting)
+
+    def discard(self, ingredient_id, recipe_id):
+        posting = self.postings.get(ingredient_id)
+        if isinstance(posting, int):
+            posting &= ~(1 << recipe_id)
+            self.postings[ingredient_id] = posting
+        elif posting is not None:
+            index = bisect_left(posting, recipe_id)
+            if index < len(posting) and posting[index] == recipe_id:
+                del posting[index]
+        if not posting:
+            self.postings.pop(ingredient_id, None)
+
+    def resize(self, recipe_id, old_size, new_size):
+        if old_size == new_size:
+            return
+        if old_size:
+            mask = self.size_masks.pop(old_size, 0) & ~(1 << recipe_id)
+            if mask:
+                self.size_masks[old_size] = mask
+        if new_size:
+            self.size_masks[new_size] = (
+                self.size_masks.get(new_size, 0) | 1 << recipe_id)
+
+    def update(self, recipe_id, ingredients):
+        """Заменяет состав рецепта; пустой состав убирает его из индекса."""
+        old, new = set(self.ingredients(recipe_id)), set(ingredients)
+        for ingredient_id in old - new:
+            self.discard(ingredient_id, recipe_id)
+        for ingredient_id in new - old:
+            self.add(ingredient_id, recipe_id)
+        self.resize(recipe_id, len(old), len(new))
+        self.changed[recipe_id] = tuple(sorted(new))
+
+    def match(self, ingredient_ids):
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            posting = self.postings.get(ingredient_id)
+            if not posting:
+                continue
+            carry = posting if isinstance(posting, int) else to_bits(posting)
+            for level, plane in enumerate(planes):
+                planes[level], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        return Match(planes, self.size_masks)
+
+
+class SharedPantryIndex:
+    """Индекс процесса, догоняющий журнал PantryChange."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.index = None
+        self.built_at = self.seen_at = None
+        self.applied = set()
+        self.checked = 0
+
+    def match(self, ingredient_ids):
+        with self.lock:
+            self.refresh()
+            return self.index.match(ingredient_ids)
+
+    def build(self, started):
+        self.index = PantryIndex(
+            RecipeIngredient.objects.order_by('recipe_id').values_list(
+                'recipe_id', 'ingredient_id').iterator(chunk_size=10000))
+        self.built_at = self.seen_at = started
+        self.applied = set()
+
+    def refresh(self):
+        now = time.monotonic()
+        if (self.index is not None
+                and now - self.checked < settings.PANTRY_INDEX_RELOAD):
+            return
+        self.checked = now
+        started = timezone.now()
+        if (self.index is None or started - self.seen_at
+                > timedelta(seconds=PANTRY_LOG_KEEP)):
+            return self.build(started)
+        changes = PantryChange.objects.filter(
+            changed_at__gte=self.seen_at - timedelta(
+                seconds=PANTRY_LOG_OVERLAP)
+        ).values_list('id', 'recipe_id', 'changed_at')
+        recipe_ids, applied = set(), set()
+        for pk, recipe_id, changed_at in changes:
+            applied.add(pk)
+            if recipe_id is None and changed_at >= self.built_at:
+                return self.build(started)
+            if recipe_id is not None and pk not in self.applied:
+                recipe_ids.add(recipe_id)
+        current = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredient_id') if recipe_ids else ():
+            current[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in current.items():
+            self.index.update(recipe_id, ingredients)
+        self.seen_at, self.applied = started, applied
+
+
+pantry_index = SharedPantryIndex()
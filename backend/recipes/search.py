@@ -0,0 +1,137 @@
+"""Полнотекстовый поиск рецептов.
+
+На PostgreSQL ищет по Recipe.search_vector (русская конфигурация,
+GIN-индекс recipe_search_vector_idx), на SQLite — по таблице FTS5
+recipes_recipe_fts. Индекс обновляется сигналом при сохранении
+рецепта; после массовой загрузки его пересобирает команда
+rebuild_search_index.
+"""
+import re
+from html import escape
+
+from django.contrib.postgres.search import (SearchHeadline, SearchQuery,
+                                            SearchRank, SearchVector)
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from .constants import (SEARCH_CONFIG, SEARCH_NAME_WEIGHT,
+                        SEARCH_SNIPPET_WORDS, SEARCH_TEXT_WEIGHT)
+from .models import Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+# Границы совпадения в подсветке, после экранирования становятся <mark>.
+START, STOP = '\x02', '\x03'
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG))
+
+
+def update_index(recipe_ids=None):
+    """Обновляет индекс для recipe_ids или целиком, если они не заданы."""
+    if use_postgres():
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+        return recipes.order_by().update(search_vector=search_vector())
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    insert = (f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text) '
+              f'SELECT id, name, text FROM {table}')
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(insert)
+        else:
+            recipe_ids = list(recipe_ids)
+            if not recipe_ids:
+                return 0
+            cursor.execute(
+                f'{insert} WHERE id IN '
+                f'({", ".join(["%s"] * len(recipe_ids))})', recipe_ids)
+        return cursor.rowcount
+
+
+def remove_from_index(recipe_id):
+    if not use_postgres():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [recipe_id])
+
+
+def match_expression(text):
+    """Запрос FTS5: все слова обязательны, каждое ищется как префикс."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text.lower()))
+
+
+def search(queryset, text):
+    """Оставляет рецепты, подходящие под запрос, лучшие — первыми.
+
+    Релевантность стоит только в ORDER BY, чтобы count и версия списка
+    для ETag не считали её для каждого найденного рецепта.
+    """
+    if use_postgres():
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        rank = SearchRank(F('search_vector'), query)
+        return queryset.filter(search_vector=query).order_by(
+            rank.desc(), '-pub_date', 'id')
+    match = match_expression(text)
+    if not match:
+        return queryset.none()
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,)
+    )).order_by(RawSQL(
+        f'SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+        (SEARCH_NAME_WEIGHT, SEARCH_TEXT_WEIGHT, match),
+        output_field=FloatField()
+    ).asc(), '-pub_date', 'id')
+
+
+def render(fragment):
+    return (escape(fragment or '').replace(START, '<mark>')
+            .replace(STOP, '</mark>'))
+
+
+def highlights(recipe_ids, text):
+    """Словарь {id: {'name': ..., 'text': ...}} с <mark> вокруг совпадений.
+
+    Считается отдельным запросом только для рецептов текущей страницы.
+    """
+    if not recipe_ids:
+        return {}
+    if use_postgres():
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        rows = Recipe.objects.filter(id__in=recipe_ids).order_by().annotate(
+            name_highlight=SearchHeadline(
+                'name', query, config=SEARCH_CONFIG, start_sel=START,
+                stop_sel=STOP, highlight_all=True),
+            text_highlight=SearchHeadline(
+                'text', query, config=SEARCH_CONFIG, start_sel=START,
+                stop_sel=STOP, max_words=SEARCH_SNIPPET_WORDS,
+                min_words=SEARCH_SNIPPET_WORDS // 2),
+        ).values_list('id', 'name_highlight', 'text_highlight')
+    else:
+        match = match_expression(text)
+        if not match:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, highlight({FTS_TABLE}, 0, %s, %s), "
+                f"snippet({FTS_TABLE}, 1, %s, %s, '…', %s) "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"AND rowid IN ({', '.join(['%s'] * len(recipe_ids))})",
+                [START, STOP, START, STOP, SEARCH_SNIPPET_WORDS, match,
+                 *recipe_ids])
+            rows = cursor.fetchall()
+    return {recipe_id: {'name': render(name), 'text': render(snippet)}
+            for recipe_id, name, snippet in rows}
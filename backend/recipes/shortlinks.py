@@ -0,0 +1,119 @@
+"""Короткие ссылки на рецепты.
+
+Код создаётся один раз и хранится в Recipe.short_code. Переход по
+/s/<код>/ разрешается через LRU в памяти процесса и общий кеш Django,
+к базе обращается только первый запрос по коду. Неизвестный код
+ненадолго запоминается в общем кеше, чтобы перебор кодов не доходил
+до базы. Коды, выданные раньше через shortener.Url, продолжают работать.
+"""
+import threading
+from collections import OrderedDict
+
+import shortuuid
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from shortener.models import Url
+
+from .constants import (SHORT_CODE_ATTEMPTS, SHORT_CODE_LENGTH,
+                        SHORT_LINK_CACHE_TIMEOUT, SHORT_LINK_LRU_SIZE,
+                        SHORT_LINK_MISS_TIMEOUT)
+from .models import Recipe
+
+CACHE_PREFIX = 'short-link:'
+# Значение в кеше для кода, которого нет в базе.
+MISSING = ''
+
+
+def recipe_path(recipe_id):
+    return f'/recipes/{recipe_id}/'
+
+
+class LRUCache:
+    """Потокобезопасный LRU ограниченного размера."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+            except KeyError:
+                return None
+            return self.items[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+local_links = LRUCache(SHORT_LINK_LRU_SIZE)
+
+
+def short_code(recipe):
+    """Возвращает код рецепта, создавая его при первом обращении.
+
+    Код занимается условным UPDATE, поэтому параллельные запросы
+    получают один и тот же код, а совпадение с чужим кодом ведёт
+    к новой попытке.
+    """
+    if recipe.short_code:
+        return recipe.short_code
+    queryset = Recipe.objects.filter(pk=recipe.pk)
+    for _ in range(SHORT_CODE_ATTEMPTS):
+        code = shortuuid.uuid()[:SHORT_CODE_LENGTH]
+        if Url.objects.filter(short_id=code).exists():
+            continue
+        try:
+            with transaction.atomic():
+                queryset.filter(short_code__isnull=True).update(
+                    short_code=code)
+        except IntegrityError:
+            continue
+        forget(code)
+        recipe.short_code = queryset.values_list(
+            'short_code', flat=True).get()
+        return recipe.short_code
+    raise RuntimeError('Не удалось подобрать свободный короткий код')
+
+
+def resolve(code):
+    """Путь, на который ведёт код, или None."""
+    path = local_links.get(code)
+    if path is not None:
+        return path
+    path = cache.get(CACHE_PREFIX + code)
+    if path == MISSING:
+        return None
+    if path is None:
+        recipe_id = Recipe.objects.filter(short_code=code).values_list(
+            'id', flat=True).first()
+        if recipe_id is not None:
+            path = recipe_path(recipe_id)
+        else:
+            path = Url.objects.filter(short_id=code).order_by(
+                'id').values_list('long_url', flat=True).first()
+        if path is None:
+            cache.set(CACHE_PREFIX + code, MISSING, SHORT_LINK_MISS_TIMEOUT)
+            return None
+        cache.set(CACHE_PREFIX + code, path, SHORT_LINK_CACHE_TIMEOUT)
+    local_links.set(code, path)
+    return path
+
+
+def forget(code):
+    local_links.discard(code)
+    cache.delete(CACHE_PREFIX + code)
@@ -0,0 +1,333 @@
+from collections import defaultdict
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .autocomplete import ingredient_index
+from .constants import (TRENDING_CART_WEIGHT, TRENDING_FAVORITE_WEIGHT,
+                        TRENDING_SUBSCRIBE_WEIGHT)
+from .images import AVATAR_WIDTHS, RECIPE_IMAGE_WIDTHS, build_variants
+from .models import (AuthorTrendEvent, Favorite, Ingredient, MediaBlob,
+                     PantryChange, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem, Tag)
+from .search import remove_from_index, update_index
+from .shortlinks import forget
+from .trending import change as trending_change, contribution, withdraw
+from .user_state import invalidate as invalidate_user_state
+from .versions import GLOBAL, LIST, author_key, bump, recipe_key
+from users.models import Subscribe
+
+User = get_user_model()
+
+# (модель, поле картинки, ширины уменьшенных копий)
+IMAGE_FIELDS = (
+    (Recipe, 'image', RECIPE_IMAGE_WIDTHS),
+    (User, 'avatar', AVATAR_WIDTHS),
+)
+
+# (модель-источник, поле связи, модель со счётчиком, поле счётчика)
+COUNTERS = (
+    (Favorite, 'recipe', Recipe, 'favorites_count'),
+    (ShoppingCart, 'recipe', Recipe, 'in_carts_count'),
+    (Recipe, 'author', User, 'recipes_count'),
+    (Subscribe, 'following', User, 'followers_count'),
+    (Subscribe, 'follower', User, 'following_count'),
+)
+
+# Вес события в рейтинге «в тренде» рецепта.
+TRENDING_WEIGHTS = {
+    Favorite: TRENDING_FAVORITE_WEIGHT,
+    ShoppingCart: TRENDING_CART_WEIGHT,
+}
+
+
+def change_counter(model, pk, field, delta, **extra):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta, 'updated_at': timezone.now(),
+                       **extra})
+    bump(recipe_key(pk) if model is Recipe else author_key(pk))
+
+
+def change_counters(sender, instance, delta):
+    for source, relation, target, field in COUNTERS:
+        if source is not sender:
+            continue
+        extra = {}
+        if sender in TRENDING_WEIGHTS:
+            weight = TRENDING_WEIGHTS[sender]
+            if delta > 0:
+                extra['trending_score'] = trending_change(weight)
+            else:
+                extra['trending_score'] = withdraw({
+                    instance.recipe_id: contribution(weight,
+                                                     instance.created_at)})
+        change_counter(target, getattr(instance, f'{relation}_id'),
+                       field, delta, **extra)
+
+
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, instance, 1)
+
+
+def decrement_counters(sender, instance, **kwargs):
+    change_counters(sender, instance, -1)
+
+
+for source in {counter[0] for counter in COUNTERS}:
+    post_save.connect(increment_counters, sender=source)
+    post_delete.connect(decrement_counters, sender=source)
+
+
+# модель: поле пользователя, чьи множества в recipes.user_state меняются
+USER_STATE_OWNERS = {
+    Favorite: 'user_id',
+    ShoppingCart: 'user_id',
+    Subscribe: 'follower_id',
+}
+
+
+def invalidate_user_states(sender, instance, created=True, **kwargs):
+    if created:
+        invalidate_user_state(getattr(instance, USER_STATE_OWNERS[sender]))
+
+
+for model in USER_STATE_OWNERS:
+    post_save.connect(invalidate_user_states, sender=model)
+    post_delete.connect(invalidate_user_states, sender=model)
+
+
+def cart_key(instance):
+    return instance.__dict__.get('user_id'), instance.__dict__.get('recipe_id')
+
+
+def change_cart_shopping_list(user_id, recipe_id, sign):
+    if user_id is not None and recipe_id is not None:
+        ShoppingListItem.objects.change_recipes(user_id, [recipe_id], sign)
+
+
+@receiver(post_init, sender=ShoppingCart)
+def remember_cart(sender, instance, **kwargs):
+    instance._stored_cart = cart_key(instance)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_to_shopping_list(sender, instance, created, **kwargs):
+    """Корзины из API, админки и ORM одинаково меняют список покупок."""
+    stored = (None, None) if created else instance._stored_cart
+    current = cart_key(instance)
+    if stored != current:
+        change_cart_shopping_list(*stored, -1)
+        change_cart_shopping_list(*current, 1)
+    instance._stored_cart = current
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_from_shopping_list(sender, instance, **kwargs):
+    change_cart_shopping_list(*cart_key(instance), -1)
+
+
+def recipe_ingredient_key(instance):
+    return tuple(instance.__dict__.get(field)
+                 for field in ('recipe_id', 'ingredient_id', 'amount'))
+
+
+def change_ingredient_shopping_lists(stored, current):
+    """Переносит замену строки ингредиента в списки покупок корзин."""
+    changes = defaultdict(lambda: ({}, {}))
+    for side, (recipe_id, ingredient_id, amount) in enumerate(
+            (stored, current)):
+        if recipe_id is not None and amount:
+            changes[recipe_id][side][ingredient_id] = amount
+    for recipe_id, (old_amounts, new_amounts) in changes.items():
+        ShoppingListItem.objects.change_recipe(recipe_id, old_amounts,
+                                               new_amounts)
+
+
+@receiver(post_init, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    instance._stored_amount = recipe_ingredient_key(instance)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def change_recipe_ingredient(sender, instance, created, **kwargs):
+    """Правка ингредиентов в админке доходит до списков покупок."""
+    stored = (None,) * 3 if created else instance._stored_amount
+    current = recipe_ingredient_key(instance)
+    if stored != current:
+        change_ingredient_shopping_lists(stored, current)
+    instance._stored_amount = current
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_recipe_ingredient(sender, instance, **kwargs):
+    # При удалении рецепта корзины и ингредиенты уходят каскадом в любом
+    # порядке: то, что удаляется вторым, вычитает уже пустую разницу.
+    change_ingredient_shopping_lists(recipe_ingredient_key(instance),
+                                     (None,) * 3)
+
+
+def trend_author(instance, delta):
+    """Подписка на автора поднимает в тренде все его рецепты.
+
+    Рецепты автора обновляет decay_trending, здесь событие только
+    записывается в журнал.
+    """
+    AuthorTrendEvent.objects.create(
+        author_id=instance.following_id,
+        weight=delta * TRENDING_SUBSCRIBE_WEIGHT)
+
+
+@receiver(post_save, sender=Subscribe)
+def trend_subscription(sender, instance, created, **kwargs):
+    if created:
+        trend_author(instance, 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def untrend_subscription(sender, instance, **kwargs):
+    trend_author(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump(LIST, recipe_key(instance.pk))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def bump_recipe_ingredients_version(sender, instance, **kwargs):
+    bump(LIST, recipe_key(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump(LIST, recipe_key(instance.pk))
+    elif pk_set:
+        bump(LIST, *map(recipe_key, pk_set))
+    else:
+        bump(GLOBAL)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_catalog_version(**kwargs):
+    bump(GLOBAL)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_author_version(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, которого нет в ответах.
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        bump(author_key(instance.pk))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    if instance.short_code:
+        transaction.on_commit(lambda: forget(instance.short_code))
+
+
+def search_fields(instance):
+    # Отложенные поля не читаются из базы ради сравнения.
+    return instance.__dict__.get('name'), instance.__dict__.get('text')
+
+
+@receiver(post_init, sender=Recipe)
+def remember_search_fields(sender, instance, **kwargs):
+    instance._stored_search = search_fields(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, created, **kwargs):
+    current = search_fields(instance)
+    if created or current != instance._stored_search:
+        update_index([instance.pk])
+    instance._stored_search = current
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    remove_from_index(instance.pk)
+    PantryChange.objects.log(instance.pk)
+
+
+def store_image_variants(sender, instance, field, widths, name, current):
+    variants = (name and build_variants(name, widths)) or {}
+    if variants == current:
+        return
+    setattr(instance, f'{field}_variants', variants)
+    sender.objects.filter(pk=instance.pk, **{field: name}).update(
+        **{f'{field}_variants': variants})
+
+
+def refresh_image_variants(sender, instance, **kwargs):
+    """Пересоздаёт копии после коммита, если картинка сменилась."""
+    for model, field, widths in IMAGE_FIELDS:
+        if model is not sender:
+            continue
+        name = getattr(instance, field).name or ''
+        current = getattr(instance, f'{field}_variants')
+        if current.get('source', '') == name:
+            return
+        transaction.on_commit(partial(
+            store_image_variants, sender, instance, field, widths, name,
+            current))
+
+
+for model, *_ in IMAGE_FIELDS:
+    post_save.connect(refresh_image_variants, sender=model)
+
+
+def image_fields(sender):
+    return [field for model, field, _ in IMAGE_FIELDS if model is sender]
+
+
+def remember_images(sender, instance, **kwargs):
+    for field in image_fields(sender):
+        setattr(instance, f'_stored_{field}', getattr(instance, field).name)
+
+
+def acquire_images(sender, instance, created, **kwargs):
+    """Переносит ссылку со старого файла на новый."""
+    for field in image_fields(sender):
+        name = getattr(instance, field).name or ''
+        stored = '' if created else getattr(instance, f'_stored_{field}', '')
+        if name != (stored or ''):
+            MediaBlob.objects.change(name, 1)
+            MediaBlob.objects.change(stored, -1)
+        setattr(instance, f'_stored_{field}', name)
+
+
+def release_images(sender, instance, **kwargs):
+    for field in image_fields(sender):
+        MediaBlob.objects.change(
+            getattr(instance, f'_stored_{field}', ''), -1)
+
+
+for model, *_ in IMAGE_FIELDS:
+    post_init.connect(remember_images, sender=model)
+    post_save.connect(acquire_images, sender=model)
+    post_delete.connect(release_images, sender=model)
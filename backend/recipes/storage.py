@@ -0,0 +1,51 @@
+import hashlib
+import os
+import posixpath
+import time
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def touch(storage, name):
+    """Продлевает жизнь файла, чтобы сборщик мусора его не удалил."""
+    now = time.time()
+    try:
+        os.utime(storage.path(name), (now, now))
+    except (FileNotFoundError, NotImplementedError):
+        pass
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Сохраняет файл под именем из SHA-256 его содержимого.
+
+    Имя имеет вид <каталог upload_to>/<ab>/<sha256><расширение>:
+    одинаковые загрузки получают один файл, а содержимое по URL никогда
+    не меняется. Кто ссылается на файл, учитывает MediaBlob.
+    """
+
+    def touch(self, name):
+        touch(self, name)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace(os.sep, '/'))
+        digest = digest.hexdigest()
+        name = posixpath.join(directory, digest[:2],
+                              digest + os.path.splitext(filename)[1].lower())
+        if self.exists(name):
+            self.touch(name)
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+content_storage = ContentAddressedStorage()
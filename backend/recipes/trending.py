@@ -0,0 +1,76 @@
+"""Рейтинг «в тренде» с экспоненциальным затуханием.
+
+Вклад события с весом w в момент t к моменту now равен
+w · 2^(-(now - t) / TRENDING_HALF_LIFE). Recipe.trending_score хранит
+натуральный логарифм суммы вкладов, приведённых к TRENDING_ORIGIN:
+ln Σ wᵢ · 2^((tᵢ - TRENDING_ORIGIN) / TRENDING_HALF_LIFE). При
+затухании все вклады делятся на один и тот же множитель, поэтому
+порядок рецептов по колонке со временем не меняется и индекс по ней
+остаётся верным без пересчёта. Событие меняет колонку одним UPDATE
+строки рецепта. Снятие отметки вычитает вклад, до которого её вес
+затух к текущему моменту (withdraw). Нулём отмечены рецепты без
+заметных событий; команда decay_trending обнуляет тех, чей вклад упал
+ниже TRENDING_MIN_SCORE.
+"""
+import math
+import time
+
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Exp, Ln
+
+from .constants import TRENDING_HALF_LIFE, TRENDING_MIN_SCORE, TRENDING_ORIGIN
+
+TRENDING_ORDERING = ('-trending_score', '-pub_date', 'id')
+
+
+def clock(now=None):
+    """Текущее время на шкале trending_score."""
+    now = time.time() if now is None else now
+    return (now - TRENDING_ORIGIN) * math.log(2) / TRENDING_HALF_LIFE
+
+
+def faded(now=None):
+    """Граница: ниже неё вклад рецепта меньше TRENDING_MIN_SCORE."""
+    return clock(now) + math.log(TRENDING_MIN_SCORE)
+
+
+def change(weight, now=None):
+    """Выражение для UPDATE: добавляет вклад weight, приведённый к now.
+
+    Отрицательный вес вычитается и не опускает рейтинг ниже нуля: если
+    после вычитания остаётся меньше TRENDING_MIN_SCORE, рецепт
+    возвращается к нулю.
+    """
+    moment = clock(now)
+    current = Exp(F('trending_score') - Value(moment))
+    if weight > 0:
+        return Case(
+            When(trending_score__gt=faded(now),
+                 then=Value(moment) + Ln(current + Value(weight))),
+            default=Value(moment + math.log(weight)),
+            output_field=FloatField())
+    return Case(
+        When(trending_score__gt=moment + math.log(TRENDING_MIN_SCORE - weight),
+             then=Value(moment) + Ln(current - Value(-weight))),
+        default=Value(0.0),
+        output_field=FloatField())
+
+
+def contribution(weight, moment, now=None):
+    """Вклад события с весом weight из момента moment к моменту now."""
+    now = time.time() if now is None else now
+    return weight * 2 ** ((moment.timestamp() - now) / TRENDING_HALF_LIFE)
+
+
+def withdraw(contributions, now=None):
+    """Выражение для UPDATE: снимает с рецептов вклады их отметок.
+
+    contributions — {id рецепта: вклад к now}. Вклад меньше
+    TRENDING_MIN_SCORE уже затух и не снимается.
+    """
+    return Case(
+        *(When(id=recipe_id, then=change(-weight, now))
+          for recipe_id, weight in contributions.items()
+          if weight >= TRENDING_MIN_SCORE),
+        default=F('trending_score'),
+        output_field=FloatField())
@@ -0,0 +1,75 @@
+"""Множества id рецептов и авторов пользователя в общем кеше Django.
+
+Общий для всех ответ со списком рецептов дополняется флагами
+is_favorited, is_in_shopping_cart и is_subscribed проверкой вхождения
+в эти множества. Множества не правятся на месте: любое изменение после
+коммита увеличивает версию пользователя, и следующее чтение собирает
+множества под новой версией из базы одним запросом. Так одновременные
+изменения одного пользователя не теряются, а запрос, прочитавший базу
+до изменения, кладёт данные под уже устаревшую версию.
+
+Версии и множества живут в общем кеше, поэтому при нескольких процессах
+CACHE_BACKEND должен быть общим (memcached, база): с locmem каждый
+процесс видит только свои изменения.
+"""
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value
+
+from .constants import USER_STATE_TIMEOUT
+from .versions import current, increment
+
+PREFIX = 'user-state:'
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+FOLLOWING = 'following'
+
+# вид множества: (модель, поле пользователя, поле id в множестве)
+SOURCES = {
+    FAVORITES: ('recipes.Favorite', 'user_id', 'recipe_id'),
+    SHOPPING_CART: ('recipes.ShoppingCart', 'user_id', 'recipe_id'),
+    FOLLOWING: ('users.Subscribe', 'follower_id', 'following_id'),
+}
+
+
+def version_key(user_id):
+    return f'{PREFIX}version:{user_id}'
+
+
+def state_key(kind, user_id, version):
+    return f'{PREFIX}{kind}:{user_id}:{version}'
+
+
+def load(user_id, kinds):
+    """Читает множества из базы одним UNION ALL."""
+    queries = []
+    for kind in kinds:
+        model, owner, target = SOURCES[kind]
+        queries.append(apps.get_model(model).objects.filter(
+            **{owner: user_id}
+        ).annotate(kind=Value(kind)).order_by().values_list(target, 'kind'))
+    state = {kind: set() for kind in kinds}
+    for object_id, kind in queries[0].union(*queries[1:], all=True):
+        state[kind].add(object_id)
+    return {kind: frozenset(ids) for kind, ids in state.items()}
+
+
+def get(user_id):
+    """Словарь {вид: frozenset id} по текущей версии пользователя."""
+    version = current([version_key(user_id)])[version_key(user_id)]
+    keys = {state_key(kind, user_id, version): kind for kind in SOURCES}
+    state = {keys[key]: ids for key, ids in cache.get_many(keys).items()}
+    missing = [kind for kind in SOURCES if kind not in state]
+    if missing:
+        loaded = load(user_id, missing)
+        state.update(loaded)
+        transaction.on_commit(lambda: cache.set_many({
+            state_key(kind, user_id, version): ids
+            for kind, ids in loaded.items()}, USER_STATE_TIMEOUT))
+    return state
+
+
+def invalidate(user_id):
+    """Сбрасывает множества пользователя после коммита."""
+    transaction.on_commit(lambda: increment([version_key(user_id)]))
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+from itertools import islice
+
+
+def batched(iterable, size):
+    """Списки по size элементов из итератора, последний может быть короче."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def returned_datetime(value):
+    """Время из RETURNING сырого SQL: SQLite отдаёт строку в UTC."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    return value
@@ -0,0 +1,68 @@
+"""Версии данных рецептов в общем кеше Django.
+
+Закешированный ответ помнит версии всего, из чего он собран, и
+считается верным, пока ни одна из них не изменилась. Версии меняются
+после коммита, чтобы параллельный запрос не положил в кеш данные,
+прочитанные до него.
+
+    global          теги, ингредиенты и массовые команды
+    list            состав и порядок списков рецептов
+    recipe:<id>     рецепт, его ингредиенты, теги и счётчики
+    author:<id>     профиль автора и его счётчики
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Бэкенды, чьи данные видит только свой процесс.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+PREFIX = 'recipe-version:'
+GLOBAL = PREFIX + 'global'
+LIST = PREFIX + 'list'
+
+
+def recipe_key(recipe_id):
+    return f'{PREFIX}recipe:{recipe_id}'
+
+
+def author_key(author_id):
+    return f'{PREFIX}author:{author_id}'
+
+
+def shared_cache():
+    """Версии, сменённые в одном процессе, видны остальным."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def current(keys):
+    """Словарь {ключ: версия}; отсутствующие версии заводятся заново.
+
+    Новая версия — время в наносекундах, поэтому версия, вытесненная
+    из кеша, не совпадёт со старой записью ответа.
+    """
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def increment(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(*keys):
+    """Меняет версии после коммита текущей транзакции."""
+    if keys:
+        transaction.on_commit(lambda: increment(keys))
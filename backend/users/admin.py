@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.db.models import Count
 
 from .models import Profile, Subscribe
 
@@ -8,19 +7,14 @@ from .models import Profile, Subscribe
 class ProfileAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Extra Fields', {'fields': ('avatar',)}),
+        ('Счётчики', {'fields': ('recipes_count', 'followers_count',
+                                 'following_count')}),
     )
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(
-            recipes_count=Count('recipe'),
-            subscribers_count=Count('following__follower')
-        )
-        return qs
+    readonly_fields = ('recipes_count', 'followers_count', 'following_count')
 
     list_display = UserAdmin.list_display + (
-        'recipes_count', 'subscribers_count')
+        'recipes_count', 'followers_count', 'following_count')
 
 
-admin.site.register(Profile, UserAdmin)
+admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Subscribe)
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['follower', 'following', 'id'], name='subscribe_follower_idx'),
+        ),
+    ]
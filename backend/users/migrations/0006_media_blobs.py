@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:40
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(default=None, storage=recipes.storage.ContentAddressedStorage(), upload_to='users/images/', verbose_name='Аватар'),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.db import models
 
 from .constants import (
     FIRST_NAME_LENGTH, LAST_NAME_LENGTH, EMAIL_LENGTH)
+from recipes.storage import content_storage
 
 
 class Profile(AbstractUser):
@@ -26,9 +27,32 @@ class Profile(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to='users/images/',
+        storage=content_storage,
         default=None,
         verbose_name="Аватар",
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии аватара'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок'
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     def clean(self):
         super().clean()
@@ -66,6 +90,10 @@ class Subscribe(models.Model):
         ordering = ['follower', 'following']
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            models.Index(fields=['follower', 'following', 'id'],
+                         name='subscribe_follower_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['following', 'follower'],